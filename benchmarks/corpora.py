@@ -0,0 +1,56 @@
+import os
+import re
+from typing import Dict, List, Tuple
+from wafsmith.lib.corpus import iter_file_content
+
+DATASET_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "test-dataset"
+)
+
+# Synthetic corpora, scaled up from the test datasets
+SCALES: Dict[str, int] = {"10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+
+
+def datasets(root: str = DATASET_DIR) -> List[Tuple[str, str]]:
+    """
+    datasets returns the (name, path) of the payload-dataset-N corpora under root, smallest first
+    """
+    found = [
+        (name, os.path.join(root, name))
+        for name in os.listdir(root)
+        if re.fullmatch(r"payload-dataset-\d+", name)
+    ]
+    return sorted(found, key=lambda item: int(item[0].rsplit("-", 1)[1]))
+
+
+def seed_payloads(root: str = DATASET_DIR) -> List[str]:
+    """
+    seed_payloads returns the distinct payloads of all the test datasets
+    """
+    seen = {}
+    for _, path in datasets(root):
+        for payload in iter_file_content(path):
+            if payload:
+                seen.setdefault(payload, None)
+    return list(seen)
+
+
+def synthesize(path: str, count: int, seed: List[str]) -> str:
+    """Write a corpus of count payloads cycling through seed.
+
+    Every payload gets a distinct numeric suffix so that deduplication and
+    caching cannot shortcut the run, while the suffix leaves the verdict of
+    the rule unchanged.
+
+    Args:
+        path: File to write
+        count: Number of payloads
+        seed: Payloads to cycle through
+
+    Returns:
+        path
+    """
+    with open(path, "w") as f:
+        for i in range(count):
+            f.write(f"{seed[i % len(seed)]} {i}\n")
+    return path
@@ -0,0 +1,228 @@
+import os
+import sys
+import json
+import time
+import logging
+import platform
+import resource
+import tempfile
+import click
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from typing import Dict, List
+from wafsmith.cmd.evaluate import calculate_results
+from wafsmith.lib.corpus import Corpus
+from wafsmith.lib.latency import LatencyRecorder
+from wafsmith.lib.payload import Engine, Location, process_payloads_in_parallel
+from benchmarks.corpora import SCALES, datasets, seed_payloads, synthesize
+from benchmarks.stub_waf import StubWAF
+
+logger = logging.getLogger("benchmark")
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+# Metrics compared against the baseline, and whether higher is better
+METRICS: Dict[str, bool] = {
+    "throughput": True,
+    "load_throughput": True,
+    "p99_ms": False,
+    "aggregate_seconds": False,
+    "peak_rss_mb": False,
+}
+
+# Timings of smaller corpora are dominated by start-up noise, only their
+# memory is compared
+MIN_TIMED_PAYLOADS = 1000
+
+ENGINES = {"thread": Engine.THREAD, "async": Engine.ASYNC}
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def run_case(
+    path: str, url: str, engine: str, threads: int, concurrency: int
+) -> Dict[str, float]:
+    """Measure one corpus going through the loader, the sender and the result aggregation.
+
+    Runs in a fresh process so that the peak memory is the case's own.
+
+    Args:
+        path: Corpus file or directory
+        url: Endpoint of the (stub) WAF
+        engine: Sending engine, thread or async
+        threads: Number of threads (thread engine)
+        concurrency: Maximum number of in-flight requests (async engine)
+
+    Returns:
+        Metrics of the case
+    """
+    logging.getLogger().setLevel(logging.INFO)
+    corpus = Corpus(path)
+
+    start = time.perf_counter()
+    count = sum(1 for _ in corpus)
+    load_seconds = time.perf_counter() - start
+
+    latency = LatencyRecorder()
+    start = time.perf_counter()
+    results = process_payloads_in_parallel(
+        corpus,
+        "GET",
+        url,
+        Location.URL_PARAMETERS,
+        threads,
+        engine=ENGINES[engine],
+        concurrency=concurrency,
+        on_result=latency.record,
+    )
+    send_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    calculate_results(results)
+    evaded = results.count(200)
+    aggregate_seconds = time.perf_counter() - start
+
+    total = latency.overall.histograms["total"]
+    return {
+        "payloads": count,
+        "blocked": results.count(403),
+        "evaded": evaded,
+        "errors": len(results) - results.count(403) - results.count(200),
+        "seconds": round(send_seconds, 3),
+        "throughput": round(count / send_seconds, 1) if send_seconds else 0.0,
+        "load_throughput": round(count / load_seconds, 1) if load_seconds else 0.0,
+        "p50_ms": round(total.percentile(50) * 1000, 3),
+        "p99_ms": round(total.percentile(99) * 1000, 3),
+        "max_ms": round(total.max / 1000, 3),
+        "aggregate_seconds": round(aggregate_seconds, 4),
+        "peak_rss_mb": round(_peak_rss_mb(), 1),
+    }
+
+
+def compare(
+    baseline: Dict[str, Dict[str, float]],
+    current: Dict[str, Dict[str, float]],
+    tolerance: float,
+) -> List[str]:
+    """
+    compare returns the metrics of current that regressed by more than tolerance (a fraction) from baseline
+    """
+    regressions = []
+    for name, metrics in current.items():
+        reference = baseline.get(name)
+        if reference is None:
+            continue
+        for metric, higher_is_better in METRICS.items():
+            if metric != "peak_rss_mb" and reference.get("payloads", 0) < MIN_TIMED_PAYLOADS:
+                continue
+            before, after = reference.get(metric), metrics.get(metric)
+            if not before or after is None:
+                continue
+            change = (after - before) / before
+            if (-change if higher_is_better else change) > tolerance:
+                regressions.append(
+                    f"{name} {metric}: {before} -> {after} ({change * 100:+.1f}%)"
+                )
+    return regressions
+
+
+def environment() -> Dict[str, str]:
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": str(os.cpu_count()),
+    }
+
+
+@click.command()
+@click.option(
+    "--scale",
+    "scales",
+    multiple=True,
+    type=click.Choice(list(SCALES)),
+    default=["10k", "100k"],
+    show_default=True,
+    help="Synthetic corpus sizes to run, repeatable",
+)
+@click.option(
+    "--engine",
+    "engines",
+    multiple=True,
+    type=click.Choice(list(ENGINES)),
+    default=list(ENGINES),
+    show_default=True,
+    help="Sending engines to run, repeatable",
+)
+@click.option("--datasets/--no-datasets", "with_datasets", default=True, help="Run the data/test-dataset corpora")
+@click.option("--threads", default=10, type=int, show_default=True, help="Number of threads (thread engine)")
+@click.option("--concurrency", default=10, type=int, show_default=True, help="In-flight requests (async engine)")
+@click.option("--latency-ms", default=0.0, type=float, help="Artificial latency of the stub WAF")
+@click.option("--target", default=None, help="Benchmark against this URL instead of the stub WAF")
+@click.option("--output", default=None, help="Write the results as JSON to this file")
+@click.option("--baseline", default=BASELINE_PATH, show_default=True, help="Baseline to compare against")
+@click.option("--tolerance", default=0.25, type=float, show_default=True, help="Allowed regression, as a fraction")
+def main(scales, engines, with_datasets, threads, concurrency, latency_ms, target, output, baseline, tolerance):
+    """Benchmark the evaluate pipeline against a local stub WAF."""
+    # wafsmith.lib.console logs everything down to DEBUG by default
+    logging.getLogger().setLevel(logging.INFO)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        corpora = datasets() if with_datasets else []
+        seed = seed_payloads()
+        for scale in scales:
+            path = os.path.join(workdir, f"synthetic-{scale}.txt")
+            corpora.append((f"synthetic-{scale}", synthesize(path, SCALES[scale], seed)))
+
+        waf = StubWAF(latency=latency_ms / 1000) if target is None else None
+        url = target or waf.start().url
+        cases: Dict[str, Dict[str, float]] = {}
+        try:
+            for name, path in corpora:
+                for engine in engines:
+                    # A process per case, so that peak memory does not carry over
+                    with ProcessPoolExecutor(1, mp_context=get_context("spawn")) as executor:
+                        metrics = executor.submit(
+                            run_case, path, url, engine, threads, concurrency
+                        ).result()
+                    cases[f"{name}/{engine}"] = metrics
+                    logger.info(
+                        f"{name}/{engine}: {metrics['payloads']} payload(s) "
+                        f"{metrics['throughput']:.0f} req/s, "
+                        f"p99 {metrics['p99_ms']:.2f}ms, "
+                        f"peak {metrics['peak_rss_mb']:.0f}MB"
+                    )
+        finally:
+            if waf is not None:
+                waf.stop()
+
+    report = {
+        "environment": environment(),
+        "settings": {
+            "threads": threads,
+            "concurrency": concurrency,
+            "latency_ms": latency_ms,
+        },
+        "cases": cases,
+    }
+    if output:
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+        logger.info(f"Results written to {output}")
+
+    if baseline and os.path.exists(baseline) and os.path.abspath(baseline) != os.path.abspath(output or ""):
+        with open(baseline, "r") as f:
+            regressions = compare(json.load(f)["cases"], cases, tolerance)
+        for regression in regressions:
+            logger.error(f"Regression: {regression}")
+        if regressions:
+            sys.exit(1)
+        logger.info(f"No regression beyond {tolerance * 100:.0f}% of {baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+import re
+import time
+import logging
+import threading
+import click
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import parse_qs, unquote_plus, urlparse
+
+logger = logging.getLogger("stub_waf")
+
+# A handful of classic attack patterns standing in for the CRS; any payload
+# matching is blocked with 403, everything else is let through with 200
+RULE = re.compile(
+    r"(?i)(<\s*script|javascript:|onerror\s*=|union\s+(all\s+)?select|"
+    r"\bor\b\s+\d+\s*=\s*\d+|sleep\s*\(|\.\./|/etc/passwd|;\s*(cat|ls|id|whoami)\b)"
+)
+
+
+class StubWAFHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def _payload(self) -> str:
+        query = parse_qs(urlparse(self.path).query).get("payload", [""])[0]
+        header = self.headers.get("x-payload", "")
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length).decode("utf-8", "replace") if length else ""
+        return query + header + unquote_plus(body)
+
+    def _respond(self):
+        status = 403 if RULE.search(self._payload()) else 200
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        self.send_response(status)
+        self.send_header("Content-Length", "0")
+        if self.headers.get("Connection", "").lower() == "close":
+            self.send_header("Connection", "close")
+        self.end_headers()
+        self.server.requests += 1
+
+    do_GET = _respond
+    do_POST = _respond
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _Server(ThreadingHTTPServer):
+    # socketserver's default backlog of 5 drops connections under concurrency
+    request_queue_size = 1024
+    daemon_threads = True
+
+
+class StubWAF:
+    """Local HTTP server answering like a WAF in front of the web application.
+
+    Args:
+        host: Interface to listen on
+        port: Port to listen on, 0 picks a free one
+        latency: Artificial processing time added to every request, in seconds
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0):
+        self.server = _Server((host, port), StubWAFHandler)
+        self.server.latency = latency
+        self.server.requests = 0
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    @property
+    def requests(self) -> int:
+        return self.server.requests
+
+    def start(self) -> "StubWAF":
+        self._thread = threading.Thread(
+            target=self.server.serve_forever, args=(0.05,), daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self) -> "StubWAF":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+@click.command()
+@click.option("--host", default="127.0.0.1", help="Interface to listen on")
+@click.option("--port", default=8080, type=int, help="Port to listen on")
+@click.option(
+    "--latency-ms", default=0.0, type=float, help="Artificial latency added to every request"
+)
+def main(host, port, latency_ms):
+    """Serve the stub WAF until interrupted, e.g. as the --host of `evaluate`."""
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    waf = StubWAF(host, port, latency_ms / 1000)
+    logger.info(f"Stub WAF listening on {waf.url}")
+    try:
+        waf.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        waf.server.server_close()
+
+
+if __name__ == "__main__":
+    main()
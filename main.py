@@ -1,5 +1,12 @@
 import click
+import wafsmith.cmd.aggregate
+import wafsmith.cmd.cluster
+import wafsmith.cmd.create
+import wafsmith.cmd.env
 import wafsmith.cmd.evaluate
+import wafsmith.cmd.extract
+import wafsmith.cmd.profile
+import wafsmith.cmd.worker
 
 
 @click.group()
@@ -36,17 +43,812 @@ def cli():
     default="GET",
     help="Specify the HTTP method for the payload. Default is GET.",
 )
+@click.option(
+    "--encoding",
+    type=click.Choice(["form", "json", "xml"]),
+    default="form",
+    help="Specify the encoding of the request body when the payload is in http_body. Default is form",
+)
+@click.option(
+    "--matrix",
+    multiple=True,
+    help="Evaluate every payload in several METHOD:position[:encoding] combinations in one run instead of --method / --position / --encoding, e.g. --matrix GET:url_parameters --matrix POST:http_body:json. Repeatable or comma-separated, 'all' covers every position and body encoding",
+)
 @click.option(
     "--threads",
     default=10,
     help="Specify the number of threads to be used during the rule generation process. Default is 10",
 )
-def evaluate(payloads, evaded, setup, traffic, position, method, threads):
+@click.option(
+    "--engine",
+    default="thread",
+    type=click.Choice(["thread", "async"]),
+    help="Specify the engine used to send the payloads. Default is thread",
+)
+@click.option(
+    "--concurrency",
+    default=100,
+    help="Specify the maximum number of in-flight requests for the async engine. Default is 100",
+)
+@click.option(
+    "--pool-size",
+    default=None,
+    type=int,
+    help="Specify the number of keep-alive connections to pool. Default matches --threads / --concurrency",
+)
+@click.option(
+    "--timeout",
+    default=30.0,
+    help="Specify the per-request timeout in seconds. Default is 30",
+)
+@click.option(
+    "--keep-alive/--no-keep-alive",
+    default=True,
+    help="Reuse connections across payloads. Default is enabled",
+)
+@click.option(
+    "--batch-size",
+    default=1000,
+    help="Specify the number of payloads read ahead of the requests in flight. Default is 1000",
+)
+@click.option(
+    "--results",
+    default=None,
+    help="Specify an output file recording every result as JSONL (payload, status, latency)",
+)
+@click.option(
+    "--index",
+    default=None,
+    help="Specify an output file indexing the hashes of completed payloads",
+)
+@click.option(
+    "--resume",
+    is_flag=True,
+    default=False,
+    help="Skip the payloads already recorded in --index by an interrupted run",
+)
+@click.option(
+    "--checkpoint-interval",
+    default=1.0,
+    help="Specify how often in seconds completed payloads are checkpointed to --index. Default is 1",
+)
+@click.option(
+    "--cache",
+    default=None,
+    help="Specify a verdict cache file; payloads already tested against the same ruleset are not resent",
+)
+@click.option(
+    "--cache-size",
+    default=1_000_000,
+    help="Specify the maximum number of verdicts kept in the cache. Default is 1000000",
+)
+@click.option(
+    "--delta",
+    is_flag=True,
+    default=False,
+    help="Only retest the payloads that the rules changed since the last run recorded in --cache could match, reusing its verdicts for the others",
+)
+@click.option(
+    "--traffic-first",
+    is_flag=True,
+    default=False,
+    help="Test the business traffic before the attack payloads, so that a ruleset blocking legitimate requests is rejected before the attack run",
+)
+@click.option(
+    "--max-false-positives",
+    type=int,
+    default=0,
+    help="Stop the evaluation once this many business traffic payloads are blocked, skipping the attack payloads with --traffic-first. Default is 0 (never stop)",
+)
+@click.option(
+    "--attribution",
+    default=None,
+    help="Specify a JSONL file receiving every result annotated with the rule ids it matched and its anomaly score, read from the ModSecurity audit log",
+)
+@click.option(
+    "--audit-log",
+    default=None,
+    help="Specify the ModSecurity audit log to attribute results from. Default is modsecurity/tmp/modsec_audit.log under --setup when --attribution is given",
+)
+@click.option(
+    "--dedup/--no-dedup",
+    default=True,
+    help="Send each unique payload once and drop blank lines. Default is enabled",
+)
+@click.option(
+    "--normalize",
+    is_flag=True,
+    default=False,
+    help="Group payloads that only differ by URL-encoding or case when deduplicating",
+)
+@click.option(
+    "--dedup-on-disk",
+    is_flag=True,
+    default=False,
+    help="Keep the deduplication index on disk for corpora that do not fit in memory",
+)
+@click.option(
+    "--host",
+    default="http://localhost/",
+    help="Specify the WAF endpoint receiving the payloads. Default is http://localhost/",
+)
+@click.option(
+    "--attach",
+    is_flag=True,
+    default=False,
+    help="Reuse a running testing environment and keep it running afterwards, rules are hot-reloaded when changed",
+)
+@click.option(
+    "--ready-timeout",
+    default=60.0,
+    help="Specify the number of seconds to wait for the WAF to become ready. Default is 60",
+)
+@click.option(
+    "--replicas",
+    default=1,
+    help="Specify the number of WAF containers sharing the load. Default is 1",
+)
+@click.option(
+    "--replica-base-port",
+    default=8081,
+    help="Specify the host port of the second WAF replica, the following ones use the next ports. Default is 8081",
+)
+@click.option(
+    "--balance",
+    type=click.Choice(["round-robin", "least-loaded"]),
+    default="round-robin",
+    help="Specify how payloads are spread across the WAF replicas. Default is round-robin",
+)
+@click.option(
+    "--mode",
+    type=click.Choice(["online", "offline", "hybrid"]),
+    default="online",
+    help="Specify how verdicts are obtained: online sends every payload to the WAF, offline only evaluates the parsed rules in-process, hybrid only sends the payloads the parsed rules do not block. Default is online",
+)
+@click.option(
+    "--direct",
+    is_flag=False,
+    flag_value="http://localhost:3000/",
+    default=None,
+    help="Also send the payloads straight to the web application (http://localhost:3000/ unless a URL is given) and report the latency the WAF adds",
+)
+@click.option(
+    "--adaptive/--no-adaptive",
+    default=True,
+    help="Adapt the number of requests in flight (up to --threads / --concurrency) to what the WAF sustains, backing off when requests time out or are dropped. Default is enabled",
+)
+@click.option(
+    "--retries",
+    type=int,
+    default=3,
+    help="Specify how many times a request that timed out, failed to connect or got a 429/502/503/504 is retried, with jittered exponential backoff. Default is 3",
+)
+@click.option(
+    "--prepare-workers",
+    type=int,
+    default=0,
+    help="Specify the number of worker processes serializing the requests ahead of sending, worth it for JSON / XML bodies. Default is 0 (prepared inline by batch)",
+)
+@click.option(
+    "--coordinator",
+    default=None,
+    help="Listen on [host:]port for `wafsmith worker` processes and have them send the payloads through their own testing environments instead of deploying one here, e.g. --coordinator 0.0.0.0:8700",
+)
+@click.option(
+    "--lease-timeout",
+    default=120.0,
+    help="Specify the number of seconds a worker has to report a shard before it is handed to another worker. Default is 120",
+)
+@click.option(
+    "--coordinator-token",
+    default=None,
+    envvar="WAFSMITH_COORDINATOR_TOKEN",
+    help="Specify a secret the workers must present to the coordinator, required when listening on a network interface. Default is $WAFSMITH_COORDINATOR_TOKEN",
+)
+def evaluate(
+    payloads,
+    evaded,
+    setup,
+    traffic,
+    position,
+    method,
+    threads,
+    engine,
+    concurrency,
+    pool_size,
+    timeout,
+    keep_alive,
+    batch_size,
+    results,
+    index,
+    resume,
+    checkpoint_interval,
+    cache,
+    cache_size,
+    delta,
+    traffic_first,
+    max_false_positives,
+    attribution,
+    audit_log,
+    dedup,
+    normalize,
+    dedup_on_disk,
+    host,
+    attach,
+    ready_timeout,
+    replicas,
+    replica_base_port,
+    balance,
+    mode,
+    direct,
+    adaptive,
+    retries,
+    prepare_workers,
+    encoding,
+    matrix,
+    coordinator,
+    lease_timeout,
+    coordinator_token,
+):
     wafsmith.cmd.evaluate.run(
-        payloads, evaded, setup, traffic, position, method, threads
+        payloads,
+        evaded,
+        setup,
+        traffic,
+        position,
+        method,
+        threads,
+        engine=engine,
+        concurrency=concurrency,
+        pool_size=pool_size,
+        timeout=timeout,
+        keep_alive=keep_alive,
+        batch_size=batch_size,
+        results_file=results,
+        index_file=index,
+        resume=resume,
+        checkpoint_interval=checkpoint_interval,
+        cache_file=cache,
+        cache_size=cache_size,
+        delta=delta,
+        traffic_first=traffic_first,
+        max_false_positives=max_false_positives,
+        attribution_file=attribution,
+        audit_log=audit_log,
+        dedup=dedup,
+        normalize=normalize,
+        dedup_on_disk=dedup_on_disk,
+        host=host,
+        attach=attach,
+        ready_timeout=ready_timeout,
+        replicas=replicas,
+        replica_base_port=replica_base_port,
+        balance=balance,
+        mode=mode,
+        direct=direct,
+        adaptive=adaptive,
+        retries=retries,
+        prepare_workers=prepare_workers,
+        encoding=encoding,
+        matrix=matrix,
+        coordinator=coordinator,
+        lease_timeout=lease_timeout,
+        coordinator_token=coordinator_token,
+    )
+    pass
+
+
+def llm_options(command):
+    """
+    llm_options adds the options of the model client shared by the LLM workflows
+    """
+    options = [
+        click.option(
+            "--api-key",
+            default=None,
+            envvar="OPENAI_API_KEY",
+            help="OpenAI API Key",
+        ),
+        click.option(
+            "--base-url",
+            default=None,
+            help="OpenAI SDK Endpoint. Default is https://api.openai.com/v1",
+        ),
+        click.option("--model", default=None, help="OpenAI Model"),
+        click.option(
+            "--requests-per-minute",
+            type=float,
+            default=None,
+            help="Specify the maximum number of model calls per minute. Default is unlimited",
+        ),
+        click.option(
+            "--llm-cache/--no-llm-cache",
+            default=True,
+            help="Reuse the answers of the model to payloads already asked about. Default is enabled",
+        ),
+        click.option(
+            "--llm-cache-file",
+            default=None,
+            help="Specify the answer cache file. Default is llm.db under ~/.cache/wafsmith",
+        ),
+    ]
+    for option in reversed(options):
+        command = option(command)
+    return command
+
+
+@cli.command()
+@click.option(
+    "--input",
+    "input_path",
+    required=True,
+    help="Input directory / file containing the Nginx access logs, e.g. ./infra/nginx/logs",
+)
+@click.option(
+    "--output",
+    required=True,
+    help="Specify the output file for the extracted payload(s)",
+)
+@llm_options
+@click.option(
+    "--threads",
+    default=10,
+    help="Specify the number of concurrent model calls. Default is 10",
+)
+@click.option(
+    "--batch-size",
+    default=10,
+    help="Specify the number of log entries classified per model call. Default is 10",
+)
+@click.option(
+    "--workers",
+    default=0,
+    help="Specify the number of processes parsing the logs. Default is 0 (parse in-process)",
+)
+@click.option(
+    "--chunk-size",
+    default=64 * 1024 * 1024,
+    help="Specify the size in bytes of the log ranges parsed by each process. Default is 67108864 (64 MiB)",
+)
+def extract(
+    input_path,
+    output,
+    api_key,
+    base_url,
+    model,
+    requests_per_minute,
+    llm_cache,
+    llm_cache_file,
+    threads,
+    batch_size,
+    workers,
+    chunk_size,
+):
+    """Without --api-key, the candidate payloads found by the heuristics are written as is."""
+    wafsmith.cmd.extract.run(
+        input_path,
+        output,
+        api_key=api_key,
+        base_url=base_url,
+        model=model,
+        threads=threads,
+        batch_size=batch_size,
+        requests_per_minute=requests_per_minute,
+        llm_cache=llm_cache,
+        llm_cache_path=llm_cache_file,
+        workers=workers,
+        chunk_size=chunk_size,
+    )
+
+
+@cli.command()
+@click.option(
+    "--payloads",
+    required=True,
+    help="Input file containing the evaded payloads",
+)
+@click.option(
+    "--output",
+    required=True,
+    help="Specify the output file for the newly generated rule(s)",
+)
+@click.option(
+    "--method",
+    default="GET",
+    help="Specify the HTTP method the payloads were sent with. Default is GET",
+)
+@click.option(
+    "--position",
+    default="url_parameters",
+    help="Specify the postion of the payloads in the HTTP request. Default is url_parameters",
+)
+@llm_options
+@click.option(
+    "--threads",
+    default=10,
+    help="Specify the number of concurrent model calls. Default is 10",
+)
+@click.option(
+    "--batch-size",
+    default=10,
+    help="Specify the number of payloads per model call. Default is 10",
+)
+@click.option(
+    "--cluster",
+    is_flag=True,
+    help="Create the rules of one representative per cluster of near-identical payloads",
+)
+@click.option(
+    "--similarity",
+    default=0.5,
+    help="Specify the estimated n-gram similarity joining two payloads in a cluster. Default is 0.5",
+)
+def create(
+    payloads,
+    output,
+    method,
+    position,
+    api_key,
+    base_url,
+    model,
+    requests_per_minute,
+    llm_cache,
+    llm_cache_file,
+    threads,
+    batch_size,
+    cluster,
+    similarity,
+):
+    wafsmith.cmd.create.run(
+        payloads,
+        output,
+        method=method,
+        position=position,
+        api_key=api_key,
+        base_url=base_url,
+        model=model,
+        threads=threads,
+        batch_size=batch_size,
+        requests_per_minute=requests_per_minute,
+        llm_cache=llm_cache,
+        llm_cache_path=llm_cache_file,
+        cluster=cluster,
+        similarity=similarity,
+    )
+
+
+@cli.command()
+@click.option(
+    "--payloads",
+    required=True,
+    help="Input directory / file containing the payloads, e.g. the evaded payloads of evaluate",
+)
+@click.option(
+    "--output",
+    required=True,
+    help="Specify the output file for one representative payload per cluster",
+)
+@click.option(
+    "--members",
+    default=None,
+    help="Specify the JSONL output file for the representative, size and members of every cluster",
+)
+@click.option(
+    "--similarity",
+    default=0.5,
+    help="Specify the estimated n-gram similarity joining two payloads in a cluster. Default is 0.5",
+)
+@click.option(
+    "--num-perm",
+    default=64,
+    help="Specify the number of MinHash functions per payload. Default is 64",
+)
+@click.option(
+    "--ngram",
+    default=3,
+    help="Specify the length of the character n-grams compared. Default is 3",
+)
+def cluster(payloads, output, members, similarity, num_perm, ngram):
+    """Group near-identical payloads, so that rules are created per family rather than per variant."""
+    wafsmith.cmd.cluster.run(
+        payloads,
+        output,
+        members_file=members,
+        similarity=similarity,
+        num_perm=num_perm,
+        ngram=ngram,
+    )
+
+
+@cli.command()
+@click.option(
+    "--rules",
+    required=True,
+    help="Input file containing the ModSecurity rules to aggregate",
+)
+@click.option(
+    "--output",
+    required=True,
+    help="Specify the output file for the aggregated rule(s)",
+)
+@click.option(
+    "--traffic",
+    default=None,
+    help="Specify directory / file containing business traffic the aggregated rules must not catch",
+)
+@llm_options
+def aggregate(
+    rules,
+    output,
+    traffic,
+    api_key,
+    base_url,
+    model,
+    requests_per_minute,
+    llm_cache,
+    llm_cache_file,
+):
+    wafsmith.cmd.aggregate.run(
+        rules,
+        output,
+        traffic_path=traffic,
+        api_key=api_key,
+        base_url=base_url,
+        model=model,
+        requests_per_minute=requests_per_minute,
+        llm_cache=llm_cache,
+        llm_cache_path=llm_cache_file,
+    )
+
+
+@cli.command("profile-rules")
+@click.option(
+    "--rules",
+    required=True,
+    help="Input directory / file containing the ModSecurity rules to profile",
+)
+@click.option(
+    "--payloads",
+    default="./payloads/",
+    help="Specify directory / file containing the attack payloads the rules are timed against. Default is ./payloads/",
+)
+@click.option(
+    "--traffic",
+    default=None,
+    help="Specify directory / file containing business traffic the rules are timed against",
+)
+@click.option(
+    "--report",
+    default=None,
+    help="Specify the JSONL output file for the profile of every rule",
+)
+@click.option(
+    "--timeout",
+    default=5.0,
+    help="Specify the seconds a single match may take before the rule is deemed catastrophic. Default is 5",
+)
+@click.option(
+    "--top",
+    default=20,
+    help="Specify the number of most expensive rules logged, 0 for all. Default is 20",
+)
+def profile_rules(rules, payloads, traffic, report, timeout, top):
+    """Rank the @rx rules by CPU cost and detect catastrophic backtracking (ReDoS)."""
+    wafsmith.cmd.profile.run(
+        rules,
+        payloads,
+        traffic_payloads_dir=traffic,
+        report_file=report,
+        timeout=timeout,
+        top=top,
+    )
+
+
+@cli.command()
+@click.option(
+    "--coordinator",
+    required=True,
+    help="Specify the URL of the coordinator started by `wafsmith evaluate --coordinator`, e.g. http://10.0.0.1:8700/",
+)
+@click.option(
+    "--setup",
+    default="./infra/",
+    help="Specify the directory which contains the docker compose enviornment setup. Default is ./infra/",
+)
+@click.option(
+    "--host",
+    default="http://localhost/",
+    help="Specify the WAF endpoint of this worker. Default is http://localhost/",
+)
+@click.option(
+    "--deploy/--no-deploy",
+    default=True,
+    help="Deploy the testing environment of --setup, or send to a WAF already serving --host. Default is enabled",
+)
+@click.option(
+    "--attach",
+    is_flag=True,
+    default=False,
+    help="Reuse a running testing environment and keep it running afterwards",
+)
+@click.option(
+    "--ready-timeout",
+    default=60.0,
+    help="Specify the number of seconds to wait for the WAF to become ready. Default is 60",
+)
+@click.option(
+    "--replicas",
+    default=1,
+    help="Specify the number of WAF containers sharing the load. Default is 1",
+)
+@click.option(
+    "--replica-base-port",
+    default=8081,
+    help="Specify the host port of the second WAF replica, the following ones use the next ports. Default is 8081",
+)
+@click.option(
+    "--balance",
+    type=click.Choice(["round-robin", "least-loaded"]),
+    default="round-robin",
+    help="Specify how payloads are spread across the WAF replicas. Default is round-robin",
+)
+@click.option(
+    "--threads",
+    default=10,
+    help="Specify the number of threads sending the payloads. Default is 10",
+)
+@click.option(
+    "--engine",
+    default="thread",
+    type=click.Choice(["thread", "async"]),
+    help="Specify the engine used to send the payloads. Default is thread",
+)
+@click.option(
+    "--concurrency",
+    default=100,
+    help="Specify the maximum number of in-flight requests for the async engine. Default is 100",
+)
+@click.option(
+    "--pool-size",
+    default=None,
+    type=int,
+    help="Specify the number of keep-alive connections to pool. Default matches --threads / --concurrency",
+)
+@click.option(
+    "--timeout",
+    default=30.0,
+    help="Specify the per-request timeout in seconds. Default is 30",
+)
+@click.option(
+    "--keep-alive/--no-keep-alive",
+    default=True,
+    help="Reuse connections across payloads. Default is enabled",
+)
+@click.option(
+    "--adaptive/--no-adaptive",
+    default=True,
+    help="Adapt the number of requests in flight to what the WAF sustains. Default is enabled",
+)
+@click.option(
+    "--retries",
+    type=int,
+    default=3,
+    help="Specify how many times a dropped request is retried. Default is 3",
+)
+@click.option(
+    "--name",
+    default=None,
+    help="Specify the name reported to the coordinator. Default is the hostname and process id",
+)
+@click.option(
+    "--token",
+    default=None,
+    envvar="WAFSMITH_COORDINATOR_TOKEN",
+    help="Specify the secret the coordinator was started with. Default is $WAFSMITH_COORDINATOR_TOKEN",
+)
+def worker(
+    coordinator,
+    setup,
+    host,
+    deploy,
+    attach,
+    ready_timeout,
+    replicas,
+    replica_base_port,
+    balance,
+    threads,
+    engine,
+    concurrency,
+    pool_size,
+    timeout,
+    keep_alive,
+    adaptive,
+    retries,
+    name,
+    token,
+):
+    wafsmith.cmd.worker.run(
+        coordinator,
+        setup,
+        host=host,
+        deploy=deploy,
+        attach=attach,
+        ready_timeout=ready_timeout,
+        replicas=replicas,
+        replica_base_port=replica_base_port,
+        balance=balance,
+        threads=threads,
+        engine=engine,
+        concurrency=concurrency,
+        pool_size=pool_size,
+        timeout=timeout,
+        keep_alive=keep_alive,
+        adaptive=adaptive,
+        retries=retries,
+        name=name,
+        token=token,
     )
+
+
+@cli.group()
+def env():
     pass
 
 
+@env.command()
+@click.option(
+    "--setup",
+    required=True,
+    help="Specify the directory which contains the docker compose enviornment setup",
+)
+@click.option(
+    "--host",
+    default="http://localhost/",
+    help="Specify the WAF endpoint probed for readiness. Default is http://localhost/",
+)
+@click.option(
+    "--ready-timeout",
+    default=60.0,
+    help="Specify the number of seconds to wait for the WAF to become ready. Default is 60",
+)
+@click.option(
+    "--replicas",
+    default=1,
+    help="Specify the number of WAF containers sharing the load. Default is 1",
+)
+@click.option(
+    "--replica-base-port",
+    default=8081,
+    help="Specify the host port of the second WAF replica, the following ones use the next ports. Default is 8081",
+)
+def up(setup, host, ready_timeout, replicas, replica_base_port):
+    wafsmith.cmd.env.up(setup, host, ready_timeout, replicas, replica_base_port)
+
+
+@env.command()
+@click.option(
+    "--setup",
+    required=True,
+    help="Specify the directory which contains the docker compose enviornment setup",
+)
+@click.option(
+    "--replicas",
+    default=1,
+    help="Specify the number of WAF containers sharing the load. Default is 1",
+)
+def reload(setup, replicas):
+    wafsmith.cmd.env.reload(setup, replicas)
+
+
+@env.command()
+@click.option(
+    "--setup",
+    required=True,
+    help="Specify the directory which contains the docker compose enviornment setup",
+)
+def down(setup):
+    wafsmith.cmd.env.down(setup)
+
+
 if __name__ == "__main__":
     cli()
@@ -0,0 +1,130 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import pytest
+
+
+class StubWAFHandler(BaseHTTPRequestHandler):
+    """Blocks any request whose payload contains "attack", like a one-rule WAF."""
+
+    protocol_version = "HTTP/1.1"
+
+    def _payload(self) -> str:
+        query = parse_qs(urlparse(self.path).query).get("payload", [""])[0]
+        header = self.headers.get("x-payload", "")
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length).decode("utf-8", "replace") if length else ""
+        return query + header + body
+
+    def _respond(self):
+        payload = self._payload()
+        self.server.payloads.append(payload)
+        status = 403 if "attack" in payload else 200
+        if getattr(self.server, "audit_log", None) is not None:
+            self._audit(status, "attack" in payload)
+        self.send_response(status)
+        self.send_header("Content-Length", "0")
+        if self.headers.get("Connection", "").lower() == "close":
+            self.send_header("Connection", "close")
+        self.end_headers()
+
+    def _audit(self, status: int, matched: bool):
+        # One JSON audit log entry per transaction, as ModSecurity writes them
+        messages = []
+        if matched:
+            messages = [
+                {"message": "Attack", "details": {"ruleId": "942100", "severity": "2"}},
+                {"message": "Inbound Anomaly Score Exceeded (Total Score: 5)", "details": {"ruleId": "949110"}},
+            ]
+        entry = {
+            "transaction": {
+                "request": {"headers": dict(self.headers.items())},
+                "response": {"http_code": status},
+                "messages": messages,
+            }
+        }
+        with self.server.audit_lock, open(self.server.audit_log, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+
+    do_GET = _respond
+    do_POST = _respond
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def stub_waf():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubWAFHandler)
+    server.payloads = []
+    # Path of the audit log the stub writes, when set
+    server.audit_log = None
+    server.audit_lock = threading.Lock()
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def waf_server(stub_waf):
+    return f"http://127.0.0.1:{stub_waf.server_address[1]}/"
+
+
+@pytest.fixture
+def waf_requests(stub_waf):
+    """Payloads received by the stub WAF, in arrival order."""
+    return stub_waf.payloads
+
+
+@pytest.fixture(autouse=True)
+def cache_home(tmp_path_factory, monkeypatch):
+    """Keep the on-disk caches of the tests away from the user's cache directory."""
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path_factory.mktemp("cache")))
+
+
+class StubLLMHandler(BaseHTTPRequestHandler):
+    """OpenAI-compatible chat completions endpoint answering with server.respond(messages)."""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length))
+        self.server.calls.append(request["messages"])
+        if self.server.failures:
+            status, content = self.server.failures.pop(0), b"{}"
+        else:
+            answer = self.server.respond(request["messages"])
+            status = 200
+            content = json.dumps(
+                {"choices": [{"message": {"role": "assistant", "content": answer}}]}
+            ).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        if status == 429:
+            self.send_header("Retry-After", "0")
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def stub_llm():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubLLMHandler)
+    server.calls = []
+    # Status codes returned before answering, e.g. 429
+    server.failures = []
+    server.respond = lambda messages: "{}"
+    server.url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
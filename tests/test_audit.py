@@ -0,0 +1,121 @@
+import json
+import time
+from unittest.mock import patch
+
+from wafsmith.cmd.evaluate import evaluate, EvaluateConfig
+from wafsmith.lib.audit import AuditCorrelator, AuditEntry, AuditLogReader
+from wafsmith.lib.results import Outcome
+
+JSON_ENTRY = {
+    "transaction": {
+        "request": {"headers": {"Host": "localhost", "X-Wafsmith-Request-Id": "run.attack.0.3"}},
+        "response": {"http_code": 403},
+        "messages": [
+            {"message": "SQL Injection Attack", "details": {"ruleId": "942100", "severity": "2"}},
+            {"message": "XSS Attack", "details": {"ruleId": "941100", "severity": "2"}},
+            {"message": "Inbound Anomaly Score Exceeded (Total Score: 10)", "details": {"ruleId": "949110"}},
+        ],
+    }
+}
+
+NATIVE_ENTRY = (
+    "---abc123---A--\n"
+    "[18/Oct/2026:10:00:00 +0000] 1760781600 127.0.0.1 4242 127.0.0.1 80\n"
+    "---abc123---B--\n"
+    "GET /?payload=x HTTP/1.1\n"
+    "Host: localhost\n"
+    "x-wafsmith-request-id: run.traffic.1.7\n"
+    "\n"
+    "---abc123---F--\n"
+    "HTTP/1.1 403\n"
+    "---abc123---H--\n"
+    'ModSecurity: Warning. Matched "Operator `Rx\' [id "932100"] [severity "CRITICAL"]\n'
+    "---abc123---Z--\n"
+)
+
+
+def test_reader_only_parses_what_was_appended(tmp_path):
+    path = tmp_path / "modsec_audit.log"
+    path.write_text(json.dumps({"transaction": {"messages": []}}) + "\n")
+    reader = AuditLogReader(str(path))
+    # Entries of previous runs are skipped
+    assert reader.read() == []
+
+    line = json.dumps(JSON_ENTRY)
+    with open(path, "a") as f:
+        f.write(line[:40])
+    assert reader.read() == []
+    with open(path, "a") as f:
+        f.write(line[40:] + "\n" + NATIVE_ENTRY[:120])
+    [entry] = reader.read()
+    assert entry.request_id == "run.attack.0.3"
+    assert entry.status_code == 403
+    assert entry.rule_ids == (942100, 941100)
+    assert entry.anomaly_score == 10
+
+    # The native record is only parsed once complete
+    with open(path, "a") as f:
+        f.write(NATIVE_ENTRY[120:])
+    [entry] = reader.read()
+    assert entry.request_id == "run.traffic.1.7"
+    assert entry.rule_ids == (932100,)
+    assert entry.anomaly_score == 5
+
+    # A rotated log is read from the start
+    path.write_text(line + "\n")
+    assert [entry.request_id for entry in reader.read()] == ["run.attack.0.3"]
+
+
+class QueuedReader:
+    path = "queued"
+
+    def __init__(self):
+        self.entries = []
+
+    def read(self):
+        entries, self.entries = self.entries, []
+        return entries
+
+
+def test_entries_wait_for_outcomes_held_back_past_grace():
+    reader = QueuedReader()
+    correlator = AuditCorrelator(reader, "run", grace=0.01)
+    # The entries of the requests after a slow one are logged long before
+    # their outcomes are reported
+    reader.entries = [AuditEntry(f"run.attack.0.{i}", 403, (942100,), 5) for i in (1, 2)]
+    correlator._poll()
+    time.sleep(0.05)
+    correlator._poll()
+
+    for index in (0, 1, 2):
+        correlator.expect(f"run.attack.0.{index}", "attack payload", None, Outcome(index, "p", 403))
+    time.sleep(0.05)
+    correlator._poll()
+
+    assert (correlator.attributed, correlator.unaudited) == (2, 1)
+    assert correlator.rules["attack payload"][942100] == 2
+
+
+@patch("wafsmith.cmd.evaluate.time.sleep")
+@patch("wafsmith.cmd.evaluate.TestingEnv")
+def test_results_are_attributed_the_rules_they_matched(mock_env, mock_sleep, tmp_path, stub_waf, waf_server):
+    audit_log = tmp_path / "modsec_audit.log"
+    stub_waf.audit_log = str(audit_log)
+    config = EvaluateConfig(
+        attack_payloads=["attack-1", "evaded-1", "attack-1", "attack-2"],
+        traffic_payloads=["benign"],
+        audit_log=str(audit_log),
+        attribution_path=str(tmp_path / "attribution.jsonl"),
+        host=waf_server,
+    )
+
+    evaluate(config)
+
+    records = [json.loads(line) for line in (tmp_path / "attribution.jsonl").read_text().splitlines()]
+    by_payload = {(record["kind"], record["payload"]): record for record in records}
+    # Duplicates are not sent, so not attributed
+    assert len(records) == 4
+    assert by_payload[("attack payload", "attack-1")]["rules"] == [942100]
+    assert by_payload[("attack payload", "attack-2")]["anomaly_score"] == 5
+    assert by_payload[("attack payload", "evaded-1")]["rules"] == []
+    assert by_payload[("business traffic", "benign")]["status"] == 200
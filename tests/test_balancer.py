@@ -0,0 +1,90 @@
+import json
+import threading
+from http.server import ThreadingHTTPServer
+from unittest.mock import patch
+
+import pytest
+
+from tests.conftest import StubWAFHandler
+from wafsmith.lib.balancer import Balancer, Strategy
+from wafsmith.lib.env import TestingEnv as Env
+from wafsmith.lib.payload import Engine, Location, process_payloads_in_parallel
+
+
+@pytest.fixture
+def replicas():
+    servers = []
+    for _ in range(3):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), StubWAFHandler)
+        server.payloads = []
+        threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+        servers.append(server)
+    yield servers
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def test_round_robin_hands_out_endpoints_in_turn():
+    balancer = Balancer(["a", "b", "c"])
+    assert [balancer.acquire() for _ in range(4)] == [0, 1, 2, 0]
+    assert balancer.sent == [2, 1, 1]
+
+
+def test_least_loaded_skips_busy_replicas():
+    balancer = Balancer(["a", "b", "c"], Strategy.LEAST_LOADED)
+    assert [balancer.acquire() for _ in range(3)] == [0, 1, 2]
+    balancer.release(1)
+    assert balancer.acquire() == 1
+    balancer.release(0)
+    balancer.release(2)
+    assert balancer.acquire() == 2  # tie between 0 and 2, continue after 1
+    assert balancer.in_flight == [0, 1, 1]
+
+
+@pytest.mark.parametrize("engine", [Engine.THREAD, Engine.ASYNC])
+@pytest.mark.parametrize("strategy", [Strategy.ROUND_ROBIN, Strategy.LEAST_LOADED])
+def test_payloads_are_spread_across_replicas(engine, strategy, replicas):
+    endpoints = [f"http://127.0.0.1:{s.server_address[1]}/" for s in replicas]
+    payloads = [f"attack-{i}" if i % 4 == 0 else f"benign-{i}" for i in range(60)]
+    balancer = Balancer(endpoints, strategy)
+
+    results = process_payloads_in_parallel(
+        payloads, "GET", endpoints[0], Location.URL_PARAMETERS, 6,
+        engine=engine, concurrency=6, balancer=balancer,
+    )
+
+    assert [results.status(i) for i in range(60)] == [
+        403 if i % 4 == 0 else 200 for i in range(60)
+    ]
+    received = [s.payloads for s in replicas]
+    assert sorted(sum(received, [])) == sorted(payloads)
+    assert all(received)
+    assert balancer.in_flight == [0, 0, 0]
+
+
+def test_replica_override_copies_the_waf_service(tmp_path):
+    resolved = {
+        "services": {
+            "crs-nginx": {
+                "image": "owasp/modsecurity-crs:nginx",
+                "container_name": "waf",
+                "ports": [{"target": 80, "published": "80"}],
+                "environment": {"BLOCKING_PARANOIA": "1"},
+            }
+        }
+    }
+    env = Env(base_dir=str(tmp_path), replicas=3)
+    with patch.object(Env, "exec", return_value=(0, json.dumps(resolved).encode(), b"")):
+        env.write_replica_file()
+
+    override = json.loads((tmp_path / env.replica_file).read_text())
+    assert sorted(override["services"]) == ["crs-nginx-2", "crs-nginx-3"]
+    replica = override["services"]["crs-nginx-3"]
+    assert replica["ports"] == ["8082:80"]
+    assert replica["environment"] == {"BLOCKING_PARANOIA": "1"}
+    assert "container_name" not in replica
+    assert env.compose()[-2:] == ["-f", env.replica_file]
+    assert env.endpoints("http://localhost/") == [
+        "http://localhost/", "http://localhost:8081/", "http://localhost:8082/",
+    ]
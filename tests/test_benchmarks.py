@@ -0,0 +1,37 @@
+from benchmarks.corpora import datasets, seed_payloads, synthesize
+from benchmarks.run import compare, run_case
+from benchmarks.stub_waf import StubWAF
+
+
+def test_stub_waf_blocks_with_its_rule(tmp_path):
+    path = synthesize(str(tmp_path / "corpus.txt"), 50, ["<script>alert(1)</script>", "hello"])
+    with StubWAF() as waf:
+        metrics = run_case(path, waf.url, "thread", 2, 2)
+    assert metrics["payloads"] == 50
+    assert metrics["blocked"] == 25
+    assert metrics["evaded"] == 25
+    assert metrics["errors"] == 0
+    assert metrics["p99_ms"] > 0
+
+
+def test_datasets_are_ordered_by_size():
+    names = [name for name, _ in datasets()]
+    assert names[0] == "payload-dataset-1"
+    assert names[-1] == "payload-dataset-200"
+    assert len(seed_payloads()) > 100
+
+
+def test_compare_flags_regressions():
+    baseline = {
+        "case": {"payloads": 10_000, "throughput": 1000.0, "p99_ms": 10.0, "peak_rss_mb": 50.0},
+        "small-case": {"payloads": 10, "throughput": 1000.0, "peak_rss_mb": 50.0},
+    }
+    current = {
+        "case": {"payloads": 10_000, "throughput": 700.0, "p99_ms": 11.0, "peak_rss_mb": 80.0},
+        "small-case": {"payloads": 10, "throughput": 10.0, "peak_rss_mb": 50.0},
+        "new-case": {"throughput": 1.0},
+    }
+    regressions = compare(baseline, current, 0.25)
+    assert len(regressions) == 2
+    assert regressions[0].startswith("case throughput: 1000.0 -> 700.0")
+    assert regressions[1].startswith("case peak_rss_mb")
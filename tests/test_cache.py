@@ -0,0 +1,95 @@
+from unittest.mock import patch
+
+from wafsmith.cmd.evaluate import evaluate, EvaluateConfig
+from wafsmith.lib.cache import VerdictCache, ruleset_hash, verdict_context
+from wafsmith.lib.payload import Location, process_payloads_in_parallel
+
+
+def make_setup(tmp_path):
+    (tmp_path / "rules").mkdir()
+    (tmp_path / "rules-tuning").mkdir()
+    (tmp_path / "web-app").mkdir()
+    (tmp_path / "rules" / "REQUEST-942.conf").write_text('SecRule ARGS "@rx union" "id:1"\n')
+    (tmp_path / "docker-compose.yml").write_text("BLOCKING_PARANOIA: 1\n")
+    return str(tmp_path)
+
+
+def test_ruleset_hash_tracks_rules_and_crs_settings(tmp_path):
+    setup = make_setup(tmp_path)
+    original = ruleset_hash(setup)
+
+    (tmp_path / "web-app" / "index.js").write_text("// unrelated edit")
+    assert ruleset_hash(setup) == original
+
+    (tmp_path / "docker-compose.yml").write_text("BLOCKING_PARANOIA: 2\n")
+    changed = ruleset_hash(setup)
+    assert changed != original
+
+    (tmp_path / "rules-tuning" / "REQUEST-900.conf").write_text("SecRuleRemoveById 1\n")
+    assert ruleset_hash(setup) != changed
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    cache = VerdictCache(str(tmp_path / "cache.db"), max_entries=2)
+    cache.put("a", 403)
+    cache.put("b", 200)
+    cache.put("c", 403)
+    assert cache.get("a") == 403  # "a" is now the most recently used
+    assert cache.evict() == 1
+    assert cache.get("b") is None
+    assert cache.get("a") == 403
+    assert cache.get("c") == 403
+    cache.close()
+
+    reopened = VerdictCache(str(tmp_path / "cache.db"))
+    assert len(reopened) == 2
+    reopened.close()
+
+
+def test_only_cache_misses_are_sent(tmp_path, waf_server, waf_requests):
+    cache = VerdictCache(str(tmp_path / "cache.db"))
+    view = cache.view(verdict_context("rules", "GET", "url_parameters", "FORM_URLENCODED"))
+    view.put("attack-1", 403)
+    view.put("benign-1", 200)
+    outcomes = []
+
+    results = process_payloads_in_parallel(
+        ["attack-1", "benign-1", "attack-2"], "GET", waf_server,
+        Location.URL_PARAMETERS, 1, on_result=outcomes.append, cache=view,
+    )
+
+    assert waf_requests == ["attack-2"]
+    assert results.counts == {403: 2, 200: 1}
+    assert [o.cached for o in outcomes] == [True, True, False]
+    assert view.get("attack-2") == 403
+    # Other request shapes don't share verdicts
+    assert cache.view(verdict_context("rules", "POST", "http_body", "JSON")).get("attack-1") is None
+    cache.close()
+
+
+@patch("wafsmith.cmd.evaluate.time.sleep")
+@patch("wafsmith.cmd.evaluate.TestingEnv")
+def test_rerun_is_served_from_cache(mock_env, mock_sleep, tmp_path, waf_server, waf_requests):
+    setup = make_setup(tmp_path)
+    (tmp_path / "payloads").mkdir()
+    (tmp_path / "payloads" / "p.txt").write_text("attack-1\nevaded-1\n")
+    (tmp_path / "traffic").mkdir()
+    (tmp_path / "traffic" / "t.txt").write_text("benign\n")
+    config = EvaluateConfig(
+        setup_dir=setup,
+        output_evaded_path=str(tmp_path / "evaded.txt"),
+        attack_payloads_dir=str(tmp_path / "payloads"),
+        traffic_payloads_dir=str(tmp_path / "traffic"),
+        cache_path=str(tmp_path / "cache.db"),
+        host=waf_server,
+    )
+
+    evaluate(config)
+    assert len(waf_requests) == 3
+    assert mock_env.return_value.setup.call_count == 1
+
+    (tmp_path / "evaded.txt").unlink()
+    evaluate(config)
+    assert len(waf_requests) == 3
+    assert mock_env.return_value.setup.call_count == 1
+    assert (tmp_path / "evaded.txt").read_text() == "evaded-1\n"
@@ -0,0 +1,73 @@
+import json
+import re
+
+from wafsmith.cmd.cluster import cluster
+from wafsmith.cmd.config import ClusterConfig, CreateConfig
+from wafsmith.cmd.create import create
+from wafsmith.lib.cluster import MinHasher, PayloadClusterer, lsh_bands, similarity
+
+
+def test_signatures_estimate_similarity():
+    hasher = MinHasher()
+    a = hasher.signature("<script>alert(document.cookie)</script>")
+    assert hasher.signature("<SCRIPT>alert(document.cookie)</SCRIPT>") == a
+    assert similarity(a, hasher.signature("<script>alert(document.domain)</script>")) > 0.5
+    assert similarity(a, hasher.signature("' UNION SELECT username, password FROM users--")) < 0.2
+    assert lsh_bands(64, 0.5) == (16, 4)
+
+
+def test_variants_are_grouped_into_families():
+    sqli = [f"1' UNION SELECT {', '.join(['NULL'] * n)}-- -" for n in range(1, 8)]
+    xss = [f"<img src=x onerror=alert({n})>" for n in range(100, 130)]
+    payloads = [x for pair in zip(xss, sqli) for x in pair] + xss[len(sqli):] + ["../../etc/passwd"] * 3
+
+    clusters = PayloadClusterer().cluster(payloads)
+
+    assert [(c.count, len(c.members)) for c in clusters] == [(30, 30), (7, 7), (3, 1)]
+    assert set(clusters[0].members) == set(xss)
+    assert clusters[1].representative in sqli
+    assert clusters[2].representative == "../../etc/passwd"
+
+
+def test_cluster_command_and_clustered_creation(stub_llm, tmp_path):
+    def rules(messages):
+        payloads = json.loads(re.search(r"^\[.*\]$", messages[1]["content"], re.M).group(0))
+        return json.dumps(
+            [
+                {"regex": re.escape(p[:8]), "rule": f'SecRule ARGS "@rx {re.escape(p[:8])}" "id:1,phase:2,deny"'}
+                for p in payloads
+            ]
+        )
+
+    stub_llm.respond = rules
+    payloads = [f"<svg/onload=alert('{n}')>" for n in range(200, 240)] + [
+        f"1;sleep({n})#" for n in range(10, 15)
+    ]
+    (tmp_path / "evaded.txt").write_text("\n".join(payloads) + "\n")
+
+    cluster(
+        ClusterConfig(
+            input_path=str(tmp_path / "evaded.txt"),
+            output_path=str(tmp_path / "clusters.txt"),
+            members_path=str(tmp_path / "clusters.jsonl"),
+        )
+    )
+    representatives = (tmp_path / "clusters.txt").read_text().splitlines()
+    families = [json.loads(line) for line in (tmp_path / "clusters.jsonl").read_text().splitlines()]
+    assert len(representatives) == 2
+    assert [family["count"] for family in families] == [40, 5]
+    assert [family["representative"] for family in families] == representatives
+
+    create(
+        CreateConfig(
+            input_path=str(tmp_path / "evaded.txt"),
+            output_path=str(tmp_path / "rules.conf"),
+            model="stub",
+            base_url=stub_llm.url,
+            llm_cache=False,
+            cluster=True,
+        )
+    )
+    # A single call for the two representatives instead of 45 payloads in 5
+    assert len(stub_llm.calls) == 1
+    assert len((tmp_path / "rules.conf").read_text().splitlines()) == 2
@@ -0,0 +1,59 @@
+import os
+from unittest.mock import patch
+
+from wafsmith.cmd.config import read_all_file_content_in_directory
+from wafsmith.lib.corpus import Corpus, list_files
+from wafsmith.lib.payload import Location, process_payloads_in_parallel
+
+
+def write_lines(path, lines):
+    with open(path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def test_corpus_streams_directory_in_stable_order(tmp_path):
+    os.makedirs(tmp_path / "nested")
+    write_lines(tmp_path / "b.txt", ["b1", "b2"])
+    write_lines(tmp_path / "a.txt", [" a1 ", "a2"])
+    write_lines(tmp_path / "nested" / "c.txt", ["c1"])
+
+    corpus = Corpus(path=str(tmp_path))
+
+    assert list(corpus) == ["a1", "a2", "b1", "b2", "c1"]
+    # Re-iterating reads the files again
+    assert list(corpus) == ["a1", "a2", "b1", "b2", "c1"]
+    assert read_all_file_content_in_directory(str(tmp_path)) == list(corpus)
+
+
+def test_corpus_accepts_single_file_and_missing_path(tmp_path):
+    write_lines(tmp_path / "a.txt", ["a1"])
+
+    assert list(list_files(str(tmp_path / "a.txt"))) == [str(tmp_path / "a.txt")]
+    assert list(Corpus(path=str(tmp_path / "a.txt"))) == ["a1"]
+    assert list(Corpus(path=str(tmp_path / "missing"))) == []
+    assert list(Corpus(payloads=["x", "y"])) == ["x", "y"]
+
+
+def test_payloads_are_consumed_lazily_in_bounded_batches():
+    consumed = 0
+    in_flight_read_ahead = []
+
+    def stream():
+        nonlocal consumed
+        for i in range(50):
+            consumed += 1
+            yield f"payload{i}"
+
+    def fake_send_prepared(request, endpoint, session=None, timeout=None):
+        index = int(request.payload[len("payload"):])
+        in_flight_read_ahead.append(consumed - index)
+        return 200
+
+    with patch("wafsmith.lib.payload.send_prepared", side_effect=fake_send_prepared):
+        results = process_payloads_in_parallel(
+            stream(), "GET", "http://example.com", Location.URL_PARAMETERS, 2,
+            batch_size=10,
+        )
+
+    assert results.count(200) == 50
+    assert max(in_flight_read_ahead) <= 10
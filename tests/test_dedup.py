@@ -0,0 +1,47 @@
+import pytest
+
+from wafsmith.lib.dedup import Deduplicator, normalize
+from wafsmith.lib.payload import Engine, Location, process_payloads_in_parallel
+
+
+def test_normalize_groups_encoding_and_case_variants():
+    assert normalize("<A+HREF=x>") == normalize("<a%20href=x>") == "<a href=x>"
+
+
+@pytest.mark.parametrize("on_disk", [False, True])
+def test_first_index_returns_representative(on_disk):
+    dedup = Deduplicator(normalize_payloads=True, on_disk=on_disk)
+    assert dedup.first_index("union select", 0) == 0
+    assert dedup.first_index("<script>", 1) == 1
+    assert dedup.first_index("UNION+SELECT", 2) == 0
+    assert (dedup.unique, dedup.duplicates) == (2, 1)
+    dedup.close()
+
+
+@pytest.mark.parametrize("engine", [Engine.THREAD, Engine.ASYNC])
+def test_duplicates_are_sent_once_and_fanned_out(engine, waf_server, waf_requests):
+    payloads = ["attack-1", "", "benign", "attack-1", "Benign", "attack-1"]
+    outcomes = []
+
+    results = process_payloads_in_parallel(
+        payloads, "GET", waf_server, Location.URL_PARAMETERS, 2,
+        engine=engine, batch_size=2, on_result=outcomes.append,
+        dedup=Deduplicator(),
+    )
+
+    assert sorted(waf_requests) == ["Benign", "attack-1", "benign"]
+    assert [results.status(i) for i in range(len(payloads))] == [403, 0, 200, 403, 200, 403]
+    assert len(results) == 5
+    assert sorted((o.index, o.cached) for o in outcomes) == [
+        (0, False), (2, False), (3, True), (4, False), (5, True),
+    ]
+
+
+def test_normalized_duplicates_share_the_verdict(waf_server, waf_requests):
+    results = process_payloads_in_parallel(
+        ["benign", "BENIGN", "ben%69gn"], "GET", waf_server,
+        Location.URL_PARAMETERS, 1, dedup=Deduplicator(normalize_payloads=True),
+    )
+
+    assert waf_requests == ["benign"]
+    assert results.count(200) == 3
@@ -0,0 +1,103 @@
+from unittest.mock import patch
+
+from wafsmith.cmd.evaluate import evaluate, EvaluateConfig
+from wafsmith.lib.cache import ruleset_hash
+from wafsmith.lib.delta import DeltaScreen, RuleSnapshot, diff
+from wafsmith.lib.payload import Cell, Encoding, Location
+
+RULES = (
+    'SecRule ARGS "@rx union" "id:1,phase:2,block,t:lowercase"\n'
+    'SecRule REQUEST_HEADERS:User-Agent "@contains scanner" "id:2,phase:1,deny"\n'
+    'SecRule ARGS "@pmFromFile words.data" "id:3,phase:2,block"\n'
+)
+
+
+def make_setup(tmp_path):
+    (tmp_path / "rules").mkdir()
+    (tmp_path / "rules-tuning").mkdir()
+    (tmp_path / "rules" / "REQUEST-942.conf").write_text(RULES)
+    (tmp_path / "rules" / "words.data").write_text("select\n")
+    (tmp_path / "docker-compose.yml").write_text("BLOCKING_PARANOIA: 1\n")
+    return str(tmp_path)
+
+
+def snapshot(setup):
+    return RuleSnapshot.take(setup, ruleset_hash(setup))
+
+
+def test_diff_reports_the_changed_rules(tmp_path):
+    setup = make_setup(tmp_path)
+    original = snapshot(setup)
+    assert sorted(original.rules) == ["id:1", "id:2", "id:3"]
+    assert diff(original, snapshot(setup)) == []
+
+    conf = tmp_path / "rules" / "REQUEST-942.conf"
+    conf.write_text(RULES.replace("@rx union", "@rx union\\s+select") + 'SecRule ARGS "@rx sleep" "id:4"\n')
+    (tmp_path / "rules-tuning" / "tuning.conf").write_text("SecRuleRemoveById 2\n")
+    changes = {change.key: change for change in diff(original, snapshot(setup))}
+    assert sorted(changes) == ["id:1", "id:2", "id:4"]
+    assert changes["id:2"].after is None
+    assert changes["id:4"].before is None
+
+    # Rules reading a data file change with it
+    (tmp_path / "rules" / "words.data").write_text("select\nsleep\n")
+    changes = {change.key: change for change in diff(original, snapshot(setup))}
+    assert changes["id:3"].stale_data
+
+    # Global settings may change any verdict
+    (tmp_path / "docker-compose.yml").write_text("BLOCKING_PARANOIA: 2\n")
+    assert diff(original, snapshot(setup)) is None
+
+
+def test_screen_only_flags_payloads_the_changed_rules_could_match(tmp_path):
+    setup = make_setup(tmp_path)
+    original = snapshot(setup)
+    (tmp_path / "rules" / "REQUEST-942.conf").write_text(RULES.replace("@rx union", "@rx union\\s+all"))
+    screen = DeltaScreen(diff(original, snapshot(setup)), str(tmp_path / "rules"))
+    get = Cell()
+    json_body = Cell("POST", Location.HTTP_BODY, Encoding.JSON)
+
+    assert screen.affected("1 UNION ALL select", get)
+    assert screen.affected("1 union select", json_body)
+    assert not screen.affected("hello world", get)
+    assert not screen.affected("hello world", json_body)
+
+    # A rule that does not read the payload may change every verdict
+    (tmp_path / "rules" / "REQUEST-942.conf").write_text(RULES.replace("scanner", "curl"))
+    screen = DeltaScreen(diff(original, snapshot(setup)), str(tmp_path / "rules"))
+    assert screen.affected("hello world", get)
+
+
+@patch("wafsmith.cmd.evaluate.time.sleep")
+@patch("wafsmith.cmd.evaluate.TestingEnv")
+def test_delta_run_only_retests_affected_payloads(mock_env, mock_sleep, tmp_path, waf_server, waf_requests):
+    setup = make_setup(tmp_path)
+    (tmp_path / "payloads").mkdir()
+    (tmp_path / "payloads" / "p.txt").write_text("attack union 1\nattack-2\nevaded union\nevaded-2\n")
+    (tmp_path / "traffic").mkdir()
+    (tmp_path / "traffic" / "t.txt").write_text("benign\n")
+    config = EvaluateConfig(
+        setup_dir=setup,
+        output_evaded_path=str(tmp_path / "evaded.txt"),
+        attack_payloads_dir=str(tmp_path / "payloads"),
+        traffic_payloads_dir=str(tmp_path / "traffic"),
+        cache_path=str(tmp_path / "cache.db"),
+        delta=True,
+        host=waf_server,
+    )
+
+    evaluate(config)
+    assert len(waf_requests) == 5
+
+    (tmp_path / "rules" / "REQUEST-942.conf").write_text(RULES.replace("@rx union", "@rx union\\s+\\d"))
+    waf_requests.clear()
+    evaluate(config)
+    assert sorted(waf_requests) == ["attack union 1", "evaded union"]
+    assert mock_env.return_value.setup.call_count == 2
+    assert sorted((tmp_path / "evaded.txt").read_text().split("\n")) == ["", "evaded union", "evaded-2"]
+
+    # Carried verdicts were cached under the new ruleset
+    waf_requests.clear()
+    evaluate(config)
+    assert waf_requests == []
+    assert mock_env.return_value.setup.call_count == 2
@@ -0,0 +1,179 @@
+import json
+import os
+import sys
+import subprocess
+import threading
+
+import requests
+
+from wafsmith.lib.dedup import Deduplicator
+from wafsmith.lib.distributed import Coordinator, work
+from wafsmith.lib.payload import (
+    Cell,
+    Encoding,
+    Lane,
+    Location,
+    process_matrix_in_parallel,
+)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PAYLOADS = [f"attack-{i}" if i % 3 == 0 else f"benign-{i}" for i in range(60)]
+PAYLOADS += ["", "attack-0", "benign-1"]
+
+CELLS = [
+    Cell("GET", Location.URL_PARAMETERS),
+    Cell("POST", Location.HTTP_BODY, Encoding.JSON),
+]
+
+
+def evaluate_lanes(endpoint, coordinator=None):
+    outcomes = []
+    lanes = [
+        Lane(
+            cell,
+            lambda outcome, lane=lane: outcomes.append(
+                (lane, outcome.index, outcome.payload, outcome.status_code)
+            ),
+        )
+        for lane, cell in enumerate(CELLS)
+    ]
+    process_matrix_in_parallel(
+        PAYLOADS,
+        lanes,
+        endpoint,
+        2,
+        batch_size=7,
+        dedup=Deduplicator(),
+        coordinator=coordinator,
+    )
+    return lanes, outcomes
+
+
+def test_distributed_run_matches_single_node(waf_server):
+    single, single_outcomes = evaluate_lanes(waf_server)
+
+    with Coordinator("127.0.0.1", 0, window=3) as coordinator:
+        workers = [
+            threading.Thread(
+                target=work,
+                args=(coordinator.address, waf_server, 2),
+                kwargs={"name": f"worker-{i}", "poll_interval": 0.01},
+            )
+            for i in range(3)
+        ]
+        for worker in workers:
+            worker.start()
+        distributed, distributed_outcomes = evaluate_lanes(waf_server, coordinator)
+    for worker in workers:
+        worker.join(5)
+        assert not worker.is_alive()
+
+    for lane, reference in zip(distributed, single):
+        assert lane.results.codes == reference.results.codes
+        assert lane.results.counts == reference.results.counts
+    # Duplicates answered locally may interleave differently with the read-ahead
+    assert sorted(distributed_outcomes) == sorted(single_outcomes)
+    assert sum(coordinator.shards_by_worker.values()) == coordinator.requeued + 18
+
+
+def test_expired_lease_is_handed_out_again(waf_server):
+    crashed = {}
+
+    with Coordinator("127.0.0.1", 0, lease_timeout=0.2) as coordinator:
+        # A worker leases the first shard and dies, another one then joins
+        def crash_then_serve():
+            status, shard = coordinator.lease("crashed")
+            while status != 200:
+                status, shard = coordinator.lease("crashed")
+            crashed.update(shard)
+            work(coordinator.address, waf_server, 2, name="survivor", poll_interval=0.01)
+
+        worker = threading.Thread(target=crash_then_serve)
+        worker.start()
+        lanes, _ = evaluate_lanes(waf_server, coordinator)
+        # The late report of the crashed worker is ignored
+        status, _ = coordinator.complete(
+            {"job": crashed["job"], "shard": crashed["shard"], "outcomes": []}
+        )
+    worker.join(5)
+
+    assert status == 409
+    assert coordinator.requeued >= 1
+    assert coordinator.shards_by_worker["crashed"] == 1
+    assert lanes[0].results.count(403) == 21
+    assert lanes[0].results.count(200) == 41
+
+
+def test_reports_are_checked_against_their_shard():
+    recorded = []
+
+    with Coordinator("127.0.0.1", 0, token="secret") as coordinator:
+        url = coordinator.address
+        assert requests.post(f"{url}lease", json={}).status_code == 401
+        runner = threading.Thread(
+            target=coordinator.run,
+            args=([(0, 0, "a"), (0, 1, "b")], CELLS[:1], 2, lambda lane, o: recorded.append(o)),
+        )
+        runner.start()
+        session = requests.Session()
+        session.headers["Authorization"] = "Bearer secret"
+        response = session.post(f"{url}lease", json={"worker": "w"})
+        while response.status_code != 200:
+            response = session.post(f"{url}lease", json={"worker": "w"})
+        shard = response.json()
+
+        def report(outcomes):
+            body = {"job": shard["job"], "shard": shard["shard"], "outcomes": outcomes}
+            return session.post(f"{url}results", data=json.dumps(body)).status_code
+
+        assert session.post(f"{url}results", json={"shard": shard["shard"]}).status_code == 400
+        assert session.post(f"{url}results", data=b"[").status_code == 400
+        for shard_id in ([shard["shard"]], {"n": 1}, "0", True):
+            body = {"job": shard["job"], "shard": shard_id, "outcomes": []}
+            assert session.post(f"{url}results", json=body).status_code == 400
+        assert report([[0, 0, 403, 0.1, 0.0, 0.1]]) == 400
+        assert report([[0, 0, 403, 0.1, 0.0, 0.1], [0, 2, 200, 0.1, 0.0, 0.1]]) == 400
+        assert report([[0, 0, 403, 0.1, 0.0, 0.1], [[0], 1, 200, 0.1, 0.0, 0.1]]) == 400
+        assert report([[0, 0, 403, 0.1, 0.0, 0.1], [0, -1, 200, 0.1, 0.0, 0.1]]) == 400
+        for status in (0, 65536, "200", 200.0, None):
+            assert report([[0, 0, 403, 0.1, 0.0, 0.1], [0, 1, status, 0.1, 0.0, 0.1]]) == 400
+        for elapsed in (-0.1, "0.1", None):
+            assert report([[0, 0, 403, 0.1, 0.0, 0.1], [0, 1, 200, elapsed, 0.0, 0.1]]) == 400
+        # Python's json writes and reads non-finite floats
+        assert report([[0, 0, 403, 0.1, 0.0, 0.1], [0, 1, 200, float("inf"), 0.0, 0.1]]) == 400
+        assert report([[0, 0, 403, 0.1, 0.0, 0.1], [0, 1, 200, 0.1, float("nan"), 0.1]]) == 400
+        assert report([[0, 0, 403, 0.1, 0.0, 0.1], [0, 1, 200, 0.1, 0.0, 0.1]]) == 200
+        runner.join(5)
+
+    assert [(o.index, o.payload, o.status_code) for o in recorded] == [(0, "a", 403), (1, "b", 200)]
+
+
+def test_worker_processes(waf_server, tmp_path):
+    with Coordinator("127.0.0.1", 0) as coordinator:
+        workers = [
+            subprocess.Popen(
+                [
+                    sys.executable,
+                    os.path.join(ROOT, "main.py"),
+                    "worker",
+                    "--coordinator",
+                    coordinator.address,
+                    "--host",
+                    waf_server,
+                    "--no-deploy",
+                    "--name",
+                    f"process-{i}",
+                ],
+                cwd=tmp_path,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+            for i in range(2)
+        ]
+        lanes, _ = evaluate_lanes(waf_server, coordinator)
+    for worker in workers:
+        assert worker.wait(30) == 0
+
+    assert lanes[1].results.count(403) == 21
+    assert set(coordinator.shards_by_worker) <= {"process-0", "process-1"}
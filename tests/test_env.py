@@ -0,0 +1,56 @@
+import socket
+import threading
+from http.server import ThreadingHTTPServer
+from unittest.mock import patch
+
+from tests.conftest import StubWAFHandler
+from wafsmith.lib.env import TestingEnv as Env
+
+
+class WarmingUpHandler(StubWAFHandler):
+    """Answers 502 Bad Gateway until the application behind nginx is up."""
+
+    def _respond(self):
+        self.server.probes += 1
+        if self.server.probes <= 2:
+            self.send_response(502)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        super()._respond()
+
+    do_GET = _respond
+
+
+def test_wait_ready_polls_until_the_application_is_proxied():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), WarmingUpHandler)
+    server.payloads, server.probes = [], 0
+    threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}/"
+        assert Env().wait_ready(url, timeout=5, interval=0.01)
+        assert server.probes == 3
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_wait_ready_times_out_when_nothing_listens():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    assert not Env().wait_ready(f"http://127.0.0.1:{port}/", timeout=0.1, interval=0.02)
+
+
+def test_attach_reloads_only_changed_rules(tmp_path):
+    env = Env(base_dir=str(tmp_path))
+    with patch.object(Env, "setup") as setup, patch.object(
+        Env, "reload"
+    ) as reload, patch.object(Env, "is_running", side_effect=[False, True, True]):
+        assert env.attach("rules-v1") is True
+        assert env.attach("rules-v1") is False
+        reload.assert_not_called()
+        assert env.attach("rules-v2") is False
+        reload.assert_called_once()
+        assert setup.call_count == 3
+    assert env.loaded_ruleset() == "rules-v2"
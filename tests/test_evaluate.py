@@ -2,6 +2,7 @@ import os
 import sys
 import pytest
 from unittest.mock import patch, MagicMock
+from urllib.parse import parse_qs, unquote_plus, urlparse
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
@@ -25,12 +26,16 @@ def mock_config():
 def mock_testing_env():
     with patch("wafsmith.cmd.evaluate.TestingEnv") as mock_env_class:
         mock_env = MagicMock()
+        mock_env.endpoints.side_effect = lambda host: [host]
         mock_env_class.return_value = mock_env
         yield mock_env
 
 @pytest.fixture
 def mock_requests():
-    with patch("wafsmith.cmd.evaluate.requests") as mock_requests:
+    with patch("wafsmith.lib.session.requests") as mock_requests_module:
+        # Payloads are sent through the pooled session
+        mock_requests = mock_requests_module.Session.return_value
+
         # Create mock response objects
         mock_response_403 = MagicMock()
         mock_response_403.status_code = 403
@@ -39,25 +44,20 @@ def mock_requests():
         mock_response_200.status_code = 200
         
         # Configure the mock get and post methods
-        def mock_get(url, headers=None, params=None):
-            if params and "payload" in params:
-                if params["payload"] in ["payload1", "payload3"]:
-                    return mock_response_403
-                elif params["payload"] == "payload2":
-                    return mock_response_200
-                elif "traffic" in params["payload"]:
-                    return mock_response_200
-            return mock_response_403
-        
-        def mock_post(url, headers=None, data=None):
-            if data and "payload" in data:
-                if data["payload"] in ["payload1", "payload3"]:
-                    return mock_response_403
-                elif data["payload"] == "payload2":
-                    return mock_response_200
-                elif "traffic" in data["payload"]:
-                    return mock_response_200
+        def verdict(payload):
+            if payload in ["payload1", "payload3"]:
+                return mock_response_403
+            elif payload == "payload2" or "traffic" in payload:
+                return mock_response_200
             return mock_response_403
+
+        # Requests are prepared ahead of sending: the payload is already
+        # encoded into the URL (or the body bytes) by the time they are sent
+        def mock_get(url, headers=None, data=None, timeout=None):
+            return verdict(parse_qs(urlparse(url).query).get("payload", [""])[0])
+
+        def mock_post(url, headers=None, data=None, timeout=None):
+            return verdict(unquote_plus((data or b"").decode("utf-8")))
         
         mock_requests.get.side_effect = mock_get
         mock_requests.post.side_effect = mock_post
@@ -67,7 +67,7 @@ def mock_requests():
 
 @patch("wafsmith.cmd.evaluate.console")
 @patch("wafsmith.cmd.evaluate.time.sleep")
-@patch("wafsmith.cmd.evaluate.open")
+@patch("wafsmith.lib.writer.open")
 @patch("builtins.open")
 def test_evaluate(mock_open, mock_file_open, mock_sleep, mock_console, mock_config, mock_testing_env, mock_requests):
     # Mock file operations
@@ -101,4 +101,33 @@ def test_evaluate_error_handling(mock_sleep, mock_console, mock_config, mock_tes
     evaluate(mock_config)
     
     # Verify teardown was still called to clean up
-    mock_testing_env.teardown.assert_called_once()
\ No newline at end of file
+    mock_testing_env.teardown.assert_called_once()
+
+@patch("wafsmith.cmd.evaluate.console")
+def test_evaluate_setup_failure_closes_writer_and_cache(mock_console, mock_config, mock_testing_env, tmp_path):
+    mock_config.output_evaded_path = str(tmp_path / "evaded.txt")
+    mock_config.cache_path = str(tmp_path / "cache.db")
+
+    # The corpora are unreadable once the writer and cache are open
+    with patch.object(EvaluateConfig, "attack_corpus", side_effect=OSError("unreadable")), \
+            patch("wafsmith.cmd.evaluate.ResultWriter.close", autospec=True) as writer_close, \
+            patch("wafsmith.cmd.evaluate.VerdictCache.close", autospec=True) as cache_close:
+        evaluate(mock_config)
+
+    writer_close.assert_called_once()
+    cache_close.assert_called_once()
+    mock_testing_env.setup.assert_not_called()
+    mock_testing_env.teardown.assert_not_called()
+
+@patch("wafsmith.cmd.evaluate.console")
+@patch("wafsmith.cmd.evaluate.ruleset_hash", return_value="rules")
+@patch("wafsmith.lib.writer.open", create=True)
+def test_evaluate_attached_environment_is_kept_warm(mock_file_open, mock_hash, mock_console, mock_config, mock_testing_env, mock_requests):
+    mock_config.attach = True
+
+    evaluate(mock_config)
+
+    mock_testing_env.attach.assert_called_once_with("rules")
+    mock_testing_env.wait_ready.assert_called_once_with(mock_config.host, mock_config.ready_timeout)
+    mock_testing_env.setup.assert_not_called()
+    mock_testing_env.teardown.assert_not_called()
@@ -3,13 +3,17 @@ import tempfile
 from unittest.mock import patch, MagicMock
 
 from wafsmith.cmd.evaluate import (
-    process_payload,
-    process_payloads_in_parallel,
     calculate_results,
     write_results_to_file,
+)
+from wafsmith.lib.payload import (
+    process_payload,
+    process_payloads_in_parallel,
     Location,
     Payload
 )
+from wafsmith.lib.results import ResultStore
+from wafsmith.lib.session import RequestTiming
 
 
 def test_process_payload():
@@ -36,9 +40,13 @@ def test_process_payloads_in_parallel():
     threads = 2
     
     # Mock ThreadPoolExecutor.map to return predefined results
-    mock_results = [("payload1", 200), ("payload2", 403), ("payload3", 200)]
+    mock_results = [
+        ("payload1", 200, RequestTiming(), 0.01),
+        ("payload2", 403, RequestTiming(), 0.01),
+        ("payload3", 200, RequestTiming(), 0.01),
+    ]
     
-    with patch('wafsmith.cmd.evaluate.ThreadPoolExecutor') as mock_executor:
+    with patch('wafsmith.lib.payload.ThreadPoolExecutor') as mock_executor:
         mock_instance = MagicMock()
         mock_executor.return_value.__enter__.return_value = mock_instance
         mock_instance.map.return_value = mock_results
@@ -46,21 +54,21 @@ def test_process_payloads_in_parallel():
         results = process_payloads_in_parallel(payloads, method, endpoint, location, threads)
         
         # Verify results are correctly organized by status code
-        assert 200 in results
-        assert 403 in results
-        assert results[200] == ["payload1", "payload3"]
-        assert results[403] == ["payload2"]
+        assert results.count(200) == 2
+        assert results.count(403) == 1
+        assert list(results.codes) == [200, 403, 200]
+
+
+def build_results(status_codes):
+    results = ResultStore()
+    for index, status_code in enumerate(status_codes):
+        results.record(index, status_code)
+    return results
 
 
 def test_calculate_results():
     # Test with some evaded payloads
-    results = {
-        "total": 5,
-        "data": {
-            200: ["payload1", "payload3"],
-            403: ["payload2", "payload4", "payload5"]
-        }
-    }
+    results = build_results([200, 403, 200, 403, 403])
     
     matched_count, total_count, percentage, all_passed = calculate_results(results)
     assert matched_count == 2
@@ -69,12 +77,7 @@ def test_calculate_results():
     assert all_passed is False
     
     # Test with all payloads evaded
-    results = {
-        "total": 3,
-        "data": {
-            200: ["payload1", "payload2", "payload3"]
-        }
-    }
+    results = build_results([200, 200, 200])
     
     matched_count, total_count, percentage, all_passed = calculate_results(results)
     assert matched_count == 3
@@ -83,12 +86,7 @@ def test_calculate_results():
     assert all_passed is True
     
     # Test with no payloads evaded
-    results = {
-        "total": 3,
-        "data": {
-            403: ["payload1", "payload2", "payload3"]
-        }
-    }
+    results = build_results([403, 403, 403])
     
     matched_count, total_count, percentage, all_passed = calculate_results(results)
     assert matched_count == 0
@@ -118,4 +116,18 @@ def test_write_results_to_file():
     finally:
         # Clean up the temporary file
         if os.path.exists(temp_path):
-            os.unlink(temp_path)
\ No newline at end of file
+            os.unlink(temp_path)
+
+def test_result_store():
+    results = build_results([200, 403, 200])
+    assert len(results) == 3
+    assert results.codes.itemsize == 2
+    assert list(results.codes) == [200, 403, 200]
+
+    # Recording out of order or re-recording keeps the counts consistent
+    results.record(5, 403)
+    results.record(0, 403)
+    assert results.counts == {200: 1, 403: 3}
+    assert len(results) == 4
+    assert results.status(4) == 0
+    assert list(results.codes) == [403, 403, 200, 0, 0, 403]
@@ -0,0 +1,88 @@
+import json
+
+from wafsmith.cmd.extract import extract
+from wafsmith.cmd.config import ExtractConfig
+from wafsmith.lib.accesslog import ExtractStats, extract_candidates, request_candidates
+
+LINES = [
+    '172.20.0.1 - - [14/Mar/2025:05:25:00 +0000] "GET /?payload=%3Cinput+type%3Dtext+value%3D%E2%80%9CXSS%E2%80%9D%3E HTTP/1.1" 200 13 "-" "axios/1.7.9" "-"',
+    '172.20.0.1 - - [14/Mar/2025:05:25:01 +0000] "GET /?payload=hello+world&page=2 HTTP/1.1" 200 13 "-" "Mozilla/5.0" "-"',
+    '172.20.0.1 - - [14/Mar/2025:05:25:02 +0000] "GET /?id=1%27+UNION+SELECT+password+FROM+users-- HTTP/1.1" 403 13 "-" "sqlmap/1.5" "-"',
+    '172.20.0.1 - - [14/Mar/2025:05:25:03 +0000] "GET /../../etc/passwd HTTP/1.1" 404 13 "-" "curl/8.0" "-"',
+    '172.20.0.1 - - [14/Mar/2025:05:25:04 +0000] "GET /products/42 HTTP/1.1" 200 13 "-" "Mozilla/5.0" "-"',
+    'not a log line',
+]
+
+
+def test_request_candidates_only_keeps_suspicious_values():
+    assert request_candidates(LINES[0].encode()) == ["<input type=text value=“XSS”>"]
+    assert request_candidates(LINES[1].encode()) == []
+    assert request_candidates(LINES[2].encode()) == ["1' UNION SELECT password FROM users--"]
+    assert request_candidates(LINES[3].encode()) == ["/../../etc/passwd"]
+    assert request_candidates(LINES[5].encode()) is None
+
+
+def test_chunks_cover_every_line_once(tmp_path):
+    log = tmp_path / "access.log"
+    # The same suspicious request recurs across chunk boundaries
+    log.write_text("\n".join(LINES * 50) + "\n")
+    reference = ExtractStats()
+    candidates = extract_candidates(str(log), stats=reference)
+
+    for chunk_size, workers in ((97, 0), (1000, 2)):
+        stats = ExtractStats()
+        chunked = extract_candidates(str(log), workers, chunk_size, stats)
+        assert stats.chunks > 1
+        assert chunked == candidates
+        assert (stats.lines, stats.requests, stats.occurrences) == (300, 250, 150)
+    assert (reference.lines, reference.requests) == (300, 250)
+    assert [candidate.count for candidate in candidates] == [50, 50, 50]
+    assert candidates[1].line.startswith('172.20.0.1 - - [14/Mar/2025:05:25:02 +0000] "GET /?id=1\'+UNION')
+
+
+def test_extract_writes_the_candidates_without_a_model(tmp_path):
+    (tmp_path / "logs").mkdir()
+    (tmp_path / "logs" / "access.log").write_text("\n".join(LINES) + "\n")
+    (tmp_path / "logs" / "access.log.1").write_text(LINES[2] + "\n")
+    output = tmp_path / "payloads.txt"
+
+    extract(ExtractConfig(input_path=str(tmp_path / "logs"), output_path=str(output)))
+
+    assert output.read_text().splitlines() == [
+        "<input type=text value=“XSS”>",
+        "1' UNION SELECT password FROM users--",
+        "/../../etc/passwd",
+    ]
+
+
+def test_extract_only_classifies_the_candidates(tmp_path, stub_llm):
+    def classify(messages):
+        entries = json.loads(messages[1]["content"].split("\n\n")[1])
+        return "```json\n" + json.dumps(
+            [
+                {"classification": "sqli", "extracted_payload": "1' UNION SELECT password FROM users--"}
+                if "UNION" in entry
+                else {"classification": "non-malicious", "extracted_payload": ""}
+                for entry in entries
+            ]
+        ) + "\n```"
+
+    stub_llm.respond = classify
+    (tmp_path / "access.log").write_text("\n".join(LINES) + "\n")
+    output = tmp_path / "payloads.txt"
+
+    extract(
+        ExtractConfig(
+            input_path=str(tmp_path / "access.log"),
+            output_path=str(output),
+            api_key="key",
+            model="stub",
+            base_url=stub_llm.url,
+            llm_cache_path=str(tmp_path / "llm.db"),
+        )
+    )
+
+    assert output.read_text().splitlines() == ["1' UNION SELECT password FROM users--"]
+    # The 3 candidates in a single call, the benign requests never reach the model
+    [messages] = stub_llm.calls
+    assert len(json.loads(messages[1]["content"].split("\n\n")[1])) == 3
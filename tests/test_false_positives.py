@@ -0,0 +1,69 @@
+import logging
+from unittest.mock import patch
+
+from wafsmith.cmd.evaluate import evaluate, EvaluateConfig, FalsePositives
+from wafsmith.lib.corpus import Corpus
+from wafsmith.lib.results import ERRORED, Outcome
+
+
+def make_config(tmp_path, host, **kwargs):
+    (tmp_path / "infra").mkdir()
+    (tmp_path / "payloads").mkdir()
+    (tmp_path / "payloads" / "p.txt").write_text("attack-1\nevaded-1\n")
+    (tmp_path / "traffic").mkdir()
+    (tmp_path / "traffic" / "a.txt").write_text("benign-1\n")
+    (tmp_path / "traffic" / "b.txt").write_text("benign-2\nattack-like search\nbenign-3\n")
+    return EvaluateConfig(
+        setup_dir=str(tmp_path / "infra"),
+        output_evaded_path=str(tmp_path / "evaded.txt"),
+        attack_payloads_dir=str(tmp_path / "payloads"),
+        traffic_payloads_dir=str(tmp_path / "traffic"),
+        threads=1,
+        host=host,
+        **kwargs,
+    )
+
+
+def test_false_positives_are_located(tmp_path):
+    (tmp_path / "a.txt").write_text("one\n")
+    (tmp_path / "b.txt").write_text("two\nthree\n")
+    corpus = Corpus(str(tmp_path))
+    assert list(corpus) == ["one", "two", "three"]
+    assert corpus.location(2) == "b.txt:2"
+
+    false_positives = FalsePositives(examples=1)
+    handle = false_positives.guard(lambda outcome: None)
+    for outcome in (Outcome(0, "one", 200), Outcome(1, "two", 403), Outcome(2, "three", ERRORED)):
+        handle(outcome)
+    assert false_positives.count == 1
+    assert false_positives.examples == [(None, Outcome(1, "two", 403))]
+
+
+@patch("wafsmith.cmd.evaluate.TestingEnv")
+def test_traffic_first_stops_before_the_attack_run(mock_env, tmp_path, waf_server, waf_requests, caplog):
+    config = make_config(tmp_path, waf_server, traffic_first=True, max_false_positives=1)
+
+    with caplog.at_level(logging.INFO):
+        evaluate(config)
+
+    # The batch in flight completes, the attack payloads are never sent
+    assert waf_requests[:3] == ["benign-1", "benign-2", "attack-like search"]
+    assert not any(p in waf_requests for p in ("attack-1", "evaded-1"))
+    assert "Business Traffic Simulation Status: failed" in caplog.text
+    assert "b.txt:2 403: attack-like search" in caplog.text
+    assert "Attack payloads were not tested" in caplog.text
+    assert "Evaded Payload(s)" not in caplog.text
+    assert mock_env.return_value.teardown.call_count == 1
+
+
+@patch("wafsmith.cmd.evaluate.TestingEnv")
+def test_traffic_first_without_limit_runs_everything(mock_env, tmp_path, waf_server, waf_requests, caplog):
+    config = make_config(tmp_path, waf_server, traffic_first=True)
+
+    with caplog.at_level(logging.INFO):
+        evaluate(config)
+
+    assert waf_requests[:4] == ["benign-1", "benign-2", "attack-like search", "benign-3"]
+    assert sorted(waf_requests[4:]) == ["attack-1", "evaded-1"]
+    assert "False Positive(s): 1 business traffic payload(s) blocked" in caplog.text
+    assert (tmp_path / "evaded.txt").read_text() == "evaded-1\n"
@@ -0,0 +1,92 @@
+import random
+from unittest.mock import patch
+
+import pytest
+
+from wafsmith.cmd.evaluate import evaluate, EvaluateConfig
+from wafsmith.lib.corpus import Corpus
+from wafsmith.lib.latency import Histogram, LatencyRecorder, LatencySummary, overhead
+from wafsmith.lib.payload import Engine, Location, process_payloads_in_parallel
+from wafsmith.lib.results import Outcome
+
+
+def test_histogram_percentiles_within_precision():
+    values = [random.uniform(0.0001, 2.0) for _ in range(10_000)]
+    histogram = Histogram()
+    for value in values:
+        histogram.record(value)
+
+    values.sort()
+    for p in (50, 95, 99):
+        exact = values[int(len(values) * p / 100) - 1]
+        assert histogram.percentile(p) == pytest.approx(exact, rel=0.01)
+    assert histogram.max == int(values[-1] * 1_000_000)
+    assert len(histogram.counts) < 2_000
+
+
+def test_recorder_groups_by_status_and_file(tmp_path):
+    (tmp_path / "a.txt").write_text("one\ntwo\n")
+    (tmp_path / "b.txt").write_text("three\n")
+    corpus = Corpus(str(tmp_path))
+    assert list(corpus) == ["one", "two", "three"]
+
+    recorder = LatencyRecorder(corpus.source)
+    recorder.record(Outcome(0, "one", 200, 0.01))
+    recorder.record(Outcome(1, "two", 403, 0.02))
+    recorder.record(Outcome(2, "three", 403, 0.03))
+    recorder.record(Outcome(2, "three", 403, 0.0, cached=True))
+
+    assert recorder.overall.count == 3
+    assert {code: s.count for code, s in recorder.by_status.items()} == {200: 1, 403: 2}
+    assert {file: s.count for file, s in recorder.by_file.items()} == {"a.txt": 2, "b.txt": 1}
+
+
+@pytest.mark.parametrize("engine", [Engine.THREAD, Engine.ASYNC])
+def test_requests_are_timed(engine, waf_server):
+    outcomes = []
+    process_payloads_in_parallel(
+        ["attack-1", "benign", "attack-2"], "GET", waf_server, Location.URL_PARAMETERS, 1,
+        engine=engine, concurrency=1, on_result=outcomes.append,
+    )
+    assert len(outcomes) == 3
+    for outcome in outcomes:
+        assert 0 < outcome.ttfb <= outcome.elapsed
+        assert outcome.connect <= outcome.ttfb
+    # a single keep-alive connection is opened, so only one request pays for it
+    assert sum(1 for o in outcomes if o.connect > 0) == 1
+
+
+def test_overhead():
+    waf, direct = LatencySummary(), LatencySummary()
+    for i in range(100):
+        waf.record(Outcome(i, "", 200, 0.010))
+        direct.record(Outcome(i, "", 200, 0.004))
+    rows = dict(overhead(waf, direct))
+    assert rows.keys() == {"p50", "p95", "p99", "max"}
+    assert all(value == pytest.approx(0.006, rel=0.02) for value in rows.values())
+
+
+def test_direct_comparison(tmp_path, waf_server, waf_requests):
+    (tmp_path / "payloads").mkdir()
+    (tmp_path / "payloads" / "p.txt").write_text("attack-1\nbenign\n")
+    (tmp_path / "traffic").mkdir()
+    (tmp_path / "traffic" / "t.txt").write_text("hello\n")
+    config = EvaluateConfig(
+        output_evaded_path=str(tmp_path / "evaded.txt"),
+        attack_payloads_dir=str(tmp_path / "payloads"),
+        traffic_payloads_dir=str(tmp_path / "traffic"),
+        host=waf_server,
+        direct=waf_server,
+    )
+    with patch("wafsmith.cmd.evaluate.TestingEnv") as mock_env, patch(
+        "wafsmith.cmd.evaluate.report_overhead"
+    ) as report:
+        mock_env.return_value.endpoints.side_effect = lambda host: [host]
+        evaluate(config)
+
+    # every payload is sent once through the WAF and once directly
+    assert sorted(waf_requests) == sorted(["attack-1", "benign", "hello"] * 2)
+    attack, traffic, direct = report.call_args.args
+    assert attack.overall.count == 2
+    assert traffic.overall.count == 1
+    assert direct.overall.count == 3
@@ -0,0 +1,170 @@
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from wafsmith.lib.limiter import AdaptiveLimiter, RetryPolicy
+from wafsmith.lib.payload import Engine, Location, process_payloads_in_parallel
+from wafsmith.lib.results import ERRORED
+
+
+class FlakyHandler(BaseHTTPRequestHandler):
+    """Answers 503 to the first attempt of every request, then 200."""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.attempts[self.path] = self.server.attempts.get(self.path, 0) + 1
+            first = self.server.attempts[self.path] == 1
+        self.send_response(503 if first else 200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def flaky_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FlakyHandler)
+    server.attempts = {}
+    server.lock = threading.Lock()
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_limit_grows_while_saturated_and_stable():
+    limiter = AdaptiveLimiter(max_limit=20, initial=2)
+    for _ in range(200):
+        window = int(limiter.limit)
+        for _ in range(window):
+            assert limiter.try_acquire()
+        assert not limiter.try_acquire()
+        for _ in range(window):
+            limiter.release(0.01)
+    assert limiter.limit == 20
+    assert limiter.peak == 20
+
+    # An idle window is not grown
+    limiter = AdaptiveLimiter(max_limit=20, initial=10)
+    for _ in range(100):
+        limiter.acquire()
+        limiter.release(0.01)
+    assert limiter.limit == 10
+
+
+def test_slow_start_reaches_the_maximum_within_a_few_windows():
+    limiter = AdaptiveLimiter(max_limit=500)
+    completed = 0
+    # Every completed request is replaced by as many as the limit allows
+    while limiter.try_acquire():
+        pass
+    while limiter.limit < 500:
+        limiter.release(0.01)
+        completed += 1
+        while limiter.try_acquire():
+            pass
+    # Doubling from 10: 10 + 20 + ... + 320 requests
+    assert completed <= 2 * 500
+    assert limiter.peak == 500
+
+    # Past the first backoff the limit grows by one per window
+    limiter.release(0.01, dropped=True)
+    for _ in range(400):
+        limiter.release(0.01)
+        while limiter.try_acquire():
+            pass
+    assert limiter.limit < 377
+
+
+def test_limit_backs_off_once_per_window():
+    limiter = AdaptiveLimiter(max_limit=100, initial=40, backoff=0.5)
+    for _ in range(10):
+        limiter.acquire()
+    for _ in range(10):
+        limiter.release(0.01, dropped=True)
+    assert limiter.limit == 20
+    assert limiter.drops == 10
+
+
+def test_limit_backs_off_on_latency():
+    limiter = AdaptiveLimiter(max_limit=100, initial=10, backoff=0.5)
+    for _ in range(50):
+        limiter.acquire()
+        limiter.release(0.01)
+    for _ in range(20):
+        limiter.acquire()
+        limiter.release(0.5)
+    assert limiter.limit < 10
+    assert limiter.drops == 0
+
+
+def test_retry_policy():
+    retry = RetryPolicy(retries=2, base_delay=0.1, max_delay=0.3)
+    assert retry.should_retry(ERRORED, 0)
+    assert retry.should_retry(503, 1)
+    assert not retry.should_retry(503, 2)
+    assert not retry.should_retry(403, 0)
+    assert not retry.should_retry(500, 0)
+    assert all(0 <= retry.delay(5) <= 0.3 for _ in range(100))
+
+
+@pytest.mark.parametrize("engine", [Engine.THREAD, Engine.ASYNC])
+def test_dropped_requests_are_retried(engine, flaky_server):
+    url = f"http://127.0.0.1:{flaky_server.server_address[1]}/"
+    payloads = [f"p{i}" for i in range(20)]
+    limiter = AdaptiveLimiter(max_limit=4)
+
+    results = process_payloads_in_parallel(
+        payloads, "GET", url, Location.URL_PARAMETERS, 4, engine=engine, concurrency=4,
+        limiter=limiter, retry=RetryPolicy(base_delay=0.001),
+    )
+    assert results.counts == {200: 20}
+    assert limiter.drops == 20
+    assert limiter.in_flight == 0
+
+    results = process_payloads_in_parallel(
+        ["fresh"], "GET", url, Location.URL_PARAMETERS, 1, engine=engine
+    )
+    assert results.counts == {503: 1}
+
+    # Still overloaded once its retries are spent, the request got no verdict
+    results = process_payloads_in_parallel(
+        ["spent"], "GET", url, Location.URL_PARAMETERS, 1, engine=engine,
+        retry=RetryPolicy(retries=0),
+    )
+    assert results.counts == {ERRORED: 1}
+
+
+@pytest.mark.parametrize("engine", [Engine.THREAD, Engine.ASYNC])
+def test_unreachable_waf_is_reported_as_errored(engine):
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+
+    results = process_payloads_in_parallel(
+        ["a", "b"], "GET", f"http://127.0.0.1:{port}/", Location.URL_PARAMETERS, 2,
+        engine=engine, retry=RetryPolicy(retries=1, base_delay=0.001),
+    )
+    assert results.counts == {ERRORED: 2}
+
+
+def test_limiter_is_shared_by_async_phases(flaky_server):
+    url = f"http://127.0.0.1:{flaky_server.server_address[1]}/"
+    # A limit of one keeps tasks waiting for a release in every phase, each
+    # phase running its own event loop
+    limiter = AdaptiveLimiter(max_limit=1)
+
+    for phase in ("attack", "traffic"):
+        results = process_payloads_in_parallel(
+            [f"{phase}{i}" for i in range(5)], "GET", url, Location.URL_PARAMETERS, 4,
+            engine=Engine.ASYNC, concurrency=4, limiter=limiter,
+            retry=RetryPolicy(base_delay=0.001),
+        )
+        assert results.counts == {200: 5}
+    assert limiter.in_flight == 0
@@ -0,0 +1,129 @@
+import re
+import json
+import time
+import asyncio
+
+from wafsmith.cmd.aggregate import aggregate
+from wafsmith.cmd.config import AggregateConfig, CreateConfig
+from wafsmith.cmd.create import create
+from wafsmith.lib.limiter import RetryPolicy
+from wafsmith.lib.llm import LLMClient, ResponseCache, Template, TokenBucket
+
+UPPER = Template(
+    "upper",
+    "You answer in JSON",
+    "Uppercase %%PAYLOAD%%",
+    lambda payload, value: value if isinstance(value, str) else None,
+    batch="Uppercase each of %%PAYLOADS%%",
+)
+
+
+def uppercase(messages):
+    prompt = messages[1]["content"]
+    if prompt.startswith("Uppercase each of "):
+        payloads = json.loads(prompt[len("Uppercase each of ") :])
+        # A batch holding "drop" is answered short
+        answers = [p.upper() for p in payloads if p != "drop"]
+        return json.dumps(answers)
+    return json.dumps(prompt[len("Uppercase ") :].upper())
+
+
+def test_batches_are_cached_per_payload(stub_llm, tmp_path):
+    stub_llm.respond = uppercase
+    payloads = [f"p{i}" for i in range(20)] + ["p1", "p2"]
+    cache = ResponseCache(str(tmp_path / "llm.db"))
+    client = LLMClient("stub", base_url=stub_llm.url, cache=cache)
+
+    assert client.ask(UPPER, payloads, batch_size=8) == [p.upper() for p in payloads]
+    # Identical payloads are asked about once, 8 per call
+    assert len(stub_llm.calls) == 3
+    assert client.batches == 3
+
+    # A rerun only asks about the payloads never seen
+    stub_llm.calls.clear()
+    client = LLMClient("stub", base_url=stub_llm.url, cache=cache)
+    assert client.ask(UPPER, ["p3", "p4", "new"], batch_size=8) == ["P3", "P4", "NEW"]
+    assert len(stub_llm.calls) == 1
+    assert stub_llm.calls[0][1]["content"] == "Uppercase new"
+
+    # Answers of a batch answered short are asked for again alone
+    stub_llm.calls.clear()
+    assert client.ask(UPPER, ["a", "drop", "b"], batch_size=3) == ["A", "DROP", "B"]
+    assert len(stub_llm.calls) == 4
+    assert client.fallbacks == 3
+
+    # Another model does not reuse the answers
+    other = LLMClient("other", base_url=stub_llm.url, cache=cache)
+    stub_llm.calls.clear()
+    other.ask(UPPER, ["p3"])
+    assert len(stub_llm.calls) == 1
+    cache.max_entries = 5
+    cache.close()
+    assert len(ResponseCache(str(tmp_path / "llm.db"))) == 5
+
+
+def test_rate_limit_and_retries(stub_llm):
+    stub_llm.respond = uppercase
+    stub_llm.failures = [429, 503]
+    client = LLMClient(
+        "stub",
+        base_url=stub_llm.url,
+        requests_per_minute=600,
+        retry=RetryPolicy(retries=3, base_delay=0.01, max_delay=0.01),
+    )
+    assert client.ask(UPPER, ["a"]) == ["A"]
+    assert client.calls == 3
+
+    async def burst():
+        bucket = TokenBucket(rate=20, capacity=1)
+        start = time.monotonic()
+        for _ in range(5):
+            await bucket.acquire()
+        return time.monotonic() - start
+
+    assert asyncio.run(burst()) >= 0.19
+
+
+def test_create_and_aggregate_rules(stub_llm, tmp_path):
+    def rules(messages):
+        prompt = messages[1]["content"]
+        if "# ModSecurity Rules" in prompt:
+            return 'Here you go:\nSecRule ARGS "@rx (?:union|sleep)" "id:1,phase:2,deny"\n'
+        payloads = re.search(r"^\[.*\]$", prompt, re.M)
+        answers = [
+            {"regex": re.escape(p[:5]), "rule": f'SecRule ARGS "@rx {re.escape(p[:5])}" "id:1,phase:2,deny"'}
+            for p in json.loads(payloads.group(0))
+        ]
+        return json.dumps(answers)
+
+    stub_llm.respond = rules
+    (tmp_path / "evaded.txt").write_text("union select 1\nsleep(5)\nunion select 2\n\n")
+    config = CreateConfig(
+        input_path=str(tmp_path / "evaded.txt"),
+        output_path=str(tmp_path / "rules.conf"),
+        model="stub",
+        base_url=stub_llm.url,
+        llm_cache_path=str(tmp_path / "llm.db"),
+    )
+    create(config)
+
+    created = (tmp_path / "rules.conf").read_text().splitlines()
+    # The two union payloads share a rule
+    assert len(created) == 2
+    assert len(stub_llm.calls) == 1
+    assert all(re.search(r"id:\d{13},", rule) for rule in created)
+    stub_llm.calls.clear()
+    create(config)
+    assert stub_llm.calls == []
+
+    aggregate(
+        AggregateConfig(
+            rules_path=str(tmp_path / "rules.conf"),
+            output_path=str(tmp_path / "aggregated.conf"),
+            model="stub",
+            base_url=stub_llm.url,
+            llm_cache=False,
+        )
+    )
+    [rule] = (tmp_path / "aggregated.conf").read_text().splitlines()
+    assert rule.startswith('SecRule ARGS "@rx (?:union|sleep)"')
@@ -0,0 +1,41 @@
+import os
+
+from wafsmith.lib.matcher import PhraseMatcher, load_matcher
+
+
+def test_overlapping_phrases_are_all_found():
+    matcher = PhraseMatcher({"shell": ["he", "she", "his", "hers"], "php": ["shell_exec"]})
+
+    assert matcher.matches("USHERS") == {"shell": {"he", "she", "hers"}}
+    assert matcher.matches("shell_exec(") == {"shell": {"he", "she"}, "php": {"shell_exec"}}
+    assert matcher.search("a SHELL_EXEC", "php")
+    assert not matcher.search("ushers", "php")
+    assert not matcher.search("ushers", "unknown")
+    assert not matcher.search("nothing")
+
+
+def test_scan_matches_a_corpus_in_one_pass():
+    matcher = PhraseMatcher({"lfi": ["/etc/passwd", "boot.ini"]})
+    corpus = ["../../etc/passwd", "benign", "c:\\BOOT.INI"]
+
+    assert list(matcher.scan(corpus)) == [
+        (0, {"lfi": {"/etc/passwd"}}),
+        (2, {"lfi": {"boot.ini"}}),
+    ]
+
+
+def test_load_matcher_is_cached_by_file_content(tmp_path):
+    data = tmp_path / "unix-shell.data"
+    data.write_text("# comment\n\nbin/sh\nnc -e\n")
+    cache_dir = tmp_path / "cache"
+
+    matcher = load_matcher([str(data)], str(cache_dir))
+    assert matcher.groups == ["unix-shell.data"]
+    assert matcher.search("/BIN/SH -i", "unix-shell.data")
+    assert len(os.listdir(cache_dir)) == 1
+    assert load_matcher([str(data)], str(cache_dir)).search("nc -e x")
+    assert len(os.listdir(cache_dir)) == 1
+
+    data.write_text("bin/bash\n")
+    assert not load_matcher([str(data)], str(cache_dir)).search("/bin/sh")
+    assert len(os.listdir(cache_dir)) == 2
@@ -0,0 +1,80 @@
+from unittest.mock import patch
+
+import pytest
+
+from wafsmith.cmd.evaluate import evaluate, EvaluateConfig
+from wafsmith.lib.dedup import Deduplicator
+from wafsmith.lib.payload import (
+    MATRIX_ALL,
+    Cell,
+    Encoding,
+    Lane,
+    Location,
+    process_matrix_in_parallel,
+)
+
+
+def test_cell_parse():
+    cell = Cell.parse("post:http_body:json")
+    assert cell == Cell("POST", Location.HTTP_BODY, Encoding.JSON)
+    assert str(cell) == "POST:http_body:json"
+    assert Cell.parse("GET:url_parameters") == Cell()
+    for spec in ("GET", "PUT:url_parameters", "GET:cookie", "POST:http_body:yaml"):
+        with pytest.raises(ValueError):
+            Cell.parse(spec)
+
+
+def test_config_cells():
+    assert EvaluateConfig(method="POST", position="http_body", encoding="xml").cells() == [
+        Cell("POST", Location.HTTP_BODY, Encoding.XML)
+    ]
+    config = EvaluateConfig(matrix=["GET:http_header,all", "POST:http_body:json"])
+    assert config.cells()[0] == Cell("GET", Location.HTTP_HEADER)
+    assert len(config.cells()) == len(MATRIX_ALL)
+    assert set(config.cells()) == set(MATRIX_ALL)
+
+
+def test_every_payload_is_sent_in_every_lane(waf_server, waf_requests):
+    payloads = ["attack-1", "benign", "attack-1", "benign-2"]
+    lanes = [
+        Lane(Cell("GET", Location.URL_PARAMETERS)),
+        Lane(Cell("GET", Location.HTTP_HEADER)),
+        Lane(Cell("POST", Location.HTTP_BODY, Encoding.JSON)),
+    ]
+    dedup = Deduplicator()
+
+    process_matrix_in_parallel(payloads, lanes, waf_server, 2, dedup=dedup)
+
+    # The duplicate is resolved once, for every lane
+    assert len(waf_requests) == 9
+    assert waf_requests.count('{"payload": "benign"}') == 1
+    for lane in lanes:
+        assert lane.results.counts == {403: 2, 200: 2}
+        assert list(lane.results.codes) == [403, 200, 403, 200]
+
+
+def test_matrix_evaluation(tmp_path, waf_server, waf_requests):
+    (tmp_path / "payloads").mkdir()
+    (tmp_path / "payloads" / "p.txt").write_text("attack-1\nbenign\n")
+    (tmp_path / "traffic").mkdir()
+    (tmp_path / "traffic" / "t.txt").write_text("hello\n")
+    config = EvaluateConfig(
+        output_evaded_path=str(tmp_path / "evaded.txt"),
+        index_path=str(tmp_path / "index.tsv"),
+        attack_payloads_dir=str(tmp_path / "payloads"),
+        traffic_payloads_dir=str(tmp_path / "traffic"),
+        host=waf_server,
+        matrix=["GET:url_parameters", "POST:http_body:xml"],
+    )
+    with patch("wafsmith.cmd.evaluate.TestingEnv") as mock_env:
+        mock_env.return_value.endpoints.side_effect = lambda host: [host]
+        evaluate(config)
+
+    # A single environment lifecycle for every cell
+    mock_env.return_value.setup.assert_called_once()
+    mock_env.return_value.teardown.assert_called_once()
+    assert len(waf_requests) == 6
+    assert (tmp_path / "evaded.GET-url_parameters-form.txt").read_text() == "benign\n"
+    assert (tmp_path / "evaded.POST-http_body-xml.txt").read_text() == "benign\n"
+    assert not (tmp_path / "evaded.txt").exists()
+    assert len((tmp_path / "index.tsv").read_text().splitlines()) == 6
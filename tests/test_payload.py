@@ -0,0 +1,73 @@
+import pickle
+
+import pytest
+
+from wafsmith.lib.payload import (
+    Encoding,
+    Engine,
+    Location,
+    prepare_request,
+    process_payloads_in_parallel,
+)
+
+
+@pytest.mark.parametrize("engine", [Engine.THREAD, Engine.ASYNC])
+@pytest.mark.parametrize(
+    "method,location",
+    [
+        ("GET", Location.URL_PARAMETERS),
+        ("GET", Location.HTTP_HEADER),
+        ("POST", Location.HTTP_BODY),
+    ],
+)
+def test_process_payloads_in_parallel_engines(waf_server, engine, method, location):
+    payloads = ["attack-1", "benign-1", "attack-2", "benign-2"]
+
+    results = process_payloads_in_parallel(
+        payloads, method, waf_server, location, 2, engine=engine, concurrency=2
+    )
+
+    assert results.counts == {403: 2, 200: 2}
+    assert list(results.codes) == [403, 200, 403, 200]
+
+
+def test_async_engine_bounded_by_concurrency(waf_server):
+    payloads = [f"benign-{i}" for i in range(50)]
+
+    results = process_payloads_in_parallel(
+        payloads, "GET", waf_server, Location.URL_PARAMETERS, 1,
+        engine=Engine.ASYNC, concurrency=5,
+    )
+
+    assert list(results.codes) == [200] * len(payloads)
+
+
+def test_prepare_request():
+    request = prepare_request("1 OR 1=1&x", "GET", Location.URL_PARAMETERS)
+    assert request.url("http://waf/") == "http://waf/?payload=1+OR+1%3D1%26x"
+    assert request.url("http://waf/?a=b") == "http://waf/?a=b&payload=1+OR+1%3D1%26x"
+    assert request.body is None
+
+    request = prepare_request("<x>", "POST", Location.HTTP_BODY, Encoding.XML)
+    assert request.body == b"<payload>&lt;x&gt;</payload>"
+    assert request.headers == {"Content-Type": "application/xml"}
+    assert prepare_request('"', "POST", Location.HTTP_BODY, Encoding.JSON).body == b'{"payload": "\\""}'
+
+    request = prepare_request("attack", "POST", Location.HTTP_HEADER)
+    assert request.headers == {"x-payload": "attack"}
+    assert request.url("http://waf/") == "http://waf/"
+
+    copy = pickle.loads(pickle.dumps(request))
+    assert (copy.payload, copy.method, copy.headers) == ("attack", "POST", {"x-payload": "attack"})
+
+
+def test_requests_prepared_in_worker_processes(waf_server, waf_requests):
+    payloads = [f"attack-{i}" if i % 3 == 0 else f"benign-{i}" for i in range(30)]
+
+    results = process_payloads_in_parallel(
+        payloads, "POST", waf_server, Location.HTTP_BODY, 2,
+        batch_size=4, prepare_workers=2,
+    )
+
+    assert results.counts == {403: 10, 200: 20}
+    assert sorted(waf_requests) == sorted(payloads)
@@ -0,0 +1,88 @@
+import json
+import time
+
+from wafsmith.cmd.config import ProfileConfig
+from wafsmith.cmd.profile import profile
+from wafsmith.lib.profiler import (
+    LINEAR,
+    RegexRule,
+    RuleProfiler,
+    adversarial_inputs,
+    compile_rule,
+    iter_regex_rules,
+)
+
+RULES = r"""
+SecRule ARGS "@rx ^(a+)+$" "id:2001,phase:2,deny"
+SecRule ARGS "@rx \s+$" "id:2002,phase:2,deny"
+SecRule ARGS "@rx (?i)union\s+select" "id:2003,phase:2,deny,chain"
+    SecRule ARGS "@rx ([" "phase:2"
+SecRule ARGS "@pm sleep(" "id:2004,phase:2,deny"
+SecRule ARGS "@rx select.*%{tx.table}" "id:2005,phase:2,deny"
+"""
+
+
+def test_rules_and_adversarial_inputs(tmp_path):
+    (tmp_path / "rules.conf").write_text(RULES)
+
+    rules = list(iter_regex_rules(str(tmp_path)))
+
+    # Chained links carry the id of the chain, macros are only known at runtime
+    assert [(rule.id, rule.pattern) for rule in rules] == [
+        (2001, "^(a+)+$"),
+        (2002, r"\s+$"),
+        (2003, r"(?i)union\s+select"),
+        (2003, "(["),
+    ]
+    attacks = adversarial_inputs(compile_rule("1' (ORDER|[A-Z]+) [^-]+--").pattern)
+    assert ("1' ", "A", "!") in attacks
+    assert ("1' ORDER ", "a", "!") in attacks
+    assert adversarial_inputs("([") == []
+
+
+def test_profile_ranks_pathological_rules_first(tmp_path):
+    (tmp_path / "rules.conf").write_text(RULES)
+    (tmp_path / "attacks.txt").write_text("1 union select 2\n<script>\n")
+    (tmp_path / "traffic.txt").write_text("a=b\nhello\n")
+
+    results = profile(
+        ProfileConfig(
+            rules_path=str(tmp_path / "rules.conf"),
+            attack_payloads_dir=str(tmp_path / "attacks.txt"),
+            traffic_payloads_dir=str(tmp_path / "traffic.txt"),
+            report_path=str(tmp_path / "profile.jsonl"),
+            timeout=1.0,
+        )
+    )
+
+    assert [(r.rule.id, r.verdict) for r in results] == [
+        (2001, "catastrophic"),
+        (2002, "super-linear"),
+        (2003, "invalid"),
+        (2003, "linear"),
+    ]
+    assert results[0].attack[:3] == ("", "a", "!")
+    assert results[1].exponent >= 1.5
+    records = [json.loads(line) for line in (tmp_path / "profile.jsonl").read_text().splitlines()]
+    linear = records[-1]
+    assert linear["attack payload"]["matches"] == 1
+    assert (linear["business traffic"]["values"], linear["business traffic"]["matches"]) == (2, 0)
+    assert "attack" not in linear and records[1]["attack"]["pump"] == " "
+
+
+def test_timeout_bounds_a_value_and_not_the_corpus():
+    corpus = ["a" * 2000 + str(n) for n in range(10000)]
+    rule = RegexRule(2006, r"(?i)union\s+select", "rules.conf")
+    # Searching the whole corpus takes several times the timeout, whatever
+    # the speed of the host, no value comes close to it
+    pattern = compile_rule(rule.pattern)
+    start = time.thread_time()
+    for value in corpus:
+        pattern.search(value)
+    timeout = (time.thread_time() - start) / 4
+
+    with RuleProfiler({"attack": corpus}, timeout=timeout) as profiler:
+        result = profiler.profile(rule)
+
+    assert result.verdict == LINEAR
+    assert result.values == 10000
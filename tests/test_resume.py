@@ -0,0 +1,66 @@
+from unittest.mock import patch
+
+import pytest
+
+from wafsmith.cmd.evaluate import evaluate, EvaluateConfig
+from wafsmith.lib.payload import Location, process_payloads_in_parallel
+
+
+@pytest.fixture(autouse=True)
+def no_environment():
+    with patch("wafsmith.cmd.evaluate.TestingEnv"), patch(
+        "wafsmith.cmd.evaluate.time.sleep"
+    ):
+        yield
+
+
+def make_config(tmp_path, host, payloads, resume=False):
+    (tmp_path / "payloads").mkdir(exist_ok=True)
+    (tmp_path / "traffic").mkdir(exist_ok=True)
+    (tmp_path / "payloads" / "payloads.txt").write_text("\n".join(payloads) + "\n")
+    (tmp_path / "traffic" / "traffic.txt").write_text("benign-traffic\n")
+    return EvaluateConfig(
+        setup_dir=str(tmp_path),
+        output_evaded_path=str(tmp_path / "evaded.txt"),
+        attack_payloads_dir=str(tmp_path / "payloads"),
+        traffic_payloads_dir=str(tmp_path / "traffic"),
+        index_path=str(tmp_path / "index"),
+        resume=resume,
+        host=host,
+    )
+
+
+def test_skip_records_known_status_without_sending(waf_server, waf_requests):
+    known = {"attack-1": 403}
+    sent = []
+
+    results = process_payloads_in_parallel(
+        ["attack-1", "benign-1"], "GET", waf_server, Location.URL_PARAMETERS, 1,
+        on_result=sent.append, skip=known.get,
+    )
+
+    assert waf_requests == ["benign-1"]
+    assert [outcome.payload for outcome in sent] == ["benign-1"]
+    assert results.counts == {403: 1, 200: 1}
+
+
+def test_resume_skips_tested_payloads(tmp_path, waf_server, waf_requests):
+    # First run is interrupted after the first two payloads
+    evaluate(make_config(tmp_path, waf_server, ["attack-1", "evaded-1"]))
+    assert (tmp_path / "evaded.txt").read_text() == "evaded-1\n"
+    waf_requests.clear()
+
+    corpus = ["attack-1", "evaded-1", "attack-2", "evaded-2"]
+    with patch("wafsmith.cmd.evaluate.logger") as logger:
+        evaluate(make_config(tmp_path, waf_server, corpus, resume=True))
+
+    assert sorted(waf_requests) == ["attack-2", "evaded-2"]
+    assert (tmp_path / "evaded.txt").read_text() == "evaded-1\nevaded-2\n"
+    # The summary still covers the whole corpus
+    logger.warning.assert_any_call("Evaded Payload(s): 2/4 (50.00%)")
+
+
+def test_resume_requires_index(tmp_path):
+    config = make_config(tmp_path, "http://127.0.0.1/", ["attack-1"], resume=True)
+    config.index_path = None
+    assert not config.validate()
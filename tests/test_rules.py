@@ -0,0 +1,166 @@
+from unittest.mock import patch
+
+import pytest
+
+from wafsmith.cmd.evaluate import evaluate, EvaluateConfig
+from wafsmith.lib.payload import Location, process_payloads_in_parallel
+from wafsmith.lib.rules import RuleSet, translate_pcre
+
+RULES = r"""
+SecRule ARGS "@rx (?i)union\s+select" \
+    "id:1001,phase:2,block,t:none,t:urlDecodeUni,severity:'CRITICAL',\
+    tag:'paranoia-level/1',\
+    setvar:'tx.inbound_anomaly_score_pl1=+%{tx.critical_anomaly_score}'"
+SecRule ARGS "@pm sleep( benchmark(" \
+    "id:1002,phase:2,block,t:none,t:lowercase,severity:'WARNING',\
+    setvar:'tx.inbound_anomaly_score_pl1=+%{tx.warning_anomaly_score}'"
+SecRule ARGS "@pmFromFile shells.data" \
+    "id:1003,phase:2,block,t:none,t:cmdLine,severity:'CRITICAL',\
+    setvar:'tx.inbound_anomaly_score_pl1=+%{tx.critical_anomaly_score}'"
+SecRule ARGS "@rx <script" \
+    "id:1004,phase:2,block,severity:'CRITICAL',\
+    setvar:'tx.inbound_anomaly_score_pl2=+%{tx.critical_anomaly_score}'"
+SecRule ARGS "@rx ^removed$" \
+    "id:1005,phase:2,block,severity:'CRITICAL',\
+    setvar:'tx.inbound_anomaly_score_pl1=+%{tx.critical_anomaly_score}'"
+SecRule ARGS "@rx chained" \
+    "id:1006,phase:2,block,severity:'CRITICAL',chain"
+    SecRule MATCHED_VARS "@rx x" \
+        "setvar:'tx.inbound_anomaly_score_pl1=+%{tx.critical_anomaly_score}'"
+SecRule ARGS "@detectSQLi" \
+    "id:1007,phase:2,block,severity:'CRITICAL',\
+    setvar:'tx.inbound_anomaly_score_pl1=+%{tx.critical_anomaly_score}'"
+SecRule REQUEST_HEADERS:User-Agent "@rx curl" \
+    "id:1008,phase:2,block,severity:'CRITICAL',\
+    setvar:'tx.inbound_anomaly_score_pl1=+%{tx.critical_anomaly_score}'"
+"""
+
+
+@pytest.fixture
+def setup_dir(tmp_path):
+    (tmp_path / "rules").mkdir()
+    (tmp_path / "rules-tuning").mkdir()
+    (tmp_path / "rules" / "REQUEST-999-TEST.conf").write_text(RULES)
+    (tmp_path / "rules" / "shells.data").write_text("# shells\nnc -e\n/bin/sh\n")
+    (tmp_path / "rules-tuning" / "REQUEST-900-EXCLUSION-RULES-BEFORE-CRS.conf").write_text(
+        "SecRuleRemoveById 1005\n"
+    )
+    (tmp_path / "docker-compose.yml").write_text(
+        "    BLOCKING_PARANOIA: 1\n    ANOMALY_INBOUND: 5\n"
+    )
+    return str(tmp_path)
+
+
+def test_ruleset_scores_screenable_rules(setup_dir):
+    ruleset = RuleSet.load(setup_dir)
+
+    assert sorted(rule.id for rule in ruleset.rules) == [1001, 1002, 1003, 1008]
+    assert ruleset.skipped == 2  # the chain and libinjection are left to the WAF
+    assert ruleset.score("1 UNION%20SELECT 2") == (5, [1001])
+    assert ruleset.score("SLEEP(5)") == (3, [1002])
+    assert ruleset.score("; /bin/'s'h") == (5, [1003])
+    assert ruleset.score("removed") == (0, [])
+    assert ruleset.score("<script>") == (0, [])  # paranoia level 2
+    assert ruleset.verdict("union select") == 403
+    # PCRE's \s is ASCII only, ModSecurity lets a no-break space through
+    assert ruleset.verdict("union\u00a0select") is None
+    assert ruleset.verdict("sleep(1)") is None
+    assert ruleset.verdict("union select", Location.HTTP_HEADER) is None
+
+
+def test_tuning_exclusions_are_honoured(setup_dir, tmp_path):
+    (tmp_path / "rules" / "REQUEST-999-TEST.conf").write_text(
+        RULES
+        + "SecRule ARGS|!ARGS:payload \"@rx own\" \"id:1009,phase:2,block,severity:'CRITICAL',"
+        + "setvar:'tx.inbound_anomaly_score_pl1=+%{tx.critical_anomaly_score}'\"\n"
+    )
+    (tmp_path / "rules-tuning" / "REQUEST-900-EXCLUSION-RULES-BEFORE-CRS.conf").write_text(
+        'SecRuleUpdateTargetById 1001 1003 "!ARGS:payload"\n'
+        'SecRuleRemoveByTag "paranoia-level/1"\n'
+        'SecRuleUpdateTargetByMsg "nothing" "!ARGS"\n'
+        'SecRuleUpdateTargetById 1002 "ARGS:other" "ARGS"\n'
+        'SecRule REQUEST_URI "@rx ^/$" "id:1010,phase:1,pass,nolog,'
+        'ctl:ruleRemoveTargetById=1008;REQUEST_HEADERS:User-Agent"\n'
+    )
+    ruleset = RuleSet.load(setup_dir)
+
+    assert sorted(rule.id for rule in ruleset.rules) == [1003, 1005, 1008, 1009]
+    assert ruleset.skipped == 3  # the target of 1002 is replaced
+    assert ruleset.verdict("union select") is None
+    assert ruleset.verdict("; /bin/sh") is None
+    assert ruleset.verdict("own") is None
+    assert ruleset.verdict("removed") == 403
+    assert ruleset.verdict("curl", Location.HTTP_HEADER) is None
+
+
+def test_paranoia_level_follows_the_compose_file(setup_dir, tmp_path):
+    (tmp_path / "docker-compose.yml").write_text("    BLOCKING_PARANOIA: 2\n    ANOMALY_INBOUND: 3\n")
+    ruleset = RuleSet.load(setup_dir)
+
+    assert ruleset.verdict("<script>") == 403
+    assert ruleset.verdict("sleep(1)") == 403
+
+
+def test_translate_pcre():
+    assert translate_pcre(r"^(?i)up") == r"(?i)^up"
+    assert translate_pcre(r"a\z") == r"a\Z"
+    assert translate_pcre(r"a\\z") == r"a\\z"
+
+
+def test_crs_ruleset_loads():
+    ruleset = RuleSet.load("cli-app/infra")
+    assert len(ruleset.rules) > 100
+    assert ruleset.verdict("<script>alert(1)</script>") == 403
+    assert ruleset.verdict("hello world") is None
+
+
+def test_hybrid_mode_only_sends_undecided_payloads(setup_dir, tmp_path, waf_server, waf_requests):
+    (tmp_path / "payloads").mkdir()
+    (tmp_path / "payloads" / "p.txt").write_text("union select attack\nattack-1\nbenign\n")
+    (tmp_path / "traffic").mkdir()
+    config = EvaluateConfig(
+        setup_dir=setup_dir,
+        output_evaded_path=str(tmp_path / "evaded.txt"),
+        attack_payloads_dir=str(tmp_path / "payloads"),
+        traffic_payloads_dir=str(tmp_path / "traffic"),
+        host=waf_server,
+        mode="hybrid",
+    )
+    with patch("wafsmith.cmd.evaluate.TestingEnv") as mock_env:
+        evaluate(config)
+
+    assert sorted(waf_requests) == ["attack-1", "benign"]
+    mock_env.return_value.setup.assert_called_once()
+    assert (tmp_path / "evaded.txt").read_text() == "benign\n"
+
+
+def test_offline_mode_never_deploys(setup_dir, tmp_path, waf_server, waf_requests):
+    (tmp_path / "payloads").mkdir()
+    (tmp_path / "payloads" / "p.txt").write_text("union select\nattack-1\n")
+    (tmp_path / "traffic").mkdir()
+    config = EvaluateConfig(
+        setup_dir=setup_dir,
+        output_evaded_path=str(tmp_path / "evaded.txt"),
+        attack_payloads_dir=str(tmp_path / "payloads"),
+        traffic_payloads_dir=str(tmp_path / "traffic"),
+        host=waf_server,
+        mode="offline",
+    )
+    with patch("wafsmith.cmd.evaluate.TestingEnv") as mock_env:
+        evaluate(config)
+
+    assert waf_requests == []
+    mock_env.return_value.setup.assert_not_called()
+    mock_env.return_value.teardown.assert_not_called()
+    assert (tmp_path / "evaded.txt").read_text() == "attack-1\n"
+
+
+def test_screen_hits_are_not_sent(waf_server, waf_requests):
+    outcomes = []
+    results = process_payloads_in_parallel(
+        ["blocked", "attack-1"], "GET", waf_server, Location.URL_PARAMETERS, 1,
+        on_result=outcomes.append, screen={"blocked": 403}.get,
+    )
+    assert waf_requests == ["attack-1"]
+    assert results.counts == {403: 2}
+    assert [o.cached for o in outcomes] == [True, False]
@@ -0,0 +1,45 @@
+import pytest
+
+from wafsmith.lib.payload import Engine, Location, process_payloads_in_parallel
+from wafsmith.lib.session import ConnectionStats, SessionPool
+
+
+def test_connection_stats():
+    stats = ConnectionStats(requests=10, connections=2)
+    assert stats.reused == 8
+    assert stats.reuse_ratio == 80.0
+    assert ConnectionStats().reuse_ratio == 0
+
+
+@pytest.mark.parametrize("engine", [Engine.THREAD, Engine.ASYNC])
+def test_pool_reuses_connections(waf_server, engine):
+    pool = SessionPool(pool_size=2, timeout=5)
+    payloads = [f"benign-{i}" for i in range(20)]
+
+    try:
+        results = process_payloads_in_parallel(
+            payloads, "GET", waf_server, Location.URL_PARAMETERS, 2,
+            engine=engine, concurrency=2, pool=pool,
+        )
+        stats = pool.stats()
+    finally:
+        pool.close()
+
+    assert results.count(200) == 20
+    assert stats.requests == 20
+    assert 1 <= stats.connections <= 2
+
+
+def test_pool_without_keep_alive(waf_server):
+    pool = SessionPool(pool_size=1, keep_alive=False)
+    payloads = [f"benign-{i}" for i in range(5)]
+
+    try:
+        process_payloads_in_parallel(
+            payloads, "GET", waf_server, Location.URL_PARAMETERS, 1, pool=pool
+        )
+        stats = pool.stats()
+    finally:
+        pool.close()
+
+    assert stats.connections == 5
@@ -0,0 +1,90 @@
+import json
+import time
+
+import pytest
+
+from wafsmith.lib.results import Outcome
+from wafsmith.lib.writer import (
+    ATTACK,
+    TRAFFIC,
+    ResultWriter,
+    load_index,
+    payload_key,
+)
+
+
+def test_writer_streams_evaded_results_and_index(tmp_path):
+    evaded = tmp_path / "evaded.txt"
+    results = tmp_path / "results.jsonl"
+    index = tmp_path / "index"
+
+    with ResultWriter(str(evaded), str(results), str(index)) as writer:
+        writer.write(Outcome(0, "attack-1", 403, 0.01), ATTACK)
+        writer.write(Outcome(1, "attack-2", 200, 0.02), ATTACK)
+        writer.write(Outcome(0, "traffic-1", 200, 0.03), TRAFFIC)
+
+    assert evaded.read_text() == "attack-2\n"
+    assert writer.evaded_count == 1
+
+    records = [json.loads(line) for line in results.read_text().splitlines()]
+    assert [r["payload"] for r in records] == ["attack-1", "attack-2", "traffic-1"]
+    assert records[1] == {
+        "kind": ATTACK, "index": 1, "payload": "attack-2", "status": 200, "latency": 0.02,
+        "connect": 0.0, "ttfb": 0.0, "cached": False,
+    }
+
+    assert load_index(str(index)) == {
+        payload_key(ATTACK, "attack-1"): 403,
+        payload_key(ATTACK, "attack-2"): 200,
+        payload_key(TRAFFIC, "traffic-1"): 200,
+    }
+
+
+def test_writer_resume_appends(tmp_path):
+    evaded = tmp_path / "evaded.txt"
+    index = tmp_path / "index"
+
+    with ResultWriter(str(evaded), index_path=str(index)) as writer:
+        writer.write(Outcome(0, "attack-1", 200))
+    with ResultWriter(str(evaded), index_path=str(index), resume=True) as writer:
+        writer.write(Outcome(1, "attack-2", 200))
+
+    assert evaded.read_text() == "attack-1\nattack-2\n"
+    assert len(load_index(str(index))) == 2
+
+
+def test_writer_flushes_before_close(tmp_path):
+    evaded = tmp_path / "evaded.txt"
+    writer = ResultWriter(str(evaded), flush_every=1)
+    writer.start()
+    writer.write(Outcome(0, "attack-1", 200))
+
+    # Nothing waits for close(): the line is on disk once flushed
+    for _ in range(100):
+        if evaded.exists() and evaded.read_text() == "attack-1\n":
+            break
+        time.sleep(0.01)
+    assert evaded.read_text() == "attack-1\n"
+    writer.close()
+
+
+def test_no_evaded_file_without_evasions(tmp_path):
+    evaded = tmp_path / "evaded.txt"
+    with ResultWriter(str(evaded)) as writer:
+        writer.write(Outcome(0, "attack-1", 403))
+    assert not evaded.exists()
+
+
+def test_load_index_ignores_torn_lines(tmp_path):
+    index = tmp_path / "index"
+    key = payload_key(ATTACK, "attack-1")
+    index.write_text(f"{key}\t403\n{key[:10]}")
+    assert load_index(str(index)) == {key: 403}
+    assert load_index(str(tmp_path / "missing")) == {}
+
+
+def test_writer_surfaces_errors(tmp_path):
+    writer = ResultWriter(results_path=str(tmp_path / "missing" / "results.jsonl"))
+    writer.start()
+    with pytest.raises(FileNotFoundError):
+        writer.close()
@@ -0,0 +1,103 @@
+import time
+import logging
+from typing import Any, List, Optional
+from wafsmith.lib.console import console
+from wafsmith.cmd.config import AggregateConfig
+from wafsmith.lib.corpus import iter_file_content
+from wafsmith.lib.llm import Template
+from wafsmith.lib.rules import assign_rule_ids
+from wafsmith.lib.prompts import AGGREGATE_SYSTEM_PROMPT_1, AGGREGATE_USER_PROMPT_1
+
+logger = logging.getLogger("aggregate")
+
+
+def run(
+    rules_path: str,
+    output_file: str,
+    traffic_path: Optional[str] = None,
+    api_key: Optional[str] = None,
+    base_url: Optional[str] = None,
+    model: Optional[str] = None,
+    requests_per_minute: Optional[float] = None,
+    llm_cache: bool = True,
+    llm_cache_path: Optional[str] = None,
+):
+    config = AggregateConfig(
+        rules_path=rules_path,
+        output_path=output_file,
+        traffic_path=traffic_path,
+        api_key=api_key,
+        base_url=base_url,
+        model=model,
+        requests_per_minute=requests_per_minute,
+        llm_cache=llm_cache,
+        llm_cache_path=llm_cache_path,
+    )
+    if not config.validate():
+        logger.error("Configuration validation failed.")
+        return
+
+    start_time = time.time()
+    aggregate(config)
+    logger.info(f"Aggregate ModSecurity Rules: {time.time() - start_time:.2f}s")
+
+
+def parse_rules(rules: str, value: Any) -> Optional[List[str]]:
+    """
+    parse_rules returns the rules of a response, one per line, None if it holds none
+    """
+    lines = [line.strip() for line in value.splitlines()]
+    aggregated = [line for line in lines if line.startswith("SecRule")]
+    return aggregated or None
+
+
+def aggregate_template(traffic: List[str]) -> Template:
+    """
+    aggregate_template returns the prompts aggregating rules that must let the business traffic through
+    """
+    return Template(
+        "aggregate",
+        AGGREGATE_SYSTEM_PROMPT_1,
+        AGGREGATE_USER_PROMPT_1.replace("%%BUSINESS_TRAFFIC%%", "\n".join(traffic)),
+        parse_rules,
+        placeholder="%%MODSECURITY_RULES%%",
+        json=False,
+    )
+
+
+def aggregate(config: AggregateConfig):
+    logger.info("Starting rule aggregation workflow")
+    step = 1
+    total_steps = 2
+
+    rules = [
+        rule for rule in iter_file_content(config.rules_path) if rule.startswith("SecRule")
+    ]
+    if not rules:
+        logger.warning(f"No rules to aggregate in {config.rules_path}")
+        return
+    traffic = list(iter_file_content(config.traffic_path)) if config.traffic_path else []
+    client = config.client()
+    try:
+        # Step 1: Ask for the rules merged, a single call for the whole set
+        with console.status(f"Aggregating {len(rules)} rule(s)"):
+            [aggregated] = client.ask(aggregate_template(traffic), ["\n".join(rules)])
+    finally:
+        if client.cache is not None:
+            client.cache.close()
+    logger.info(f"[{step}/{total_steps}] Completed aggregation of rules")
+    logger.info(f"Model: {client}")
+    step += 1
+
+    # Step 2: Write the aggregated rules with ids of their own
+    if aggregated:
+        aggregated = assign_rule_ids(aggregated)
+        with open(config.output_path, "w") as f:
+            for rule in aggregated:
+                f.write(rule + "\n")
+        logger.info(
+            f"[{step}/{total_steps}] Aggregated {len(rules)} rule(s) into {len(aggregated)}"
+        )
+        logger.info(f"Written rules to {config.output_path}")
+    else:
+        logger.warning(f"[{step}/{total_steps}] No aggregated rules")
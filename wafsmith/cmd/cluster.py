@@ -0,0 +1,73 @@
+import json
+import time
+import logging
+from typing import Optional
+from wafsmith.lib.console import console
+from wafsmith.cmd.config import ClusterConfig
+from wafsmith.lib.corpus import iter_file_content
+from wafsmith.lib.cluster import (
+    DEFAULT_NGRAM,
+    DEFAULT_NUM_PERM,
+    DEFAULT_THRESHOLD,
+    PayloadClusterer,
+)
+
+logger = logging.getLogger("cluster")
+
+
+def run(
+    input_path: str,
+    output_file: str,
+    members_file: Optional[str] = None,
+    similarity: float = DEFAULT_THRESHOLD,
+    num_perm: int = DEFAULT_NUM_PERM,
+    ngram: int = DEFAULT_NGRAM,
+):
+    config = ClusterConfig(
+        input_path=input_path,
+        output_path=output_file,
+        members_path=members_file,
+        similarity=similarity,
+        num_perm=num_perm,
+        ngram=ngram,
+    )
+    if not config.validate():
+        logger.error("Configuration validation failed.")
+        return
+
+    start_time = time.time()
+    cluster(config)
+    logger.info(f"Cluster Payloads: {time.time() - start_time:.2f}s")
+
+
+def cluster(config: ClusterConfig):
+    logger.info("Starting payload clustering workflow")
+    step = 1
+    total_steps = 2
+
+    # Step 1: Group the payloads into families of near-identical variants
+    payloads = [payload for payload in iter_file_content(config.input_path) if payload]
+    clusterer = PayloadClusterer(config.similarity, config.num_perm, config.ngram)
+    with console.status(f"Clustering {len(payloads)} payload(s)"):
+        clusters = clusterer.cluster(payloads)
+    logger.info(
+        f"[{step}/{total_steps}] Clustered {len(payloads)} payload(s) into {len(clusters)} cluster(s) "
+        f"({clusterer.comparisons} comparison(s))"
+    )
+    for family in clusters[:10]:
+        logger.info(
+            f"Cluster: {family.count} payload(s) like {family.representative!r}",
+            extra={"markup": False},
+        )
+    step += 1
+
+    # Step 2: Write one representative per line, as create reads them, and
+    # the members of every cluster when asked for
+    with open(config.output_path, "w") as f:
+        for family in clusters:
+            f.write(family.representative + "\n")
+    if config.members_path:
+        with open(config.members_path, "w") as f:
+            for family in clusters:
+                f.write(json.dumps(family._asdict()) + "\n")
+    logger.info(f"[{step}/{total_steps}] Written representatives to {config.output_path}")
@@ -1,7 +1,15 @@
 import os
 import logging
-from typing import List, Optional
+from typing import List, Optional, Tuple
 from pydantic import BaseModel
+from wafsmith.lib.corpus import Corpus, iter_file_content
+from wafsmith.lib.dedup import Deduplicator
+from wafsmith.lib.audit import DEFAULT_AUDIT_LOG
+from wafsmith.lib.accesslog import DEFAULT_CHUNK_SIZE
+from wafsmith.lib.cluster import DEFAULT_NGRAM, DEFAULT_NUM_PERM, DEFAULT_THRESHOLD
+from wafsmith.lib.llm import LLMClient, ResponseCache
+from wafsmith.lib.matcher import default_cache_dir
+from wafsmith.lib.payload import ENCODINGS, LOCATIONS, MATRIX_ALL, Cell, Encoding, Location
 
 logger = logging.getLogger("config")
 
@@ -12,13 +20,48 @@ class EvaluateConfig(BaseModel):
     attack_payloads_dir: str = "./payloads/"
 
     output_evaded_path: Optional[str] = None
+    output_results_path: Optional[str] = None
+    index_path: Optional[str] = None
+    resume: bool = False
+    checkpoint_interval: float = 1.0
+    cache_path: Optional[str] = None
+    cache_size: int = 1_000_000
+    delta: bool = False
+    traffic_first: bool = False
+    max_false_positives: int = 0
+    audit_log: Optional[str] = None
+    attribution_path: Optional[str] = None
     traffic_payloads_dir: Optional[str] = None
     traffic_payloads: List[str] = []
 
     position: str = "url_parameters"
     method: str = "GET"
+    encoding: str = "form"
+    matrix: List[str] = []
     threads: int = 5
-    host: str = "http://localhost:3000"
+    engine: str = "thread"
+    concurrency: int = 100
+    pool_size: Optional[int] = None
+    timeout: Optional[float] = 30
+    keep_alive: bool = True
+    batch_size: int = 1000
+    prepare_workers: int = 0
+    dedup: bool = True
+    normalize: bool = False
+    dedup_on_disk: bool = False
+    attach: bool = False
+    ready_timeout: float = 60
+    replicas: int = 1
+    replica_base_port: int = 8081
+    balance: str = "round-robin"
+    mode: str = "online"
+    direct: Optional[str] = None
+    adaptive: bool = True
+    retries: int = 3
+    coordinator: Optional[str] = None
+    lease_timeout: float = 120
+    coordinator_token: Optional[str] = None
+    host: str = "http://localhost/"
 
     def validate(self) -> bool:
         ok = True
@@ -46,8 +89,162 @@ class EvaluateConfig(BaseModel):
             logger.error("failed to find payload directory")
             ok = False
 
+        if self.engine not in ("thread", "async"):
+            logger.error(f"unsupported engine: {self.engine}")
+            ok = False
+
+        if self.concurrency < 1:
+            logger.error("concurrency must be at least 1")
+            ok = False
+
+        if self.pool_size is not None and self.pool_size < 1:
+            logger.error("connection pool size must be at least 1")
+            ok = False
+
+        if self.resume and not self.index_path:
+            logger.error("resuming requires the index of the previous run")
+            ok = False
+
+        if self.checkpoint_interval <= 0:
+            logger.error("checkpoint interval must be positive")
+            ok = False
+
+        if self.prepare_workers < 0:
+            logger.error("prepare workers must not be negative")
+            ok = False
+
+        if self.retries < 0:
+            logger.error("retries must not be negative")
+            ok = False
+
+        if self.delta and not self.cache_path:
+            logger.error("delta evaluation requires the verdict cache of the previous run")
+            ok = False
+
+        if self.max_false_positives < 0:
+            logger.error("maximum number of false positives must not be negative")
+            ok = False
+
+        if self.cache_size < 1:
+            logger.error("verdict cache size must be at least 1")
+            ok = False
+
+        if self.batch_size < 1:
+            logger.error("batch size must be at least 1")
+            ok = False
+
+        if self.ready_timeout <= 0:
+            logger.error("readiness timeout must be positive")
+            ok = False
+
+        if self.replicas < 1:
+            logger.error("at least one WAF replica is required")
+            ok = False
+
+        if self.balance not in ("round-robin", "least-loaded"):
+            logger.error(f"unsupported balancing strategy: {self.balance}")
+            ok = False
+
+        if self.mode not in ("online", "offline", "hybrid"):
+            logger.error(f"unsupported mode: {self.mode}")
+            ok = False
+
+        if self.encoding not in ENCODINGS:
+            logger.error(f"unsupported encoding: {self.encoding}")
+            ok = False
+
+        try:
+            self.cells()
+        except ValueError as e:
+            logger.error(str(e))
+            ok = False
+
+        if self.coordinator is not None:
+            try:
+                listen_host, _ = self.coordinator_address()
+            except ValueError:
+                logger.error(f"invalid coordinator address: {self.coordinator}")
+                ok = False
+            else:
+                if listen_host not in ("127.0.0.1", "localhost", "::1") and not self.coordinator_token:
+                    logger.warning(
+                        f"coordinator listening on {listen_host} without a token, "
+                        "any host reaching it can lease and report shards"
+                    )
+
+        if self.lease_timeout <= 0:
+            logger.error("lease timeout must be positive")
+            ok = False
+
+        if (self.normalize or self.dedup_on_disk) and not self.dedup:
+            logger.error("normalization and on-disk index require deduplication")
+            ok = False
+
         return ok
 
+    def cells(self) -> List[Cell]:
+        """
+        cells returns the (method, location, encoding) combinations to evaluate, a single one unless a matrix is given
+        """
+        if not self.matrix:
+            return [
+                Cell(
+                    self.method,
+                    LOCATIONS.get(self.position, Location.URL_PARAMETERS),
+                    ENCODINGS.get(self.encoding, Encoding.FORM_URLENCODED),
+                )
+            ]
+        cells: List[Cell] = []
+        for spec in ",".join(self.matrix).split(","):
+            spec = spec.strip()
+            for cell in MATRIX_ALL if spec.lower() == "all" else [Cell.parse(spec)]:
+                if cell not in cells:
+                    cells.append(cell)
+        return cells
+
+    def coordinator_address(self) -> Tuple[str, int]:
+        """
+        coordinator_address returns the interface and port the coordinator listens on, from [host:]port
+        """
+        host, _, port = self.coordinator.rpartition(":")
+        return host or "127.0.0.1", int(port)
+
+    def audit_log_path(self) -> Optional[str]:
+        """
+        audit_log_path returns the ModSecurity audit log to attribute results from, the one of the setup directory by default when attributing
+        """
+        if self.audit_log is not None:
+            return self.audit_log
+        if self.attribution_path is not None:
+            return os.path.join(self.setup_dir, DEFAULT_AUDIT_LOG)
+        return None
+
+    def connection_pool_size(self) -> int:
+        if self.pool_size is not None:
+            return self.pool_size
+        return self.concurrency if self.engine == "async" else self.threads
+
+    def deduplicator(self) -> Optional[Deduplicator]:
+        if not self.dedup:
+            return None
+        return Deduplicator(normalize_payloads=self.normalize, on_disk=self.dedup_on_disk)
+
+    def attack_corpus(self) -> Corpus:
+        """
+        attack_corpus streams the attack payloads unless they were loaded in memory
+        """
+        if self.attack_payloads:
+            return Corpus(payloads=self.attack_payloads)
+        return Corpus(path=self.attack_payloads_dir)
+
+    def traffic_corpus(self) -> Corpus:
+        """
+        traffic_corpus streams the business traffic unless it was loaded in memory
+        """
+        if self.traffic_payloads:
+            return Corpus(payloads=self.traffic_payloads)
+        return Corpus(path=self.traffic_payloads_dir)
+
     def load(self):
         self.attack_payloads = read_all_file_content_in_directory(
             self.attack_payloads_dir
@@ -58,10 +255,264 @@ class EvaluateConfig(BaseModel):
 
 
 def read_all_file_content_in_directory(directory_path: str) -> List[str]:
-    all_content = []
-    for root, _, files in os.walk(directory_path):
-        for file in files:
-            file_path = os.path.join(root, file)
-            with open(file_path, "r") as f:
-                all_content.extend([line.strip() for line in f.readlines()])
-    return all_content
+    return list(iter_file_content(directory_path))
+
+
+class WorkerConfig(BaseModel):
+    coordinator: str = "http://localhost:8700/"
+    setup_dir: str = "./infra/"
+    deploy: bool = True
+    attach: bool = False
+    ready_timeout: float = 60
+    replicas: int = 1
+    replica_base_port: int = 8081
+    balance: str = "round-robin"
+    threads: int = 10
+    engine: str = "thread"
+    concurrency: int = 100
+    pool_size: Optional[int] = None
+    timeout: Optional[float] = 30
+    keep_alive: bool = True
+    adaptive: bool = True
+    retries: int = 3
+    name: Optional[str] = None
+    token: Optional[str] = None
+    host: str = "http://localhost/"
+
+    def validate(self) -> bool:
+        ok = True
+
+        if self.deploy and not os.path.exists(
+            os.path.join(self.setup_dir, "docker-compose.yml")
+        ):
+            logger.error("failed to find docker-compose file for initializing testing")
+            ok = False
+
+        if self.engine not in ("thread", "async"):
+            logger.error(f"unsupported engine: {self.engine}")
+            ok = False
+
+        if self.concurrency < 1:
+            logger.error("concurrency must be at least 1")
+            ok = False
+
+        if self.pool_size is not None and self.pool_size < 1:
+            logger.error("connection pool size must be at least 1")
+            ok = False
+
+        if self.retries < 0:
+            logger.error("retries must not be negative")
+            ok = False
+
+        if self.replicas < 1:
+            logger.error("at least one WAF replica is required")
+            ok = False
+
+        if self.balance not in ("round-robin", "least-loaded"):
+            logger.error(f"unsupported balancing strategy: {self.balance}")
+            ok = False
+
+        return ok
+
+    def connection_pool_size(self) -> int:
+        if self.pool_size is not None:
+            return self.pool_size
+        return self.concurrency if self.engine == "async" else self.threads
+
+
+class LLMConfig(BaseModel):
+    api_key: Optional[str] = None
+    base_url: Optional[str] = None
+    model: Optional[str] = None
+    threads: int = 10
+    batch_size: int = 10
+    requests_per_minute: Optional[float] = None
+    llm_cache: bool = True
+    llm_cache_path: Optional[str] = None
+    llm_cache_size: int = 100_000
+
+    def validate_llm(self) -> bool:
+        ok = True
+
+        if self.threads < 1:
+            logger.error("threads must be at least 1")
+            ok = False
+
+        if self.batch_size < 1:
+            logger.error("batch size must be at least 1")
+            ok = False
+
+        if self.requests_per_minute is not None and self.requests_per_minute <= 0:
+            logger.error("requests per minute must be positive")
+            ok = False
+
+        if self.llm_cache_size < 1:
+            logger.error("response cache size must be at least 1")
+            ok = False
+
+        return ok
+
+    def client(self) -> LLMClient:
+        """
+        client returns the model client, caching its answers under the user's cache directory by default
+        """
+        cache: Optional[ResponseCache] = None
+        if self.llm_cache:
+            path = self.llm_cache_path or os.path.join(default_cache_dir(), "llm.db")
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            cache = ResponseCache(path, self.llm_cache_size)
+        return LLMClient(
+            self.model,
+            api_key=self.api_key,
+            base_url=self.base_url,
+            concurrency=self.threads,
+            requests_per_minute=self.requests_per_minute,
+            cache=cache,
+        )
+
+
+class ExtractConfig(LLMConfig):
+    input_path: str = "./infra/nginx/logs/"
+    output_path: str = "./payloads.txt"
+    workers: int = 0
+    chunk_size: int = DEFAULT_CHUNK_SIZE
+
+    def validate(self) -> bool:
+        ok = self.validate_llm()
+
+        if not os.path.exists(self.input_path):
+            logger.error(f"failed to find the logs in {self.input_path}")
+            ok = False
+
+        if self.api_key and not self.model:
+            logger.error("classifying the candidates requires a model")
+            ok = False
+
+        if self.workers < 0:
+            logger.error("workers must not be negative")
+            ok = False
+
+        if self.chunk_size < 1:
+            logger.error("chunk size must be at least 1")
+            ok = False
+
+        return ok
+
+
+class CreateConfig(LLMConfig):
+    input_path: str = "./evaded.txt"
+    output_path: str = "./custom-modsecurity-rules.conf"
+    method: str = "GET"
+    position: str = "url_parameters"
+    cluster: bool = False
+    similarity: float = DEFAULT_THRESHOLD
+
+    def validate(self) -> bool:
+        ok = self.validate_llm()
+
+        if not 0 < self.similarity <= 1:
+            logger.error("similarity must be within (0, 1]")
+            ok = False
+
+        if not os.path.exists(self.input_path):
+            logger.error(f"failed to find the payloads in {self.input_path}")
+            ok = False
+
+        if not self.model:
+            logger.error("creating rules requires a model")
+            ok = False
+
+        if self.position not in LOCATIONS:
+            logger.error(f"unsupported position: {self.position}")
+            ok = False
+
+        return ok
+
+
+class AggregateConfig(LLMConfig):
+    rules_path: str = "./custom-modsecurity-rules.conf"
+    traffic_path: Optional[str] = None
+    output_path: str = "./custom-modsecurity-rules-aggregated.conf"
+
+    def validate(self) -> bool:
+        ok = self.validate_llm()
+
+        if not os.path.exists(self.rules_path):
+            logger.error(f"failed to find the rules in {self.rules_path}")
+            ok = False
+
+        if self.traffic_path is not None and not os.path.exists(self.traffic_path):
+            logger.error(f"failed to find the business traffic in {self.traffic_path}")
+            ok = False
+
+        if not self.model:
+            logger.error("aggregating rules requires a model")
+            ok = False
+
+        return ok
+
+
+class ClusterConfig(BaseModel):
+    input_path: str = "./evaded.txt"
+    output_path: str = "./clusters.txt"
+    members_path: Optional[str] = None
+    similarity: float = DEFAULT_THRESHOLD
+    num_perm: int = DEFAULT_NUM_PERM
+    ngram: int = DEFAULT_NGRAM
+
+    def validate(self) -> bool:
+        ok = True
+
+        if not os.path.exists(self.input_path):
+            logger.error(f"failed to find the payloads in {self.input_path}")
+            ok = False
+
+        if not 0 < self.similarity <= 1:
+            logger.error("similarity must be within (0, 1]")
+            ok = False
+
+        if self.num_perm < 1:
+            logger.error("number of hash functions must be at least 1")
+            ok = False
+
+        if self.ngram < 1:
+            logger.error("n-gram length must be at least 1")
+            ok = False
+
+        return ok
+
+
+class ProfileConfig(BaseModel):
+    rules_path: str = "./custom-modsecurity-rules.conf"
+    attack_payloads_dir: str = "./payloads/"
+    traffic_payloads_dir: Optional[str] = None
+    report_path: Optional[str] = None
+    timeout: float = 5.0
+    top: int = 20
+
+    def validate(self) -> bool:
+        ok = True
+
+        if not os.path.exists(self.rules_path):
+            logger.error(f"failed to find the rules in {self.rules_path}")
+            ok = False
+
+        if not os.path.exists(self.attack_payloads_dir):
+            logger.error(f"failed to find the attack payloads in {self.attack_payloads_dir}")
+            ok = False
+
+        if self.traffic_payloads_dir is not None and not os.path.exists(
+            self.traffic_payloads_dir
+        ):
+            logger.error(f"failed to find the business traffic in {self.traffic_payloads_dir}")
+            ok = False
+
+        if self.timeout <= 0:
+            logger.error("timeout must be positive")
+            ok = False
+
+        if self.top < 0:
+            logger.error("number of rules reported must not be negative")
+            ok = False
+
+        return ok
@@ -0,0 +1,151 @@
+import re
+import time
+import logging
+from typing import Any, Dict, Optional
+from wafsmith.lib.console import console
+from wafsmith.cmd.config import CreateConfig
+from wafsmith.lib.corpus import iter_file_content
+from wafsmith.lib.llm import Template
+from wafsmith.lib.cluster import DEFAULT_THRESHOLD, PayloadClusterer
+from wafsmith.lib.rules import assign_rule_ids, translate_pcre
+from wafsmith.lib.prompts import (
+    CREATE_BATCH_USER_PROMPT,
+    CREATE_SYSTEM_PROMPT_1,
+    CREATE_USER_PROMPT,
+)
+
+logger = logging.getLogger("create")
+
+# How the positions read in the prompts
+POSITIONS = {
+    "url_parameters": "url parameters",
+    "http_header": "http header",
+    "http_body": "http body",
+}
+
+
+def run(
+    input_path: str,
+    output_file: str,
+    method: str = "GET",
+    position: str = "url_parameters",
+    api_key: Optional[str] = None,
+    base_url: Optional[str] = None,
+    model: Optional[str] = None,
+    threads: int = 10,
+    batch_size: int = 10,
+    requests_per_minute: Optional[float] = None,
+    llm_cache: bool = True,
+    llm_cache_path: Optional[str] = None,
+    cluster: bool = False,
+    similarity: float = DEFAULT_THRESHOLD,
+):
+    config = CreateConfig(
+        input_path=input_path,
+        output_path=output_file,
+        method=method,
+        position=position,
+        api_key=api_key,
+        base_url=base_url,
+        model=model,
+        threads=threads,
+        batch_size=batch_size,
+        requests_per_minute=requests_per_minute,
+        llm_cache=llm_cache,
+        llm_cache_path=llm_cache_path,
+        cluster=cluster,
+        similarity=similarity,
+    )
+    if not config.validate():
+        logger.error("Configuration validation failed.")
+        return
+
+    start_time = time.time()
+    create(config)
+    logger.info(f"Create ModSecurity Rules: {time.time() - start_time:.2f}s")
+
+
+def parse_rule(payload: str, value: Any) -> Optional[Dict[str, str]]:
+    """
+    parse_rule returns the regular expression and rule answered for a payload, None unless the expression catches it
+    """
+    if not isinstance(value, dict):
+        return None
+    regex, rule = value.get("regex"), value.get("rule")
+    if not isinstance(regex, str) or not isinstance(rule, str):
+        return None
+    rule = rule.strip()
+    if not rule.startswith("SecRule") or "\n" in rule:
+        return None
+    try:
+        if re.search(translate_pcre(regex), payload) is None:
+            return None
+    except re.error:
+        return None
+    return {"regex": regex, "rule": rule}
+
+
+def create_template(method: str, position: str) -> Template:
+    """
+    create_template returns the prompts creating the rules of payloads found in position of method requests
+    """
+
+    def request(prompt: str) -> str:
+        return prompt.replace("%%METHOD%%", method).replace(
+            "%%POSITION%%", POSITIONS.get(position, position)
+        )
+
+    return Template(
+        "create",
+        CREATE_SYSTEM_PROMPT_1,
+        request(CREATE_USER_PROMPT),
+        parse_rule,
+        batch=request(CREATE_BATCH_USER_PROMPT),
+    )
+
+
+def create(config: CreateConfig):
+    logger.info("Starting rule creation workflow")
+    step = 1
+    total_steps = 3 if config.cluster else 2
+
+    payloads = list(dict.fromkeys(filter(None, iter_file_content(config.input_path))))
+    if config.cluster:
+        # Step 1: Ask for the rules of one representative per family of
+        # near-identical payloads rather than of every variant
+        clusters = PayloadClusterer(config.similarity).cluster(payloads)
+        logger.info(
+            f"[{step}/{total_steps}] Clustered {len(payloads)} payload(s) into {len(clusters)} cluster(s)"
+        )
+        payloads = [family.representative for family in clusters]
+        step += 1
+
+    client = config.client()
+    try:
+        # Step 2: Ask for a rule per payload, several payloads per call
+        with console.status(f"Creating rules for {len(payloads)} payload(s)"):
+            answers = client.ask(
+                create_template(config.method, config.position), payloads, config.batch_size
+            )
+    finally:
+        if client.cache is not None:
+            client.cache.close()
+    logger.info(f"[{step}/{total_steps}] Completed creation of rules")
+    logger.info(f"Model: {client}")
+    step += 1
+
+    # Step 3: Write the rules with ids of their own, once per distinct rule
+    rules = assign_rule_ids(answer["rule"] for answer in answers if answer is not None)
+    failed = sum(1 for answer in answers if answer is None)
+    if failed > 0:
+        logger.warning(f"No working rule for {failed} payload(s)")
+    if rules:
+        with open(config.output_path, "w") as f:
+            for rule in rules:
+                f.write(rule + "\n")
+        logger.info(
+            f"[{step}/{total_steps}] Created {len(rules)} rule(s) for {len(payloads)} payload(s)"
+        )
+        logger.info(f"Written rules to {config.output_path}")
+    else:
+        logger.warning(f"[{step}/{total_steps}] No rules created")
@@ -0,0 +1,53 @@
+import logging
+from wafsmith.lib.console import console
+from wafsmith.lib.env import TestingEnv
+from wafsmith.lib.cache import ruleset_hash
+
+logger = logging.getLogger("env")
+
+
+def up(
+    setup_dir: str,
+    host: str = "http://localhost/",
+    ready_timeout: float = 60,
+    replicas: int = 1,
+    replica_base_port: int = 8081,
+):
+    """
+    up starts the testing environment (or reloads the rules of a running one) and keeps it warm for evaluate --attach
+    """
+    testing_env = TestingEnv(
+        base_dir=setup_dir, replicas=replicas, replica_base_port=replica_base_port
+    )
+    with console.status("Deploying testing environment"):
+        started = testing_env.attach(ruleset_hash(setup_dir))
+        for endpoint in testing_env.endpoints(host):
+            if not testing_env.wait_ready(endpoint, ready_timeout):
+                logger.error(f"{endpoint} not ready after {ready_timeout}s")
+                return
+    if started:
+        logger.info("Deployed testing environment")
+    else:
+        logger.info("Testing environment already running")
+
+
+def reload(setup_dir: str, replicas: int = 1):
+    """
+    reload hot-reloads the rules of every WAF replica of the running testing environment
+    """
+    testing_env = TestingEnv(base_dir=setup_dir, replicas=replicas)
+    if not testing_env.is_running():
+        logger.error("Testing environment is not running")
+        return
+    testing_env.reload()
+    testing_env.record_ruleset(ruleset_hash(setup_dir))
+    logger.info("Reloaded rules")
+
+
+def down(setup_dir: str):
+    """
+    down decommissions the testing environment
+    """
+    with console.status("Decommissioning testing environment"):
+        TestingEnv(base_dir=setup_dir).teardown()
+    logger.info("Decommissioned testing environment")
@@ -1,15 +1,46 @@
+import os
 import sys
 import time
 import logging
+import uuid
+import itertools
 from wafsmith.lib.console import console
 from wafsmith.cmd.config import EvaluateConfig
-from wafsmith.lib.payload import Location, process_payloads_in_parallel
+from wafsmith.lib.payload import (
+    Cell,
+    Engine,
+    Lane,
+    process_matrix_in_parallel,
+)
 from wafsmith.lib.env import TestingEnv
+from wafsmith.lib.session import SessionPool
+from wafsmith.lib.balancer import Balancer, Strategy
+from wafsmith.lib.rules import RuleSet
+from wafsmith.lib.corpus import Corpus
+from wafsmith.lib.dedup import Deduplicator
+from wafsmith.lib.results import ERRORED, Outcome, ResultStore
+from wafsmith.lib.limiter import AdaptiveLimiter, RetryPolicy
+from wafsmith.lib.distributed import Coordinator
+from wafsmith.lib.audit import AuditCorrelator, AuditLogReader
+from wafsmith.lib.delta import Carry, DeltaScreen, RuleSnapshot, diff
+from wafsmith.lib.latency import LatencyRecorder, LatencySummary, overhead
+from wafsmith.lib.cache import CacheView, VerdictCache, ruleset_hash, verdict_context
+from wafsmith.lib.writer import (
+    ATTACK,
+    TRAFFIC,
+    ResultWriter,
+    cell_path,
+    load_index,
+    payload_key,
+)
 
-from typing import List, Dict, Any, Tuple
+from typing import Callable, Dict, Iterable, List, Tuple, Optional
 
 logger = logging.getLogger("evaluate")
 
+# Phase of the run in the request ids, see AuditCorrelator
+REQUEST_PHASES = {ATTACK: "attack", TRAFFIC: "traffic"}
+
 
 def run(
     payloads_dir: str,
@@ -19,7 +50,42 @@ def run(
     position: str,
     method: str,
     threads: int,
-    host: str = "http://localhost:3000",
+    host: str = "http://localhost/",
+    engine: str = "thread",
+    concurrency: int = 100,
+    pool_size: Optional[int] = None,
+    timeout: Optional[float] = 30,
+    keep_alive: bool = True,
+    batch_size: int = 1000,
+    results_file: Optional[str] = None,
+    index_file: Optional[str] = None,
+    resume: bool = False,
+    checkpoint_interval: float = 1.0,
+    cache_file: Optional[str] = None,
+    cache_size: int = 1_000_000,
+    delta: bool = False,
+    traffic_first: bool = False,
+    max_false_positives: int = 0,
+    attribution_file: Optional[str] = None,
+    audit_log: Optional[str] = None,
+    dedup: bool = True,
+    normalize: bool = False,
+    dedup_on_disk: bool = False,
+    attach: bool = False,
+    ready_timeout: float = 60,
+    replicas: int = 1,
+    replica_base_port: int = 8081,
+    balance: str = "round-robin",
+    mode: str = "online",
+    direct: Optional[str] = None,
+    adaptive: bool = True,
+    retries: int = 3,
+    prepare_workers: int = 0,
+    encoding: str = "form",
+    matrix: Optional[List[str]] = None,
+    coordinator: Optional[str] = None,
+    lease_timeout: float = 120,
+    coordinator_token: Optional[str] = None,
 ):
     logger.info("Validating CLI arguments and preparing testing environment...")
 
@@ -31,6 +97,41 @@ def run(
         position=position,
         method=method,
         threads=threads,
+        engine=engine,
+        concurrency=concurrency,
+        pool_size=pool_size,
+        timeout=timeout,
+        keep_alive=keep_alive,
+        batch_size=batch_size,
+        output_results_path=results_file,
+        index_path=index_file,
+        resume=resume,
+        checkpoint_interval=checkpoint_interval,
+        cache_path=cache_file,
+        cache_size=cache_size,
+        delta=delta,
+        traffic_first=traffic_first,
+        max_false_positives=max_false_positives,
+        attribution_path=attribution_file,
+        audit_log=audit_log,
+        dedup=dedup,
+        normalize=normalize,
+        dedup_on_disk=dedup_on_disk,
+        attach=attach,
+        ready_timeout=ready_timeout,
+        replicas=replicas,
+        replica_base_port=replica_base_port,
+        balance=balance,
+        mode=mode,
+        direct=direct,
+        adaptive=adaptive,
+        retries=retries,
+        prepare_workers=prepare_workers,
+        encoding=encoding,
+        matrix=list(matrix or []),
+        coordinator=coordinator,
+        lease_timeout=lease_timeout,
+        coordinator_token=coordinator_token,
         host=host,
     )
     if not config.validate():
@@ -39,12 +140,6 @@ def run(
 
     logger.info("Validation complete.")
 
-    try:
-        config.load()
-    except Exception as e:
-        logger.error(f"Failed to load configuration: {e}")
-        return
-
     logger.info("Evaluate WAF Rules")
     start_time = time.time()
 
@@ -54,30 +149,30 @@ def run(
     logger.info(f"Evaluate WAF Rules: {end_time - start_time:.2f}s")
 
 
-def calculate_results(results: Dict[str, Any], expected_code: int = 200) -> Tuple[int, int, float, bool]:
+def calculate_results(results: ResultStore, expected_code: int = 200) -> Tuple[int, int, float, bool]:
     """Calculate statistics from results.
     
     Args:
-        results: Results dictionary with 'total' and 'data' keys
+        results: ResultStore with the status code of every payload
         expected_code: Expected status code for success
         
     Returns:
         Tuple of (matched_count, total_count, percentage, all_passed)
     """
-    matched_count = len(results["data"].get(expected_code, []))
-    total_count = results["total"]
+    matched_count = results.count(expected_code)
+    total_count = len(results)
     percentage = (matched_count / total_count * 100) if total_count > 0 else 0
     all_passed = matched_count == total_count
     
     return matched_count, total_count, percentage, all_passed
 
 
-def write_results_to_file(file_path: str, payloads: List[str]) -> None:
+def write_results_to_file(file_path: str, payloads: Iterable[str]) -> None:
     """Write payloads to a file.
     
     Args:
         file_path: Path to write to
-        payloads: List of payload strings to write
+        payloads: Payload strings to write, consumed lazily
     """
     with open(file_path, "w") as f:
         for payload in payloads:
@@ -85,65 +180,590 @@ def write_results_to_file(file_path: str, payloads: List[str]) -> None:
     logger.info(f"Written payloads to {file_path}")
 
 
+class FalsePositiveLimit(Exception):
+    """Raised to stop the run once too many business traffic payloads are blocked."""
+
+
+class FalsePositives:
+    """Business traffic payloads the WAF did not let through.
+
+    Args:
+        limit: Number of false positives stopping the run, 0 never stops it
+        examples: Number of false positives kept to be listed
+    """
+
+    def __init__(self, limit: int = 0, examples: int = 20):
+        self.limit = limit
+        self.count = 0
+        self.examples: List[Tuple[Optional[str], Outcome]] = []
+        self._keep = examples
+
+    def guard(
+        self, on_result: Callable[[Outcome], None], cell: Optional[str] = None
+    ) -> Callable[[Outcome], None]:
+        """
+        guard returns on_result counting the false positives of the business traffic of cell, raising FalsePositiveLimit at the limit
+        """
+
+        def handle(outcome: Outcome):
+            on_result(outcome)
+            # Failed requests are neither blocked nor let through
+            if outcome.status_code in (200, ERRORED):
+                return
+            self.count += 1
+            if len(self.examples) < self._keep:
+                self.examples.append((cell, outcome))
+            if self.limit and self.count >= self.limit:
+                raise FalsePositiveLimit(
+                    f"{self.count} business traffic payload(s) blocked"
+                )
+
+        return handle
+
+    def report(self, corpus: Corpus):
+        """
+        report logs the offending business traffic lines, by file and line number when read from disk
+        """
+        if self.count == 0:
+            return
+        logger.error(f"False Positive(s): {self.count} business traffic payload(s) blocked")
+        for cell, outcome in self.examples:
+            where = corpus.location(outcome.index) or f"#{outcome.index + 1}"
+            cell_label = f" [{cell}]" if cell is not None else ""
+            logger.error(f"  {where}{cell_label} {outcome.status_code}: {outcome.payload}")
+        if self.count > len(self.examples):
+            logger.error(f"  ... and {self.count - len(self.examples)} more")
+
+
+def resume_lookup(
+    completed: Dict[str, int], kind: str, cell: Optional[str] = None
+) -> Optional[Callable[[str], Optional[int]]]:
+    """Build the lookup skipping payloads already tested by a previous run.
+
+    Args:
+        completed: Payload keys and status codes loaded from the index
+        kind: Kind of payload being processed (attack / business traffic)
+        cell: Matrix cell the payloads are sent in, None outside of a matrix
+
+    Returns:
+        Callable returning the recorded status code of a payload, or None
+    """
+    if not completed:
+        return None
+    return lambda payload: completed.get(payload_key(kind, payload, cell))
+
+
+def result_handler(
+    writer: ResultWriter, latency: LatencyRecorder, kind: str, cell: Optional[str] = None
+) -> Callable[[Outcome], None]:
+    """
+    result_handler returns the callback streaming every outcome to disk and recording its latency
+    """
+
+    def handle(outcome: Outcome):
+        writer.write(outcome, kind, cell)
+        latency.record(outcome)
+
+    return handle
+
+
+def report_overhead(
+    attack: LatencyRecorder, traffic: LatencyRecorder, direct: LatencyRecorder
+):
+    """Log the latency the WAF adds over sending the same requests directly.
+
+    Args:
+        attack: Latency of the attack payloads sent through the WAF
+        traffic: Latency of the business traffic sent through the WAF
+        direct: Latency of every payload sent directly to the application
+    """
+    groups = {"all": LatencySummary()}
+    for recorder in (attack, traffic):
+        groups["all"].merge(recorder.overall)
+        for status_code, summary in recorder.by_status.items():
+            groups.setdefault(f"status {status_code}", LatencySummary()).merge(summary)
+    for name in sorted(groups):
+        if groups[name].count == 0:
+            continue
+        rows = " ".join(
+            f"{label}={value * 1000:+.2f}ms"
+            for label, value in overhead(groups[name], direct.overall)
+        )
+        logger.info(f"WAF Overhead [{name}]: {rows}")
+
+
+def screen_lookup(
+    config: EvaluateConfig, cells: List[Cell]
+) -> Dict[Cell, Optional[Callable[[str], Optional[int]]]]:
+    """Build the in-process verdict of the offline and hybrid modes.
+
+    Args:
+        config: Evaluate configuration, its mode and setup directory
+        cells: How the payloads are sent, each with its own verdict
+
+    Returns:
+        Callable per cell returning 403 for payloads the parsed rules
+        certainly block. Other payloads are reported as evaded (200) in
+        offline mode and left to the WAF (None) in hybrid mode. None in
+        online mode.
+    """
+    if config.mode == "online":
+        return {cell: None for cell in cells}
+    ruleset = RuleSet.load(config.setup_dir)
+    undecided = 200 if config.mode == "offline" else None
+
+    def screen(cell: Cell) -> Callable[[str], Optional[int]]:
+        return lambda payload: (
+            ruleset.verdict(payload, cell.location, cell.encoding, cell.method)
+            or undecided
+        )
+
+    return {cell: screen(cell) for cell in cells}
+
+
+def delta_lookup(
+    config: EvaluateConfig,
+    cache: VerdictCache,
+    snapshot: RuleSnapshot,
+    verdicts: Dict[Cell, CacheView],
+) -> Dict[Cell, Carry]:
+    """Build the verdicts carried over from the previous ruleset in delta mode.
+
+    Args:
+        config: Evaluate configuration, its setup directory
+        cache: Verdict cache holding the previous run's verdicts and snapshot
+        snapshot: Snapshot of the current ruleset
+        verdicts: Cache views of the current ruleset, per cell
+
+    Returns:
+        Carry per cell, empty when every payload has to be retested
+    """
+    previous = cache.latest_snapshot(exclude=snapshot.ruleset)
+    if previous is None:
+        logger.info("Delta: no previous run recorded in the verdict cache, testing every payload")
+        return {}
+    previous_snapshot = RuleSnapshot.model_validate_json(previous)
+    changes = diff(previous_snapshot, snapshot)
+    if changes is None:
+        logger.info(
+            "Delta: settings outside of the rules changed since the previous run, testing every payload"
+        )
+        return {}
+    screen = DeltaScreen(changes, os.path.join(config.setup_dir, "rules"))
+    logger.info(
+        f"Delta: {len(changes)} rule(s) changed since the previous run "
+        f"({', '.join(change.key for change in changes[:10])}"
+        f"{', ...' if len(changes) > 10 else ''})"
+    )
+    if screen.unscreened:
+        logger.warning(
+            f"Delta: {screen.unscreened} changed rule version(s) could match any payload, testing every payload"
+        )
+    return {
+        cell: Carry(
+            screen,
+            cell,
+            cache.view(
+                verdict_context(
+                    previous_snapshot.ruleset,
+                    cell.method,
+                    cell.location.name.lower(),
+                    cell.encoding.name,
+                )
+            ),
+            view,
+        )
+        for cell, view in verdicts.items()
+    }
+
+
+def first_verdict(
+    *lookups: Optional[Callable[[str], Optional[int]]]
+) -> Optional[Callable[[str], Optional[int]]]:
+    """
+    first_verdict returns the lookup answering with the first of lookups knowing the status code of a payload
+    """
+    chained = [lookup for lookup in lookups if lookup is not None]
+    if len(chained) <= 1:
+        return chained[0] if chained else None
+
+    def lookup(payload: str) -> Optional[int]:
+        for candidate in chained:
+            status_code = candidate(payload)
+            if status_code is not None:
+                return status_code
+        return None
+
+    return lookup
+
+
+def report_matrix(attack_lanes: List[Lane], traffic_lanes: List[Lane]):
+    """Log the evasion rate of every cell of a matrix run as a table.
+
+    Args:
+        attack_lanes: Lanes of the attack payloads
+        traffic_lanes: Lanes of the business traffic, in the same order
+    """
+    width = max(len(str(lane.cell)) for lane in attack_lanes)
+    logger.info(f"\n{'Cell':<{width}}  {'Evaded':>14}  {'Blocked':>8}  {'Errored':>8}  Traffic")
+    for attack, traffic in zip(attack_lanes, traffic_lanes):
+        evaded_count, total_count, evaded_percentage, _ = calculate_results(attack.results)
+        traffic_status = "yet-to-test"
+        if len(traffic.results) > 0:
+            traffic_status = (
+                "passed" if calculate_results(traffic.results, 200)[3] else "failed"
+            )
+        row = (
+            f"{str(attack.cell):<{width}}  "
+            f"{f'{evaded_count}/{total_count}':>7} {f'{evaded_percentage:.1f}%':>6}  "
+            f"{attack.results.count(403):>8}  {attack.results.count(ERRORED):>8}  "
+            f"{traffic_status}"
+        )
+        if evaded_count > 0 or traffic_status == "failed":
+            logger.warning(row)
+        else:
+            logger.info(row)
+
+
 def evaluate(config: EvaluateConfig):
     logger.info("Starting evaluation workflow")
     step = 1
     total_steps = 3
 
+    completed: Dict[str, int] = {}
+    if config.resume:
+        completed = load_index(config.index_path)
+        logger.info(f"Resuming run: {len(completed)} payload(s) already tested")
+
+    # Everything opened below is closed, and the testing environment torn
+    # down, whichever step fails
+    writer: Optional[ResultWriter] = None
+    cache: Optional[VerdictCache] = None
+    verdicts: Dict[Cell, CacheView] = {}
+    snapshot: Optional[RuleSnapshot] = None
+    carried: Dict[Cell, Carry] = {}
+    attack_dedup: Optional[Deduplicator] = None
+    traffic_dedup: Optional[Deduplicator] = None
+    coordinator: Optional[Coordinator] = None
+    correlator: Optional[AuditCorrelator] = None
+    deploy = False
+
     try:
+        # Results are streamed to disk as they complete so that a crash mid-run
+        # keeps everything tested so far
+        writer = ResultWriter(
+            evaded_path=config.output_evaded_path,
+            results_path=config.output_results_path,
+            index_path=config.index_path,
+            resume=config.resume,
+            flush_interval=config.checkpoint_interval,
+        )
+        writer.start()
+
+        # Verdicts of an unchanged ruleset are reused, only cache misses are sent
+        cells = config.cells()
+        # Outside of a matrix, outputs and index keys are not labelled with the cell
+        label = (lambda cell: str(cell)) if config.matrix else (lambda cell: None)
+        if config.cache_path:
+            cache = VerdictCache(config.cache_path, config.cache_size)
+            rules = ruleset_hash(config.setup_dir)
+            verdicts = {
+                cell: cache.view(
+                    verdict_context(
+                        rules, cell.method, cell.location.name.lower(), cell.encoding.name
+                    )
+                )
+                for cell in cells
+            }
+            # The next delta run diffs its rules against this snapshot
+            snapshot = RuleSnapshot.take(config.setup_dir, rules)
+            if config.delta:
+                # Verdicts of the previous ruleset stand for the payloads that
+                # none of the changed rules could match
+                carried = delta_lookup(config, cache, snapshot, verdicts)
+
+        def corpora() -> Iterable[str]:
+            payloads = itertools.chain(config.attack_corpus(), config.traffic_corpus())
+            return filter(None, payloads) if config.dedup else payloads
+
+        # Workers of a distributed run deploy their own testing environments
+        distributed = config.coordinator is not None
+
+        def known(cell: Cell, payload: str) -> bool:
+            carry = carried.get(cell)
+            return verdicts[cell].contains(payload) or (carry is not None and carry.knows(payload))
+
+        # Deploying is decided before sending, the audit log tail, the direct
+        # comparison and the teardown depending on it. This reads the corpora
+        # once ahead of the run, but stops at the first payload without a
+        # verdict in some cell: the whole corpora are only read twice when the
+        # cache covers them, the run then being spared a deployment.
+        deploy = config.mode != "offline" and not distributed and (
+            not verdicts
+            or not all(known(cell, payload) for payload in corpora() for cell in cells)
+        )
+
+        # Each unique payload is sent once, its verdict fans out to duplicates
+        attack_dedup = config.deduplicator()
+        traffic_dedup = config.deduplicator()
+
         # Step 1: Deploy testing environment
-        with console.status("Deploying testing environment"):
-            testing_env = TestingEnv(base_dir=config.setup_dir)
-            testing_env.setup()
-            time.sleep(2)  # Give some time for the environment to start
-        logger.info(f"[{step}/{total_steps}] Deployed testing environment")
+        testing_env = TestingEnv(
+            base_dir=config.setup_dir,
+            replicas=config.replicas,
+            replica_base_port=config.replica_base_port,
+        )
+        endpoints = testing_env.endpoints(config.host)
+        if deploy:
+            with console.status("Deploying testing environment"):
+                if config.attach:
+                    started = testing_env.attach(ruleset_hash(config.setup_dir))
+                else:
+                    started = True
+                    testing_env.setup()
+                for endpoint in endpoints:
+                    if not testing_env.wait_ready(endpoint, config.ready_timeout):
+                        raise RuntimeError(
+                            f"{endpoint} not ready after {config.ready_timeout}s"
+                        )
+            if started:
+                logger.info(f"[{step}/{total_steps}] Deployed testing environment")
+            else:
+                logger.info(f"[{step}/{total_steps}] Attached to running testing environment")
+        elif config.mode == "offline":
+            logger.info(f"[{step}/{total_steps}] Offline mode, skipped deployment")
+        elif distributed:
+            logger.info(
+                f"[{step}/{total_steps}] Distributed mode, workers deploy their own testing environment"
+            )
+        else:
+            logger.info(
+                f"[{step}/{total_steps}] Verdict cache covers every payload, skipped deployment"
+            )
         step += 1
 
-        # Get location from config
-        location: Location = {
-            "http_header": Location.HTTP_HEADER,
-            "http_body": Location.HTTP_BODY,
-        }.get(config.position, Location.URL_PARAMETERS)
-
-        # Step 2: Test attack payloads
-        attack_results = {"total": len(config.attack_payloads), "data": {}}
-        with console.status(f"Testing {len(config.attack_payloads)} attack payloads"):
-            attack_results["data"] = process_payloads_in_parallel(
-                config.attack_payloads,
-                config.method,
-                config.host,
-                location,
-                config.threads,
-                "attack payload"
+        screens = screen_lookup(config, cells)
+        engine: Engine = {
+            "async": Engine.ASYNC,
+        }.get(config.engine, Engine.THREAD)
+        # Payloads are spread across the WAF replicas, results stay keyed by index
+        balancer: Optional[Balancer] = None
+        if len(endpoints) > 1:
+            balancer = Balancer(
+                endpoints,
+                {
+                    "least-loaded": Strategy.LEAST_LOADED,
+                }.get(config.balance, Strategy.ROUND_ROBIN),
             )
+        # Requests in flight adapt below the threads / concurrency, so that an
+        # overloaded WAF is backed off from instead of dropping requests
+        limiter: Optional[AdaptiveLimiter] = None
+        if config.adaptive:
+            limiter = AdaptiveLimiter(
+                config.concurrency if engine == Engine.ASYNC else config.threads
+            )
+        retry = RetryPolicy(retries=config.retries)
+        pool = SessionPool(
+            pool_size=config.connection_pool_size(),
+            timeout=config.timeout,
+            keep_alive=config.keep_alive,
+        )
+        # Requests are sent by the workers polling the coordinator, results
+        # are recorded here exactly as in a single-node run
+        if distributed and config.mode != "offline":
+            listen_host, listen_port = config.coordinator_address()
+            coordinator = Coordinator(
+                listen_host,
+                listen_port,
+                ruleset_hash(config.setup_dir),
+                config.lease_timeout,
+                token=config.coordinator_token,
+            ).start()
+        # Results are attributed the rules they matched from the audit log of
+        # the testing environment, tailed while the requests are sent
+        audit_log = config.audit_log_path()
+        if audit_log and (distributed or not deploy):
+            logger.warning(
+                "Rule attribution needs the audit log of a locally deployed testing environment"
+            )
+        elif audit_log:
+            correlator = AuditCorrelator(
+                AuditLogReader(audit_log), uuid.uuid4().hex[:12], config.attribution_path
+            ).start()
 
-        logger.info(f"[{step}/{total_steps}] Completed testing of payloads")
-        step += 1
+        def lanes(kind: str, latency: LatencyRecorder) -> List[Lane]:
+            handlers = [result_handler(writer, latency, kind, label(cell)) for cell in cells]
+            if correlator is not None:
+                handlers = [
+                    correlator.handler(handler, REQUEST_PHASES[kind], lane, kind, label(cell))
+                    for lane, (handler, cell) in enumerate(zip(handlers, cells))
+                ]
+            return [
+                Lane(
+                    cell,
+                    handler,
+                    resume_lookup(completed, kind, label(cell)),
+                    verdicts.get(cell),
+                    first_verdict(carried.get(cell), screens[cell]),
+                )
+                for handler, cell in zip(handlers, cells)
+            ]
+
+        def request_id(kind: str) -> Optional[str]:
+            return correlator.request_id(REQUEST_PHASES[kind]) if correlator is not None else None
+
+        attack_corpus = config.attack_corpus()
+        attack_latency = LatencyRecorder(attack_corpus.source)
+        attack_lanes = lanes(ATTACK, attack_latency)
+        traffic_corpus = config.traffic_corpus()
+        traffic_latency = LatencyRecorder(traffic_corpus.source)
+        traffic_lanes = lanes(TRAFFIC, traffic_latency)
+        # Business traffic the WAF blocks, stopping the run past the limit
+        false_positives = FalsePositives(config.max_false_positives)
+        for lane in traffic_lanes:
+            lane.on_result = false_positives.guard(lane.on_result, label(lane.cell))
+
+        # Step 2: Test attack payloads, streamed from disk as they are sent,
+        # each of them in every cell of the matrix
+        attack_tested = False
+
+        def test_attack():
+            nonlocal step, attack_tested
+            with console.status("Testing attack payloads"):
+                process_matrix_in_parallel(
+                    attack_corpus,
+                    attack_lanes,
+                    config.host,
+                    config.threads,
+                    ATTACK,
+                    engine,
+                    config.concurrency,
+                    pool,
+                    config.batch_size,
+                    attack_dedup,
+                    balancer,
+                    limiter,
+                    retry,
+                    config.prepare_workers,
+                    coordinator,
+                    request_id(ATTACK),
+                )
+
+            logger.info(f"[{step}/{total_steps}] Completed testing of payloads")
+            step += 1
+            attack_tested = True
 
         # Step 3: Test business traffic if available
-        business_traffic_status = "yet-to-test"
-        if config.traffic_payloads and len(config.traffic_payloads) > 0:
-            with console.status(
-                f"Testing {len(config.traffic_payloads)} business traffic payloads"
-            ):
-                business_results = {"total": len(config.traffic_payloads), "data": {}}
-                business_results["data"] = process_payloads_in_parallel(
-                    config.traffic_payloads,
-                    config.method,
+        def test_traffic():
+            with console.status("Testing business traffic payloads"):
+                process_matrix_in_parallel(
+                    traffic_corpus,
+                    traffic_lanes,
                     config.host,
-                    location,
                     config.threads,
-                    "business traffic"
+                    TRAFFIC,
+                    engine,
+                    config.concurrency,
+                    pool,
+                    config.batch_size,
+                    traffic_dedup,
+                    balancer,
+                    limiter,
+                    retry,
+                    config.prepare_workers,
+                    coordinator,
+                    request_id(TRAFFIC),
                 )
-                
-                # For business traffic, we expect 200 status code
-                _, _, _, all_passed = calculate_results(business_results, 200)
-                business_traffic_status = "passed" if all_passed else "failed"
 
-        # Step 4: Teardown testing environment
-        with console.status("Decommissioning testing environment"):
-            testing_env.teardown()
-        logger.info(f"[{step}/{total_steps}] Decommissioned testing environment")
+        # Business traffic first rejects a ruleset that already blocks
+        # legitimate requests before paying for the attack corpus
+        phases = (test_traffic, test_attack) if config.traffic_first else (test_attack, test_traffic)
+        try:
+            for phase in phases:
+                phase()
+        except FalsePositiveLimit as e:
+            logger.error(f"{e}, stopped the evaluation")
+            if config.traffic_first:
+                logger.error("Attack payloads were not tested")
+        if correlator is not None:
+            with console.status("Attributing results from the audit log"):
+                correlator.close()
+            correlator.report()
+            if config.attribution_path:
+                logger.info(f"Written rule attribution to {config.attribution_path}")
+
+        business_traffic_status = "yet-to-test"
+        if any(len(lane.results) > 0 for lane in traffic_lanes):
+            # For business traffic, we expect 200 status code in every cell,
+            # failed requests being neither blocked nor let through
+            all_passed = all(
+                lane.results.count(200) + lane.results.count(ERRORED) == len(lane.results)
+                for lane in traffic_lanes
+            )
+            business_traffic_status = "passed" if all_passed else "failed"
+
+        # Same payloads sent straight to the application, bypassing the WAF
+        direct_latency: Optional[LatencyRecorder] = None
+        if config.direct and distributed:
+            logger.warning("Direct comparison is not supported in distributed mode")
+        elif config.direct and not deploy:
+            logger.warning(
+                "Direct comparison needs the testing environment, which was not deployed"
+            )
+        elif config.direct:
+            direct_latency = LatencyRecorder()
+            with console.status("Measuring latency without the WAF"):
+                for corpus in (config.attack_corpus(), config.traffic_corpus()):
+                    process_matrix_in_parallel(
+                        corpus,
+                        [Lane(cell, direct_latency.record) for cell in cells],
+                        config.direct,
+                        config.threads,
+                        "direct request",
+                        engine,
+                        config.concurrency,
+                        pool,
+                        config.batch_size,
+                        retry=retry,
+                    )
+
+        attack_latency.report("Attack Latency")
+        traffic_latency.report("Traffic Latency")
+        if direct_latency is not None:
+            report_overhead(attack_latency, traffic_latency, direct_latency)
+
+        for dedup in (attack_dedup, traffic_dedup):
+            if dedup is not None:
+                logger.info(
+                    f"Deduplication: {dedup.unique} unique, {dedup.duplicates} duplicate payload(s) not resent"
+                )
+                dedup.close()
+        if balancer is not None:
+            logger.info(f"Requests per Replica: {balancer}")
+        if limiter is not None:
+            logger.info(f"Concurrency: {limiter}")
+        if coordinator is not None:
+            logger.info(f"Shards per Worker: {coordinator}")
+            coordinator.close()
+        else:
+            logger.info(f"Connection Reuse: {pool.stats()}")
+        pool.close()
+        writer.close()
+        if carried:
+            logger.info(
+                f"Delta: {sum(carry.carried for carry in carried.values())} verdict(s) reused, "
+                f"{sum(carry.affected for carry in carried.values())} payload(s) possibly affected retested"
+            )
+        if cache is not None:
+            logger.info(f"Verdict Cache: {cache.hits} hit(s), {cache.misses} miss(es)")
+            cache.save_snapshot(snapshot.ruleset, snapshot.model_dump_json())
+            cache.close()
+
+        # Step 4: Teardown testing environment, an attached one is kept warm
+        if deploy and not config.attach:
+            with console.status("Decommissioning testing environment"):
+                testing_env.teardown()
+            logger.info(f"[{step}/{total_steps}] Decommissioned testing environment")
 
         # Print results
         if business_traffic_status == "passed":
@@ -152,34 +772,76 @@ def evaluate(config: EvaluateConfig):
             logger.info("\nBusiness Traffic Simulation Status: yet-to-test")
         else:
             logger.error("\nBusiness Traffic Simulation Status: failed")
+            false_positives.report(traffic_corpus)
 
-        # Calculate and print evaded payloads
-        evaded_count, total_count, evaded_percentage, _ = calculate_results(attack_results)
+        if config.matrix:
+            report_matrix(attack_lanes, traffic_lanes)
 
-        if evaded_count == total_count:
-            logger.error(
-                f"Evaded Payload(s): {evaded_count}/{total_count} ({evaded_percentage:.2f}%)"
-            )
-        elif evaded_count > 0:
+        # Calculate and print evaded payloads, over every cell of a matrix
+        counts = [calculate_results(lane.results) for lane in attack_lanes]
+        evaded_count = sum(count[0] for count in counts)
+        total_count = sum(count[1] for count in counts)
+        evaded_percentage = (evaded_count / total_count * 100) if total_count > 0 else 0
+
+        # Unless the business traffic stopped the run before the attacks
+        if attack_tested:
+            if evaded_count == total_count and total_count > 0:
+                logger.error(
+                    f"Evaded Payload(s): {evaded_count}/{total_count} ({evaded_percentage:.2f}%)"
+                )
+            elif evaded_count > 0:
+                logger.warning(
+                    f"Evaded Payload(s): {evaded_count}/{total_count} ({evaded_percentage:.2f}%)"
+                )
+            else:
+                logger.info(f"Evaded Payload(s): 0/{total_count} (0.00%)")
+
+        errored = sum(
+            lane.results.count(ERRORED) for lane in attack_lanes + traffic_lanes
+        )
+        if errored > 0:
             logger.warning(
-                f"Evaded Payload(s): {evaded_count}/{total_count} ({evaded_percentage:.2f}%)"
+                f"Errored Payload(s): {errored} request(s) failed on every attempt and were "
+                "neither blocked nor evaded, rerun with --resume to retry them"
             )
-        else:
-            logger.info(f"Evaded Payload(s): 0/{total_count} (0.00%)")
 
-        # Write evaded payloads to file if any
+        # Evaded payloads were streamed to file as they were found
         if evaded_count > 0 and config.output_evaded_path:
-            write_results_to_file(
-                config.output_evaded_path, 
-                attack_results["data"].get(200, [])
-            )
+            if config.matrix:
+                logger.info(
+                    f"Written payloads to {cell_path(config.output_evaded_path, '<cell>')}"
+                )
+            else:
+                logger.info(f"Written payloads to {config.output_evaded_path}")
 
-    except Exception as e:
-        logger.error(f"Fatal Error - will proceed to exit: {e}")
-        logger.error(f"Stack trace: {sys.exc_info()[2]}")
+    except (Exception, KeyboardInterrupt) as e:
+        if isinstance(e, KeyboardInterrupt):
+            logger.error("Interrupted - will proceed to exit")
+        else:
+            logger.error(f"Fatal Error - will proceed to exit: {e}")
+            logger.error(f"Stack trace: {sys.exc_info()[2]}")
+        try:
+            if coordinator is not None:
+                coordinator.close()
+            if correlator is not None:
+                correlator.close()
+            if writer is not None:
+                writer.close()
+                if config.index_path:
+                    logger.info(
+                        f"Progress saved to {config.index_path}, rerun with --resume to continue"
+                    )
+            if cache is not None:
+                cache.close()
+            for dedup in (attack_dedup, traffic_dedup):
+                if dedup is not None:
+                    dedup.close()
+        except Exception as e:
+            logger.exception(f"Failed to flush results: {e}")
         # Ensure environment is torn down in case of error
         try:
-            testing_env.teardown()
+            if deploy and not config.attach:
+                testing_env.teardown()
         except Exception as e:
             logger.exception(f"Failed to teardown testing environment: {e}")
             logger.error("failing quietly to end command")
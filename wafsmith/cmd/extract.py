@@ -0,0 +1,143 @@
+import time
+import logging
+from typing import Any, Dict, List, Optional
+from wafsmith.lib.console import console
+from wafsmith.cmd.config import ExtractConfig
+from wafsmith.lib.accesslog import (
+    DEFAULT_CHUNK_SIZE,
+    Candidate,
+    ExtractStats,
+    extract_candidates,
+)
+from wafsmith.lib.llm import Template
+from wafsmith.lib.prompts import (
+    EXTRACT_BATCH_USER_PROMPT_1,
+    EXTRACT_SYSTEM_PROMPT_1,
+    EXTRACT_USER_PROMPT_1,
+    EXTRACT_USER_PROMPT_1_RETRY,
+)
+
+logger = logging.getLogger("extract")
+
+NON_MALICIOUS = "non-malicious"
+
+
+def run(
+    input_path: str,
+    output_file: str,
+    api_key: Optional[str] = None,
+    base_url: Optional[str] = None,
+    model: Optional[str] = None,
+    threads: int = 10,
+    batch_size: int = 10,
+    requests_per_minute: Optional[float] = None,
+    llm_cache: bool = True,
+    llm_cache_path: Optional[str] = None,
+    workers: int = 0,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+):
+    config = ExtractConfig(
+        input_path=input_path,
+        output_path=output_file,
+        api_key=api_key,
+        base_url=base_url,
+        model=model,
+        threads=threads,
+        batch_size=batch_size,
+        requests_per_minute=requests_per_minute,
+        llm_cache=llm_cache,
+        llm_cache_path=llm_cache_path,
+        workers=workers,
+        chunk_size=chunk_size,
+    )
+    if not config.validate():
+        logger.error("Configuration validation failed.")
+        return
+
+    start_time = time.time()
+    extract(config)
+    logger.info(f"Extract Payloads from Logs: {time.time() - start_time:.2f}s")
+
+
+def parse_classification(log: str, value: Any) -> Optional[Dict[str, Any]]:
+    """
+    parse_classification returns the classification of a log line, None if the answer is not one
+    """
+    if not isinstance(value, dict) or "classification" not in value:
+        return None
+    return value
+
+
+EXTRACT = Template(
+    "extract",
+    EXTRACT_SYSTEM_PROMPT_1,
+    EXTRACT_USER_PROMPT_1,
+    parse_classification,
+    batch=EXTRACT_BATCH_USER_PROMPT_1,
+    placeholder="%%LOG%%",
+    retry=EXTRACT_USER_PROMPT_1_RETRY,
+)
+
+
+def classify_candidates(config: ExtractConfig, candidates: List[Candidate]) -> List[str]:
+    """
+    classify_candidates returns the payloads the model extracts from the candidates it finds malicious
+    """
+    client = config.client()
+    try:
+        classifications = client.ask(
+            EXTRACT, [candidate.line for candidate in candidates], config.batch_size
+        )
+    finally:
+        if client.cache is not None:
+            client.cache.close()
+    logger.info(f"Model: {client}")
+
+    payloads: List[str] = []
+    for classification in classifications:
+        if classification is None or classification.get("classification") == NON_MALICIOUS:
+            continue
+        payload = classification.get("extracted_payload")
+        if payload:
+            payloads.append(str(payload))
+    return payloads
+
+
+def extract(config: ExtractConfig):
+    logger.info("Starting payload extraction workflow")
+    step = 1
+    total_steps = 3 if config.api_key else 2
+
+    # Step 1: Parse the logs, keeping the suspicious values only
+    stats = ExtractStats()
+    with console.status("Parsing logs"):
+        candidates = extract_candidates(
+            config.input_path, config.workers, config.chunk_size, stats
+        )
+    logger.info(f"[{step}/{total_steps}] Parsed {stats}")
+    logger.info(f"Candidate Payload(s): {len(candidates)} unique")
+    step += 1
+
+    # Step 2: Have the model confirm and isolate the payloads of the
+    # candidates, the heuristics having discarded the rest of the logs
+    payloads = [candidate.payload for candidate in candidates]
+    if config.api_key:
+        with console.status(f"Classifying {len(candidates)} candidate(s)"):
+            payloads = classify_candidates(config, candidates)
+        logger.info(f"[{step}/{total_steps}] Completed classifying candidates")
+        step += 1
+
+    # Step 3: Write one payload per line, as evaluate reads them
+    payloads = list(dict.fromkeys(p.replace("\r", "%0D").replace("\n", "%0A") for p in payloads))
+    if payloads:
+        with open(config.output_path, "w") as f:
+            for payload in payloads:
+                f.write(payload + "\n")
+        logger.info(
+            f"[{step}/{total_steps}] Extracted {len(payloads)} payload(s) out of {stats.requests} request(s)"
+        )
+        logger.info(f"Written payloads to {config.output_path}")
+    else:
+        logger.warning(
+            f"[{step}/{total_steps}] No payloads extracted from {stats.requests} request(s)"
+        )
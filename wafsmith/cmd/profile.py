@@ -0,0 +1,118 @@
+import json
+import time
+import logging
+from typing import Dict, List, Optional
+from wafsmith.lib.console import console
+from wafsmith.cmd.config import ProfileConfig
+from wafsmith.lib.corpus import iter_file_content
+from wafsmith.lib.profiler import (
+    CATASTROPHIC,
+    INVALID,
+    SUPERLINEAR,
+    RuleProfile,
+    iter_regex_rules,
+    profile_rules,
+)
+from wafsmith.lib.writer import ATTACK, TRAFFIC
+
+logger = logging.getLogger("profile")
+
+
+def run(
+    rules_path: str,
+    attack_payloads_dir: str,
+    traffic_payloads_dir: Optional[str] = None,
+    report_file: Optional[str] = None,
+    timeout: float = 5.0,
+    top: int = 20,
+):
+    config = ProfileConfig(
+        rules_path=rules_path,
+        attack_payloads_dir=attack_payloads_dir,
+        traffic_payloads_dir=traffic_payloads_dir,
+        report_path=report_file,
+        timeout=timeout,
+        top=top,
+    )
+    if not config.validate():
+        logger.error("Configuration validation failed.")
+        return
+
+    start_time = time.time()
+    profile(config)
+    logger.info(f"Profile ModSecurity Rules: {time.time() - start_time:.2f}s")
+
+
+def describe(result: RuleProfile) -> str:
+    """
+    describe returns a one-line summary of the cost of a rule
+    """
+    summary = f"{result.rule.id} [{result.verdict}] {result.rule.pattern!r}"
+    if result.values:
+        summary += (
+            f": {result.seconds * 1000:.2f}ms over {result.values} value(s), "
+            f"{result.seconds / result.values * 1_000_000:.2f}us per value"
+        )
+    if result.verdict in (CATASTROPHIC, SUPERLINEAR) and result.attack is not None:
+        prefix, pump, suffix, size = result.attack
+        summary += (
+            f"; {prefix!r} + {pump!r} * {size} + {suffix!r} took {result.attack_seconds * 1000:.2f}ms"
+        )
+        if result.verdict == SUPERLINEAR:
+            summary += f" (time ~ n^{result.exponent:.1f})"
+    if result.error is not None:
+        summary += f"; {result.error}"
+    return summary
+
+
+def profile(config: ProfileConfig) -> List[RuleProfile]:
+    logger.info("Starting rule profiling workflow")
+    step = 1
+    total_steps = 3
+
+    # Step 1: Load the expressions of the rules and the values to time them against
+    rules = list(iter_regex_rules(config.rules_path))
+    corpora: Dict[str, List[str]] = {
+        ATTACK: [payload for payload in iter_file_content(config.attack_payloads_dir) if payload]
+    }
+    if config.traffic_payloads_dir:
+        corpora[TRAFFIC] = [
+            payload for payload in iter_file_content(config.traffic_payloads_dir) if payload
+        ]
+    if not rules:
+        logger.warning(f"No @rx rules to profile in {config.rules_path}")
+        return []
+    logger.info(
+        f"[{step}/{total_steps}] Loaded {len(rules)} @rx rule(s), "
+        + ", ".join(f"{len(values)} {kind}(s)" for kind, values in corpora.items())
+    )
+    step += 1
+
+    # Step 2: Time every expression, on the corpora and on adversarial inputs
+    with console.status(f"Profiling {len(rules)} rule(s)"):
+        results = profile_rules(rules, corpora, config.timeout)
+    logger.info(f"[{step}/{total_steps}] Completed profiling of rules")
+    step += 1
+
+    # Step 3: Rank the rules, the pathological and most expensive first
+    pathological = [r for r in results if r.verdict in (CATASTROPHIC, SUPERLINEAR)]
+    for result in results[: config.top] if config.top else results:
+        # Expressions are full of brackets the console would take for markup
+        if result.verdict in (CATASTROPHIC, SUPERLINEAR, INVALID):
+            logger.warning(describe(result), extra={"markup": False})
+        else:
+            logger.info(describe(result), extra={"markup": False})
+    if config.report_path:
+        with open(config.report_path, "w") as f:
+            for result in results:
+                f.write(json.dumps(result.record()) + "\n")
+        logger.info(f"Written the profile of every rule to {config.report_path}")
+    if pathological:
+        logger.error(
+            f"[{step}/{total_steps}] {len(pathological)} out of {len(results)} rule(s) backtrack "
+            f"catastrophically or super-linearly, reject them: "
+            + ", ".join(str(r.rule.id) for r in pathological)
+        )
+    else:
+        logger.info(f"[{step}/{total_steps}] No pathological rule among {len(results)}")
+    return results
@@ -0,0 +1,153 @@
+import sys
+import time
+import logging
+from typing import Optional
+from wafsmith.lib.console import console
+from wafsmith.cmd.config import WorkerConfig
+from wafsmith.lib.env import TestingEnv
+from wafsmith.lib.payload import Engine
+from wafsmith.lib.session import SessionPool
+from wafsmith.lib.balancer import Balancer, Strategy
+from wafsmith.lib.limiter import AdaptiveLimiter, RetryPolicy
+from wafsmith.lib.cache import ruleset_hash
+from wafsmith.lib.distributed import work
+
+logger = logging.getLogger("worker")
+
+
+def run(
+    coordinator: str,
+    setup_dir: str,
+    host: str = "http://localhost/",
+    deploy: bool = True,
+    attach: bool = False,
+    ready_timeout: float = 60,
+    replicas: int = 1,
+    replica_base_port: int = 8081,
+    balance: str = "round-robin",
+    threads: int = 10,
+    engine: str = "thread",
+    concurrency: int = 100,
+    pool_size: Optional[int] = None,
+    timeout: Optional[float] = 30,
+    keep_alive: bool = True,
+    adaptive: bool = True,
+    retries: int = 3,
+    name: Optional[str] = None,
+    token: Optional[str] = None,
+):
+    config = WorkerConfig(
+        coordinator=coordinator,
+        setup_dir=setup_dir,
+        host=host,
+        deploy=deploy,
+        attach=attach,
+        ready_timeout=ready_timeout,
+        replicas=replicas,
+        replica_base_port=replica_base_port,
+        balance=balance,
+        threads=threads,
+        engine=engine,
+        concurrency=concurrency,
+        pool_size=pool_size,
+        timeout=timeout,
+        keep_alive=keep_alive,
+        adaptive=adaptive,
+        retries=retries,
+        name=name,
+        token=token,
+    )
+    if not config.validate():
+        logger.error("Configuration validation failed.")
+        return
+
+    start_time = time.time()
+    serve(config)
+    logger.info(f"Worker: {time.time() - start_time:.2f}s")
+
+
+def serve(config: WorkerConfig):
+    """
+    serve deploys the worker's own testing environment and sends the shards of the coordinator until it is done
+    """
+    testing_env = TestingEnv(
+        base_dir=config.setup_dir,
+        replicas=config.replicas,
+        replica_base_port=config.replica_base_port,
+    )
+    endpoints = testing_env.endpoints(config.host)
+    # The coordinator refuses to be served by a worker testing other rules
+    ruleset = ruleset_hash(config.setup_dir) if config.deploy else None
+    try:
+        if config.deploy:
+            with console.status("Deploying testing environment"):
+                if config.attach:
+                    testing_env.attach(ruleset)
+                else:
+                    testing_env.setup()
+                for endpoint in endpoints:
+                    if not testing_env.wait_ready(endpoint, config.ready_timeout):
+                        raise RuntimeError(
+                            f"{endpoint} not ready after {config.ready_timeout}s"
+                        )
+            logger.info("Deployed testing environment")
+
+        engine: Engine = {
+            "async": Engine.ASYNC,
+        }.get(config.engine, Engine.THREAD)
+        balancer: Optional[Balancer] = None
+        if len(endpoints) > 1:
+            balancer = Balancer(
+                endpoints,
+                {
+                    "least-loaded": Strategy.LEAST_LOADED,
+                }.get(config.balance, Strategy.ROUND_ROBIN),
+            )
+        limiter: Optional[AdaptiveLimiter] = None
+        if config.adaptive:
+            limiter = AdaptiveLimiter(
+                config.concurrency if engine == Engine.ASYNC else config.threads
+            )
+        pool = SessionPool(
+            pool_size=config.connection_pool_size(),
+            timeout=config.timeout,
+            keep_alive=config.keep_alive,
+        )
+
+        logger.info(f"Serving shards of {config.coordinator}")
+        shards = work(
+            config.coordinator,
+            config.host,
+            config.threads,
+            engine,
+            config.concurrency,
+            pool,
+            balancer,
+            limiter,
+            RetryPolicy(retries=config.retries),
+            config.name,
+            ruleset,
+            token=config.token,
+        )
+        logger.info(f"Sent {shards} shard(s)")
+        if balancer is not None:
+            logger.info(f"Requests per Replica: {balancer}")
+        if limiter is not None:
+            logger.info(f"Concurrency: {limiter}")
+        logger.info(f"Connection Reuse: {pool.stats()}")
+        pool.close()
+    except (Exception, KeyboardInterrupt) as e:
+        if isinstance(e, KeyboardInterrupt):
+            logger.error("Interrupted - will proceed to exit")
+        else:
+            logger.error(f"Fatal Error - will proceed to exit: {e}")
+            logger.error(f"Stack trace: {sys.exc_info()[2]}")
+    finally:
+        # An attached environment is kept warm for the next run
+        if config.deploy and not config.attach:
+            try:
+                with console.status("Decommissioning testing environment"):
+                    testing_env.teardown()
+                logger.info("Decommissioned testing environment")
+            except Exception as e:
+                logger.exception(f"Failed to teardown testing environment: {e}")
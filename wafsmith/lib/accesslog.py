@@ -0,0 +1,217 @@
+import os
+import re
+import mmap
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+from urllib.parse import parse_qsl, unquote
+from wafsmith.lib.corpus import list_files
+
+logger = logging.getLogger("accesslog")
+
+# Request line, status and user agent of the nginx combined log format
+_REQUEST = re.compile(
+    rb'\] "(?P<method>[A-Za-z]+) (?P<target>.*?)(?: HTTP/[\d.]+)?" (?P<status>\d{3}) \S+ "[^"]*" "(?P<agent>[^"]*)"'
+)
+# nginx escapes quotes and non-printable bytes of the request as \xHH
+_ESCAPED = re.compile(rb"\\x([0-9A-Fa-f]{2})")
+
+# Cheap signs of an attack, a payload without any of them is not worth a
+# model call: quotes, markup, comments, traversal, command substitution,
+# leftover (double) encoding and the keywords of the usual injection classes
+_SUSPICIOUS = re.compile(
+    r"""['"<>`;|{}\\]|--|/\*|\.\./|\.\.\\|%[0-9a-f]{2}|\$\(|\$\{"""
+    r"""|\b(?:union|select|insert|update|delete|drop|sleep|benchmark|waitfor|exec"""
+    r"""|script|alert|prompt|onerror|onload|javascript|eval|passwd|cmd|wget|curl"""
+    r"""|bash|php|base64)\b""",
+    re.IGNORECASE,
+)
+# Paths targeted by scanners, the path is then the payload
+_RECON = re.compile(
+    r"/(?:\.env|\.git|\.htaccess|wp-admin|wp-login|phpmyadmin|cgi-bin|server-status|etc/passwd)",
+    re.IGNORECASE,
+)
+# Longer values are flagged whatever their content (obfuscation, overflows)
+MAX_PLAIN_LENGTH = 256
+
+DEFAULT_CHUNK_SIZE = 64 * 1024 * 1024
+
+
+def suspicious(value: str) -> bool:
+    """
+    suspicious returns whether a decoded request value shows any sign of an attack
+    """
+    return len(value) > MAX_PLAIN_LENGTH or _SUSPICIOUS.search(value) is not None
+
+
+def decode_line(line: bytes) -> str:
+    """
+    decode_line returns a log line with the escapes of nginx and the URL encoding of the request undone
+    """
+    line = _ESCAPED.sub(lambda m: bytes([int(m.group(1), 16)]), line)
+    return unquote(line.decode("utf-8", "replace"), errors="replace")
+
+
+def request_candidates(line: bytes) -> Optional[List[str]]:
+    """
+    request_candidates returns the decoded values of a log line's request that could be attack payloads, None if it is not a request
+    """
+    match = _REQUEST.search(line)
+    if match is None:
+        return None
+    target = _ESCAPED.sub(lambda m: bytes([int(m.group(1), 16)]), match.group("target"))
+    path, _, query = target.decode("utf-8", "replace").partition("?")
+    candidates: List[str] = []
+    path = unquote(path, errors="replace")
+    if _RECON.search(path) or suspicious(path):
+        candidates.append(path)
+    if query:
+        values = [v for _, v in parse_qsl(query, keep_blank_values=True)]
+        if not values:
+            values = [unquote(query, errors="replace")]
+        candidates.extend(v for v in values if v and suspicious(v))
+    return candidates
+
+
+class ChunkResult(NamedTuple):
+    """Candidates of a byte range of a log file."""
+
+    lines: int
+    requests: int
+    # Candidate payload -> (occurrences, first decoded log line carrying it)
+    candidates: Dict[str, Tuple[int, str]]
+
+
+def chunk_ranges(path: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> List[Tuple[int, int]]:
+    """
+    chunk_ranges returns the byte ranges a log file is split into, each one parsed on its own
+    """
+    size = os.path.getsize(path)
+    return [(start, min(start + chunk_size, size)) for start in range(0, size, chunk_size)]
+
+
+def parse_chunk(path: str, start: int, end: int) -> ChunkResult:
+    """Parse the lines starting within a byte range of a log file.
+
+    A range owns every line starting in it, including the tail of its last
+    line past `end`, so that consecutive ranges cover each line exactly
+    once without being aligned on line boundaries beforehand.
+
+    Args:
+        path: Log file
+        start: Offset of the range
+        end: Offset past the range
+
+    Returns:
+        ChunkResult of the range
+    """
+    lines = requests = 0
+    candidates: Dict[str, Tuple[int, str]] = {}
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+        size = len(m)
+        position = start
+        if start > 0 and m[start - 1 : start] != b"\n":
+            # The line crossing the start belongs to the previous range
+            newline = m.find(b"\n", start)
+            position = size if newline < 0 else newline + 1
+        while position < end:
+            newline = m.find(b"\n", position)
+            stop = size if newline < 0 else newline
+            line = m[position:stop].rstrip(b"\r")
+            position = stop + 1
+            lines += 1
+            values = request_candidates(line)
+            if values is None:
+                continue
+            requests += 1
+            for value in values:
+                count, first = candidates.get(value, (0, ""))
+                candidates[value] = (count + 1, first or decode_line(line))
+    return ChunkResult(lines, requests, candidates)
+
+
+class Candidate(NamedTuple):
+    """A payload worth a closer look, deduplicated across the logs."""
+
+    payload: str
+    # First decoded log line carrying it, the context given to the model
+    line: str
+    count: int
+
+
+class ExtractStats:
+    """Counts of a pass over the logs."""
+
+    def __init__(self):
+        self.files = 0
+        self.chunks = 0
+        self.lines = 0
+        self.requests = 0
+        self.occurrences = 0
+
+    def __str__(self) -> str:
+        return (
+            f"{self.lines} line(s) in {self.files} file(s) / {self.chunks} chunk(s), "
+            f"{self.requests} request(s), {self.occurrences} suspicious value(s)"
+        )
+
+
+def _ranges(paths: Iterable[str], chunk_size: int) -> Iterator[Tuple[str, int, int]]:
+    for path in paths:
+        for start, end in chunk_ranges(path, chunk_size):
+            yield path, start, end
+
+
+def extract_candidates(
+    path: str,
+    workers: int = 0,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    stats: Optional[ExtractStats] = None,
+) -> List[Candidate]:
+    """Find the candidate payloads of nginx access logs.
+
+    The log files are memory-mapped and split into byte ranges parsed in
+    parallel; each request's path and query values are decoded and only
+    the suspicious ones are kept, once however often they occur.
+
+    Args:
+        path: Log file, or directory of log files
+        workers: Number of processes parsing the ranges, in-process when 0
+        chunk_size: Size in bytes of the ranges
+        stats: Optional counts of the pass, updated in place
+
+    Returns:
+        Candidates in order of first occurrence
+    """
+    stats = stats if stats is not None else ExtractStats()
+    paths: List[str] = []
+    for file_path in list_files(path):
+        if file_path.endswith(".gz"):
+            logger.warning(f"Skipped compressed log {file_path}, decompress it first")
+        elif os.path.getsize(file_path) > 0:
+            paths.append(file_path)
+    stats.files = len(paths)
+    ranges = list(_ranges(paths, chunk_size))
+    stats.chunks = len(ranges)
+
+    merged: Dict[str, Tuple[int, str]] = {}
+
+    def merge(result: ChunkResult):
+        stats.lines += result.lines
+        stats.requests += result.requests
+        for payload, (count, line) in result.candidates.items():
+            stats.occurrences += count
+            seen, first = merged.get(payload, (0, line))
+            merged[payload] = (seen + count, first)
+
+    if workers > 0:
+        paths_, starts, ends = zip(*ranges) if ranges else ((), (), ())
+        with ProcessPoolExecutor(workers, mp_context=get_context("spawn")) as executor:
+            # Results are merged in range order, keeping the first occurrences first
+            for result in executor.map(parse_chunk, paths_, starts, ends):
+                merge(result)
+    else:
+        for file_path, start, end in ranges:
+            merge(parse_chunk(file_path, start, end))
+    return [Candidate(payload, line, count) for payload, (count, line) in merged.items()]
@@ -0,0 +1,359 @@
+import os
+import re
+import json
+import mmap
+import time
+import logging
+import threading
+from collections import Counter, OrderedDict
+from typing import IO, Dict, List, NamedTuple, Optional, Tuple
+from wafsmith.lib.results import Outcome
+from wafsmith.lib.payload import REQUEST_ID_HEADER
+
+logger = logging.getLogger("audit")
+
+# Location of the audit log on the host, see the modsecurity/tmp volume of
+# the compose file
+DEFAULT_AUDIT_LOG = os.path.join("modsecurity", "tmp", "modsec_audit.log")
+
+# Anomaly score added by a rule, by ModSecurity severity (CRITICAL = 2)
+SEVERITY_SCORES = {2: 5, 3: 4, 4: 3, 5: 2}
+SEVERITY_NAMES = {"critical": 2, "error": 3, "warning": 4, "notice": 5}
+
+_TOTAL_SCORE = re.compile(r"(?:Total Score: |Inbound Scores: blocking=)(\d+)")
+_NATIVE_BOUNDARY = re.compile(rb"^-+([0-9A-Za-z]+)-+([A-Z])--\r?$")
+
+
+def _is_evaluation_rule(rule_id: int) -> bool:
+    # Blocking evaluation and correlation rules report the score, they do not match the payload
+    return rule_id // 1000 in (949, 959, 980)
+
+
+class AuditEntry(NamedTuple):
+    """Rules a request matched, as recorded in the audit log."""
+
+    request_id: Optional[str]
+    status_code: int
+    rule_ids: Tuple[int, ...]
+    anomaly_score: int
+
+
+def _entry(
+    request_id: Optional[str],
+    status_code: int,
+    rules: List[Tuple[int, int]],
+    messages: List[str],
+) -> AuditEntry:
+    rule_ids: List[int] = []
+    score = 0
+    for rule_id, severity in rules:
+        if _is_evaluation_rule(rule_id):
+            continue
+        if rule_id not in rule_ids:
+            rule_ids.append(rule_id)
+            score += SEVERITY_SCORES.get(severity, 0)
+    # The score computed by the CRS itself, when reported, is authoritative
+    for message in messages:
+        match = _TOTAL_SCORE.search(message)
+        if match:
+            score = int(match.group(1))
+    return AuditEntry(request_id, status_code, tuple(rule_ids), score)
+
+
+def parse_json_entry(line: bytes) -> Optional[AuditEntry]:
+    """
+    parse_json_entry returns the entry of a JSON audit log line (MODSEC_AUDIT_LOG_FORMAT=JSON), None if it is not one
+    """
+    try:
+        transaction = json.loads(line)["transaction"]
+    except (ValueError, KeyError, TypeError):
+        return None
+    headers = transaction.get("request", {}).get("headers", {})
+    request_id = next(
+        (v for k, v in headers.items() if k.lower() == REQUEST_ID_HEADER), None
+    )
+    rules: List[Tuple[int, int]] = []
+    messages: List[str] = []
+    for message in transaction.get("messages", []):
+        details = message.get("details", {})
+        rule_id = str(details.get("ruleId", ""))
+        if rule_id.isdigit():
+            severity = str(details.get("severity", ""))
+            rules.append((int(rule_id), int(severity) if severity.isdigit() else 0))
+        messages.append(message.get("message", ""))
+    status_code = transaction.get("response", {}).get("http_code", 0)
+    return _entry(request_id, int(status_code or 0), rules, messages)
+
+
+def parse_native_entry(sections: Dict[str, List[bytes]]) -> AuditEntry:
+    """
+    parse_native_entry returns the entry of a native serial audit log record, from its lines by section letter
+    """
+    request_id = None
+    for line in sections.get("B", [])[1:]:
+        name, _, value = line.decode("utf-8", "replace").partition(":")
+        if name.strip().lower() == REQUEST_ID_HEADER:
+            request_id = value.strip()
+    status_code = 0
+    response = sections.get("F", [])
+    if response:
+        parts = response[0].split()
+        if len(parts) > 1 and parts[1].isdigit():
+            status_code = int(parts[1])
+    rules: List[Tuple[int, int]] = []
+    messages: List[str] = []
+    for raw in sections.get("H", []):
+        line = raw.decode("utf-8", "replace")
+        match = re.search(r'\[id "(\d+)"\]', line)
+        if match:
+            severity = re.search(r'\[severity "(\w+)"\]', line)
+            level = 0
+            if severity:
+                value = severity.group(1)
+                level = int(value) if value.isdigit() else SEVERITY_NAMES.get(value.lower(), 0)
+            rules.append((int(match.group(1)), level))
+        messages.append(line)
+    return _entry(request_id, status_code, rules, messages)
+
+
+class AuditLogReader:
+    """Incremental reader of a ModSecurity serial audit log.
+
+    Every `read` maps the file and parses only what was appended since the
+    previous one, remembering the offset of the last complete entry so that
+    a partially written entry is picked up on the next read. Both the JSON
+    (one transaction per line) and the native (sections A to Z) formats are
+    understood. A file shorter than the offset was truncated or rotated and
+    is read again from the start.
+
+    Args:
+        path: Audit log file
+        offset: Offset to start reading at, the current end of the file
+            (skipping the entries of previous runs) when None
+    """
+
+    def __init__(self, path: str, offset: Optional[int] = None):
+        self.path = path
+        self.offset = offset if offset is not None else self._size()
+        self.entries = 0
+
+    def _size(self) -> int:
+        try:
+            return os.path.getsize(self.path)
+        except OSError:
+            return 0
+
+    def read(self) -> List[AuditEntry]:
+        size = self._size()
+        if size < self.offset:
+            logger.info(f"{self.path} was truncated, reading it from the start")
+            self.offset = 0
+        if size == self.offset:
+            return []
+        with open(self.path, "rb") as f, mmap.mmap(
+            f.fileno(), size, access=mmap.ACCESS_READ
+        ) as m:
+            entries, consumed = self._parse(m, self.offset, size)
+        self.offset = consumed
+        self.entries += len(entries)
+        return entries
+
+    @staticmethod
+    def _parse(m: mmap.mmap, start: int, end: int) -> Tuple[List[AuditEntry], int]:
+        entries: List[AuditEntry] = []
+        consumed = start
+        sections: Optional[Dict[str, List[bytes]]] = None
+        current: Optional[List[bytes]] = None
+        position = start
+        while position < end:
+            newline = m.find(b"\n", position, end)
+            if newline < 0:
+                break  # Incomplete line, read again next time
+            line = m[position:newline]
+            position = newline + 1
+            boundary = _NATIVE_BOUNDARY.match(line)
+            if boundary:
+                section = boundary.group(2).decode()
+                if section == "A":
+                    sections = {}
+                if sections is None:
+                    continue  # Record started before the offset
+                if section == "Z":
+                    entries.append(parse_native_entry(sections))
+                    sections = current = None
+                    consumed = position
+                    continue
+                current = sections.setdefault(section, [])
+            elif sections is not None:
+                if current is not None:
+                    current.append(line.rstrip(b"\r"))
+            else:
+                if line.startswith(b"{"):
+                    entry = parse_json_entry(line)
+                    if entry is not None:
+                        entries.append(entry)
+                consumed = position
+        return entries, consumed
+
+
+class AuditCorrelator:
+    """Joins the audit log entries to the outcomes of the run as they come.
+
+    Requests carry a REQUEST_ID_HEADER of the form
+    `<run>.<phase>.<lane>.<index>`; a background thread tails the audit log
+    and, as soon as both the outcome and its entry are known (in either
+    order), streams the result annotated with the matched rule ids and the
+    anomaly score to `output_path` as a JSONL line. Outcomes without an
+    entry after `grace` seconds (requests the WAF did not log) are written
+    without annotation. Entries wait for their outcome however long it
+    takes, since outcomes are reported in submission order and a slow or
+    retried request holds back those after it; the entries never claimed
+    (earlier attempts of retried requests, entries logged after their
+    outcome expired) are dropped on close.
+
+    Args:
+        reader: Audit log reader
+        run: Identifier of the run, prefixing the request ids
+        output_path: Optional JSONL file receiving the annotated results
+        interval: Seconds between two reads of the audit log
+        grace: Seconds an outcome waits for its audit log entry
+    """
+
+    def __init__(
+        self,
+        reader: AuditLogReader,
+        run: str,
+        output_path: Optional[str] = None,
+        interval: float = 0.5,
+        grace: float = 10.0,
+    ):
+        self.reader = reader
+        self.run = run
+        self.output_path = output_path
+        self.interval = interval
+        self.grace = grace
+        self.attributed = 0
+        self.unaudited = 0
+        self.rules: Dict[str, Counter] = {}
+        self._pending: "OrderedDict[str, Tuple[float, str, Optional[str], Outcome]]" = OrderedDict()
+        self._early: Dict[str, AuditEntry] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._output: Optional[IO[str]] = None
+
+    def start(self) -> "AuditCorrelator":
+        if self.output_path:
+            self._output = open(self.output_path, "w")
+        self._thread.start()
+        return self
+
+    def request_id(self, phase: str) -> str:
+        """
+        request_id returns the prefix of the request ids of a phase of the run (attack, traffic)
+        """
+        return f"{self.run}.{phase}"
+
+    def handler(self, on_result, phase: str, lane: int, kind: str, cell: Optional[str] = None):
+        """
+        handler returns on_result also waiting for the audit log entry of every outcome sent to the WAF
+        """
+        prefix = f"{self.request_id(phase)}.{lane}."
+
+        def handle(outcome: Outcome):
+            on_result(outcome)
+            if not outcome.cached:
+                self.expect(f"{prefix}{outcome.index}", kind, cell, outcome)
+
+        return handle
+
+    def expect(self, request_id: str, kind: str, cell: Optional[str], outcome: Outcome):
+        with self._lock:
+            early = self._early.pop(request_id, None)
+            if early is not None:
+                self._emit(kind, cell, outcome, early)
+            else:
+                self._pending[request_id] = (time.monotonic(), kind, cell, outcome)
+
+    def close(self):
+        """
+        close waits up to grace seconds for the entries of the outcomes still pending, then stops tailing
+        """
+        if self._stop.is_set():
+            return
+        deadline = time.monotonic() + self.grace
+        while time.monotonic() < deadline:
+            with self._lock:
+                if not self._pending:
+                    break
+            time.sleep(self.interval)
+        self._stop.set()
+        self._thread.join()
+        self._poll(expire_all=True)
+        if self._output is not None:
+            self._output.close()
+            self._output = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self._poll()
+            except Exception as e:
+                logger.error(f"Failed to read the audit log: {e}")
+
+    def _poll(self, expire_all: bool = False):
+        entries = self.reader.read()
+        now = time.monotonic()
+        with self._lock:
+            for entry in entries:
+                if entry.request_id is None or not entry.request_id.startswith(self.run):
+                    continue
+                pending = self._pending.pop(entry.request_id, None)
+                if pending is not None:
+                    _, kind, cell, outcome = pending
+                    self._emit(kind, cell, outcome, entry)
+                else:
+                    self._early[entry.request_id] = entry
+            # Outcomes are in arrival order, the oldest come first
+            while self._pending:
+                request_id, (since, kind, cell, outcome) = next(iter(self._pending.items()))
+                if not expire_all and now - since < self.grace:
+                    break
+                del self._pending[request_id]
+                self._emit(kind, cell, outcome, None)
+            if expire_all:
+                self._early.clear()
+            if self._output is not None:
+                self._output.flush()
+
+    def _emit(self, kind: str, cell: Optional[str], outcome: Outcome, entry: Optional[AuditEntry]):
+        if entry is None:
+            self.unaudited += 1
+        else:
+            self.attributed += 1
+            self.rules.setdefault(kind, Counter()).update(entry.rule_ids)
+        if self._output is None:
+            return
+        record = {
+            "kind": kind,
+            "index": outcome.index,
+            "payload": outcome.payload,
+            "status": outcome.status_code,
+            "rules": list(entry.rule_ids) if entry is not None else None,
+            "anomaly_score": entry.anomaly_score if entry is not None else None,
+        }
+        if cell is not None:
+            record["cell"] = cell
+        self._output.write(json.dumps(record) + "\n")
+
+    def report(self, top: int = 10):
+        """
+        report logs how many results were attributed and the rules matching most often, per kind of payload
+        """
+        logger.info(
+            f"Audit Log: {self.attributed} result(s) attributed, {self.unaudited} not found in {self.reader.path}"
+        )
+        for kind, counts in sorted(self.rules.items()):
+            if counts:
+                rows = ", ".join(f"{rule_id}={count}" for rule_id, count in counts.most_common(top))
+                logger.info(f"Matching Rules [{kind}]: {rows}")
@@ -0,0 +1,67 @@
+import enum
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Iterator, List, Sequence
+
+logger = logging.getLogger("balancer")
+
+
+class Strategy(enum.Enum):
+    ROUND_ROBIN = 1
+    LEAST_LOADED = 2
+
+
+class Balancer:
+    """Spreads requests across the replicas of the WAF.
+
+    Round-robin hands out the endpoints in turn, least-loaded picks the
+    replica with the fewest requests in flight (ties broken round-robin) so
+    that a replica slowed down by expensive payloads receives less work.
+    Both the thread and the async engines can share one balancer.
+    """
+
+    def __init__(self, endpoints: Sequence[str], strategy: Strategy = Strategy.ROUND_ROBIN):
+        if not endpoints:
+            raise ValueError("at least one endpoint is required")
+        self.endpoints = list(endpoints)
+        self.strategy = strategy
+        self.in_flight: List[int] = [0] * len(self.endpoints)
+        self.sent: List[int] = [0] * len(self.endpoints)
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> int:
+        """
+        acquire returns the replica the next request goes to and counts it as in flight
+        """
+        with self._lock:
+            count = len(self.endpoints)
+            if self.strategy == Strategy.LEAST_LOADED:
+                replica = min(
+                    range(count),
+                    key=lambda i: (self.in_flight[i], (i - self._next) % count),
+                )
+            else:
+                replica = self._next
+            self._next = (replica + 1) % count
+            self.in_flight[replica] += 1
+            self.sent[replica] += 1
+            return replica
+
+    def release(self, replica: int):
+        with self._lock:
+            self.in_flight[replica] -= 1
+
+    @contextmanager
+    def endpoint(self) -> Iterator[str]:
+        replica = self.acquire()
+        try:
+            yield self.endpoints[replica]
+        finally:
+            self.release(replica)
+
+    def __str__(self) -> str:
+        return ", ".join(
+            f"{endpoint}: {sent}" for endpoint, sent in zip(self.endpoints, self.sent)
+        )
@@ -0,0 +1,198 @@
+import os
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+from wafsmith.lib.corpus import list_files
+
+logger = logging.getLogger("cache")
+
+# Everything under these paths of the setup directory changes what the WAF
+# answers: the CRS rules, the tuning exclusions and the compose file carrying
+# the CRS environment variables (paranoia level, anomaly thresholds, ...)
+RULESET_PATHS = ["rules", "rules-tuning", "docker-compose.yml"]
+
+
+def ruleset_hash(setup_dir: str) -> str:
+    """
+    ruleset_hash returns the content hash of the ruleset mounted into the testing environment
+    """
+    digest = hashlib.sha256()
+    for name in RULESET_PATHS:
+        path = os.path.join(setup_dir, name)
+        if not os.path.exists(path):
+            continue
+        for file_path in list_files(path):
+            digest.update(os.path.relpath(file_path, setup_dir).encode("utf-8"))
+            digest.update(b"\0")
+            with open(file_path, "rb") as f:
+                digest.update(hashlib.sha256(f.read()).digest())
+    return digest.hexdigest()
+
+
+def verdict_context(ruleset: str, method: str, position: str, encoding: str) -> str:
+    """
+    verdict_context returns the part of the cache key shared by every payload of a run
+    """
+    return f"{ruleset}\n{method}\n{position}\n{encoding}"
+
+
+class VerdictCache:
+    """On-disk cache of WAF verdicts backed by sqlite.
+
+    Verdicts are keyed by the hash of the ruleset together with how the
+    payload was sent (method, position, encoding), so editing a rule
+    invalidates every verdict while unrelated edits keep them. The cache
+    holds at most `max_entries` verdicts and evicts the least recently used
+    ones on close.
+    """
+
+    def __init__(self, path: str, max_entries: int = 1_000_000):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS verdicts ("
+            "key TEXT PRIMARY KEY, status INTEGER NOT NULL, last_used INTEGER NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS verdicts_last_used ON verdicts (last_used)"
+        )
+        # Per-rule snapshots of the rulesets the verdicts were obtained with
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS snapshots ("
+            "ruleset TEXT PRIMARY KEY, snapshot TEXT NOT NULL, created INTEGER NOT NULL)"
+        )
+        # Verdicts are written in batches; uncommitted ones are still served
+        self._pending: Dict[str, Tuple[int, int]] = {}
+        self._touched: List[Tuple[int, str]] = []
+
+    @staticmethod
+    def key(context: str, payload: str) -> str:
+        return hashlib.sha256(f"{context}\n{payload}".encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[int]:
+        with self._lock:
+            if key in self._pending:
+                self.hits += 1
+                status_code = self._pending[key][0]
+                self._pending[key] = (status_code, time.time_ns())
+                return status_code
+            row = self._db.execute(
+                "SELECT status FROM verdicts WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._touched.append((time.time_ns(), key))
+            self._maybe_commit()
+            return row[0]
+
+    def contains(self, key: str) -> bool:
+        with self._lock:
+            if key in self._pending:
+                return True
+            row = self._db.execute(
+                "SELECT 1 FROM verdicts WHERE key = ?", (key,)
+            ).fetchone()
+            return row is not None
+
+    def put(self, key: str, status_code: int):
+        with self._lock:
+            self._pending[key] = (status_code, time.time_ns())
+            self._maybe_commit()
+
+    def save_snapshot(self, ruleset: str, snapshot: str):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO snapshots (ruleset, snapshot, created) VALUES (?, ?, ?)",
+                (ruleset, snapshot, time.time_ns()),
+            )
+            self._db.commit()
+
+    def latest_snapshot(self, exclude: Optional[str] = None) -> Optional[str]:
+        """
+        latest_snapshot returns the snapshot of the ruleset most recently saved, other than exclude
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT snapshot FROM snapshots WHERE ruleset != ? ORDER BY created DESC LIMIT 1",
+                (exclude or "",),
+            ).fetchone()
+            return row[0] if row is not None else None
+
+    def view(self, context: str) -> "CacheView":
+        return CacheView(self, context)
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._commit()
+            return self._db.execute("SELECT COUNT(*) FROM verdicts").fetchone()[0]
+
+    def evict(self) -> int:
+        """
+        evict drops the least recently used verdicts beyond max_entries and returns how many were dropped
+        """
+        with self._lock:
+            self._commit()
+            count = self._db.execute("SELECT COUNT(*) FROM verdicts").fetchone()[0]
+            excess = count - self.max_entries
+            if excess <= 0:
+                return 0
+            self._db.execute(
+                "DELETE FROM verdicts WHERE key IN "
+                "(SELECT key FROM verdicts ORDER BY last_used ASC LIMIT ?)",
+                (excess,),
+            )
+            self._db.commit()
+            return excess
+
+    def close(self):
+        evicted = self.evict()
+        if evicted:
+            logger.info(f"Evicted {evicted} least recently used verdict(s)")
+        with self._lock:
+            self._db.close()
+
+    def _maybe_commit(self):
+        if len(self._pending) + len(self._touched) >= 1000:
+            self._commit()
+
+    def _commit(self):
+        if self._pending:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO verdicts (key, status, last_used) VALUES (?, ?, ?)",
+                [(key, status, used) for key, (status, used) in self._pending.items()],
+            )
+            self._pending.clear()
+        if self._touched:
+            self._db.executemany(
+                "UPDATE verdicts SET last_used = ? WHERE key = ?", self._touched
+            )
+            self._touched.clear()
+        self._db.commit()
+
+
+class CacheView:
+    """VerdictCache bound to one ruleset and request shape."""
+
+    def __init__(self, cache: VerdictCache, context: str):
+        self.cache = cache
+        self.context = context
+
+    def get(self, payload: str) -> Optional[int]:
+        return self.cache.get(VerdictCache.key(self.context, payload))
+
+    def put(self, payload: str, status_code: int):
+        self.cache.put(VerdictCache.key(self.context, payload), status_code)
+
+    def contains(self, payload: str) -> bool:
+        return self.cache.contains(VerdictCache.key(self.context, payload))
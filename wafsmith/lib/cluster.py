@@ -0,0 +1,171 @@
+import hashlib
+import logging
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+from wafsmith.lib.dedup import normalize
+
+logger = logging.getLogger("cluster")
+
+DEFAULT_NUM_PERM = 64
+DEFAULT_NGRAM = 3
+DEFAULT_THRESHOLD = 0.5
+
+# Members compared with each other when electing the representative of a
+# cluster, bounding the election of large clusters
+MEDOID_SAMPLE = 64
+
+
+def shingles(payload: str, n: int = DEFAULT_NGRAM) -> List[int]:
+    """
+    shingles returns the 64-bit hashes of the character n-grams of a normalized payload
+    """
+    text = normalize(payload)
+    grams = {text[i : i + n] for i in range(max(1, len(text) - n + 1))}
+    return [
+        int.from_bytes(
+            hashlib.blake2b(gram.encode("utf-8", "surrogatepass"), digest_size=8).digest(),
+            "little",
+        )
+        for gram in grams
+    ]
+
+
+def lsh_bands(num_perm: int, threshold: float) -> Tuple[int, int]:
+    """
+    lsh_bands returns the (bands, rows) splitting a signature whose collision threshold (1/bands)^(1/rows) is closest to threshold
+    """
+    options = [(num_perm // rows, rows) for rows in range(1, num_perm + 1) if num_perm % rows == 0]
+    return min(options, key=lambda option: abs((1 / option[0]) ** (1 / option[1]) - threshold))
+
+
+class MinHasher:
+    """MinHash signatures of payloads over their character n-grams.
+
+    Signatures are computed with one permutation hashing: the hash of every
+    n-gram picks one of `num_perm` bins by its low bits and competes for the
+    minimum of that bin by its high bits, so that a payload is hashed once
+    rather than once per bin. Empty bins (payloads with few n-grams) borrow
+    the value of the next filled bin, offset by the distance to it
+    (densification by rotation). The fraction of equal positions of two
+    signatures estimates the Jaccard similarity of the n-gram sets of the
+    payloads.
+    """
+
+    def __init__(self, num_perm: int = DEFAULT_NUM_PERM, ngram: int = DEFAULT_NGRAM):
+        self.num_perm = num_perm
+        self.ngram = ngram
+        # Larger than any value of a bin, so that borrowed values never equal genuine ones
+        self._offset = (1 << 64) // num_perm + 1
+
+    def signature(self, payload: str) -> Tuple[int, ...]:
+        bins: List[Optional[int]] = [None] * self.num_perm
+        for h in shingles(payload, self.ngram):
+            index, value = h % self.num_perm, h // self.num_perm
+            current = bins[index]
+            if current is None or value < current:
+                bins[index] = value
+        signature: List[int] = []
+        for index in range(self.num_perm):
+            distance = 0
+            while bins[(index + distance) % self.num_perm] is None:
+                distance += 1
+            signature.append(bins[(index + distance) % self.num_perm] + distance * self._offset)
+        return tuple(signature)
+
+
+def similarity(a: Sequence[int], b: Sequence[int]) -> float:
+    """
+    similarity returns the Jaccard similarity estimated from two MinHash signatures
+    """
+    return sum(1 for x, y in zip(a, b) if x == y) / len(a)
+
+
+class Cluster(NamedTuple):
+    """A family of near-identical payloads."""
+
+    representative: str
+    count: int
+    members: List[str]
+
+
+class PayloadClusterer:
+    """Groups payloads into families of near-identical variants.
+
+    Payloads are MinHashed and bucketed by bands of their signatures
+    (locality-sensitive hashing), so that only payloads sharing a bucket are
+    compared: each payload is compared with the leaders of the clusters
+    whose members share a bucket with it and joins the most similar one when
+    their estimated similarity reaches `threshold`, which takes time linear
+    in the number of payloads. The representative of a cluster is its member
+    most similar to the others, the shortest one on ties.
+
+    Args:
+        threshold: Estimated Jaccard similarity joining two payloads
+        num_perm: Number of hash functions of the signatures
+        ngram: Length of the character n-grams
+    """
+
+    def __init__(
+        self,
+        threshold: float = DEFAULT_THRESHOLD,
+        num_perm: int = DEFAULT_NUM_PERM,
+        ngram: int = DEFAULT_NGRAM,
+    ):
+        self.threshold = threshold
+        self.hasher = MinHasher(num_perm, ngram)
+        self.bands, self.rows = lsh_bands(num_perm, threshold)
+        self.comparisons = 0
+
+    def cluster(self, payloads: Sequence[str]) -> List[Cluster]:
+        """
+        cluster returns the clusters of the payloads, the largest first and otherwise in order of first occurrence
+        """
+        # Identical payloads are counted, not hashed again
+        counts: Dict[str, int] = {}
+        for payload in payloads:
+            counts[payload] = counts.get(payload, 0) + 1
+        unique = list(counts)
+        signatures = [self.hasher.signature(payload) for payload in unique]
+
+        # Every payload joins the cluster of the most similar leader sharing
+        # a bucket with it, or leads a new one: comparing with leaders only
+        # keeps chains of small differences from merging unrelated payloads
+        groups: Dict[int, List[int]] = {}
+        buckets: Dict[Tuple[int, Tuple[int, ...]], int] = {}
+        for i, signature in enumerate(signatures):
+            keys = [
+                (band, signature[band * self.rows : (band + 1) * self.rows])
+                for band in range(self.bands)
+            ]
+            best, best_similarity = i, self.threshold
+            for leader in dict.fromkeys(buckets[key] for key in keys if key in buckets):
+                self.comparisons += 1
+                estimate = similarity(signature, signatures[leader])
+                if estimate >= best_similarity:
+                    best, best_similarity = leader, estimate
+            groups.setdefault(best, []).append(i)
+            for key in keys:
+                buckets.setdefault(key, best)
+
+        clusters = [
+            Cluster(
+                unique[self._medoid(members, signatures, unique)],
+                sum(counts[unique[i]] for i in members),
+                [unique[i] for i in members],
+            )
+            for members in groups.values()
+        ]
+        # sorted is stable, clusters of equal size keep their order of first occurrence
+        return sorted(clusters, key=lambda cluster: -cluster.count)
+
+    @staticmethod
+    def _medoid(members: List[int], signatures: List[Tuple[int, ...]], unique: List[str]) -> int:
+        if len(members) <= 2:
+            return min(members, key=lambda i: len(unique[i]))
+        sample = members[:MEDOID_SAMPLE]
+        return max(
+            sample,
+            key=lambda i: (
+                sum(similarity(signatures[i], signatures[j]) for j in sample if j != i),
+                -len(unique[i]),
+            ),
+        )
@@ -11,6 +11,9 @@ logging.basicConfig(
     datefmt="[%X]",
     handlers=[RichHandler(rich_tracebacks=True, markup=True)],
 )
+# The HTTP clients log every request / connection, which floods the console
+for name in ("httpx", "httpcore", "urllib3"):
+    logging.getLogger(name).setLevel(logging.WARNING)
 
 
 def init_logging(level: str):
@@ -0,0 +1,80 @@
+import os
+import bisect
+import logging
+from typing import Iterable, Iterator, List, Optional
+
+logger = logging.getLogger("corpus")
+
+
+def list_files(path: str) -> Iterator[str]:
+    """
+    list_files yields the files under a directory (or the file itself) in a stable order
+    """
+    if os.path.isfile(path):
+        yield path
+        return
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for file in sorted(files):
+            yield os.path.join(root, file)
+
+
+def iter_file_content(path: str) -> Iterator[str]:
+    """
+    iter_file_content lazily yields the stripped lines of every file under path
+    """
+    for file_path in list_files(path):
+        with open(file_path, "r", errors="replace") as f:
+            for line in f:
+                yield line.strip()
+
+
+class Corpus:
+    """Re-iterable payload corpus.
+
+    Payloads are streamed from the files under `path` on every iteration so
+    that only the lines currently being sent are held in memory. An in-memory
+    list can be given instead for small, programmatic corpora.
+    """
+
+    def __init__(
+        self, path: Optional[str] = None, payloads: Optional[Iterable[str]] = None
+    ):
+        self.path = path
+        self.payloads = payloads
+        # Index of the first payload of every file read so far, see `source`
+        self._starts: List[int] = []
+        self._files: List[str] = []
+
+    def __iter__(self) -> Iterator[str]:
+        if self.payloads is not None:
+            yield from self.payloads
+        elif self.path is not None and os.path.exists(self.path):
+            self._starts, self._files = [], []
+            index = 0
+            for file_path in list_files(self.path):
+                self._starts.append(index)
+                self._files.append(
+                    os.path.relpath(file_path, self.path)
+                    if file_path != self.path
+                    else os.path.basename(file_path)
+                )
+                for payload in iter_file_content(file_path):
+                    yield payload
+                    index += 1
+
+    def source(self, index: int) -> Optional[str]:
+        """
+        source returns the file (relative to the corpus path) the payload at index was read from
+        """
+        position = bisect.bisect_right(self._starts, index) - 1
+        return self._files[position] if position >= 0 else None
+
+    def location(self, index: int) -> Optional[str]:
+        """
+        location returns the file:line the payload at index was read from
+        """
+        position = bisect.bisect_right(self._starts, index) - 1
+        if position < 0:
+            return None
+        return f"{self._files[position]}:{index - self._starts[position] + 1}"
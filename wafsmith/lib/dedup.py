@@ -0,0 +1,78 @@
+import os
+import sqlite3
+import hashlib
+import logging
+import tempfile
+from typing import Dict, Optional
+from urllib.parse import unquote_plus
+
+logger = logging.getLogger("dedup")
+
+
+def normalize(payload: str) -> str:
+    """
+    normalize URL-decodes a payload (including '+' as space) and case folds it
+    """
+    return unquote_plus(payload).casefold()
+
+
+class Deduplicator:
+    """Maps every payload to the index of the first identical payload.
+
+    Identity is a 128-bit digest of the payload, or of its normalized form
+    when `normalize_payloads` is set so that e.g. `<A+HREF=x>` and
+    `<a%20href=x>` are grouped together. Digests are kept in memory unless
+    `on_disk` is set, in which case they are indexed in a temporary sqlite
+    file so that corpora larger than memory can be deduplicated.
+    """
+
+    def __init__(self, normalize_payloads: bool = False, on_disk: bool = False):
+        self.normalize_payloads = normalize_payloads
+        self.unique = 0
+        self.duplicates = 0
+        self._seen: Dict[bytes, int] = {}
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_path: Optional[str] = None
+        if on_disk:
+            fd, self._db_path = tempfile.mkstemp(prefix="wafsmith-dedup-", suffix=".db")
+            os.close(fd)
+            self._db = sqlite3.connect(self._db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=OFF")
+            self._db.execute("PRAGMA synchronous=OFF")
+            self._db.execute(
+                "CREATE TABLE seen (key BLOB PRIMARY KEY, idx INTEGER NOT NULL) WITHOUT ROWID"
+            )
+
+    def key(self, payload: str) -> bytes:
+        if self.normalize_payloads:
+            payload = normalize(payload)
+        return hashlib.blake2b(
+            payload.encode("utf-8", "surrogatepass"), digest_size=16
+        ).digest()
+
+    def first_index(self, payload: str, index: int) -> int:
+        """
+        first_index returns the index of the payload's representative, which is index itself for a new payload
+        """
+        key = self.key(payload)
+        if self._db is None:
+            first = self._seen.setdefault(key, index)
+        else:
+            self._db.execute(
+                "INSERT OR IGNORE INTO seen (key, idx) VALUES (?, ?)", (key, index)
+            )
+            first = self._db.execute(
+                "SELECT idx FROM seen WHERE key = ?", (key,)
+            ).fetchone()[0]
+        if first == index:
+            self.unique += 1
+        else:
+            self.duplicates += 1
+        return first
+
+    def close(self):
+        self._seen.clear()
+        if self._db is not None:
+            self._db.close()
+            os.unlink(self._db_path)
+            self._db = None
@@ -0,0 +1,296 @@
+import os
+import re
+import hashlib
+import logging
+from typing import Callable, Dict, List, NamedTuple, Optional, Set, Tuple
+from pydantic import BaseModel
+from wafsmith.lib.corpus import list_files
+from wafsmith.lib.cache import CacheView
+from wafsmith.lib.payload import Cell
+from wafsmith.lib.rules import (
+    PAYLOAD_HEADER,
+    PAYLOAD_VARIABLES,
+    TRANSFORMATIONS,
+    compile_operator,
+    iter_directives,
+    parse_actions,
+    parse_ids,
+    parse_variables,
+    request_targets,
+)
+
+logger = logging.getLogger("delta")
+
+# Directives whose effect is scoped to the rules they name; any other
+# directive (SecAction, SecRuleUpdateTargetById, SecDefaultAction, ...) may
+# change the verdict of every payload
+SCOPED_DIRECTIVES = ("SecRule", "SecRuleRemoveById", "SecMarker")
+
+
+class RuleSnapshot(BaseModel):
+    """Per-rule content of a ruleset, diffed against the next run's.
+
+    Rules are keyed by id (or by file and position for the rare rules
+    without one) and hold the tokens of their directive, one list per link
+    of a chain. Rules removed with SecRuleRemoveById are left out. The data
+    files are recorded by hash, and everything else that can change the
+    verdict of any payload (compose settings, global directives, other
+    files) is folded into `settings`.
+    """
+
+    ruleset: str
+    rules: Dict[str, List[List[str]]] = {}
+    data: Dict[str, str] = {}
+    settings: str = ""
+
+    @classmethod
+    def take(cls, setup_dir: str, ruleset: str) -> "RuleSnapshot":
+        """Snapshot the rules of a testing environment setup directory.
+
+        Args:
+            setup_dir: Directory holding the docker compose file, the rules
+                and the rule tuning files
+            ruleset: Hash of the ruleset, see ruleset_hash
+
+        Returns:
+            RuleSnapshot of the setup directory
+        """
+        rules: Dict[str, List[List[str]]] = {}
+        data: Dict[str, str] = {}
+        removed: List[Tuple[int, int]] = []
+        settings = hashlib.sha256()
+        compose = os.path.join(setup_dir, "docker-compose.yml")
+        if os.path.exists(compose):
+            with open(compose, "rb") as f:
+                settings.update(f.read())
+        for name in ("rules", "rules-tuning"):
+            path = os.path.join(setup_dir, name)
+            if not os.path.exists(path):
+                continue
+            for file_path in list_files(path):
+                relpath = os.path.relpath(file_path, setup_dir)
+                if not file_path.endswith(".conf"):
+                    with open(file_path, "rb") as f:
+                        digest = hashlib.sha256(f.read()).hexdigest()
+                    if file_path.endswith(".data"):
+                        data[os.path.basename(file_path)] = digest
+                    else:
+                        settings.update(f"{relpath}\0{digest}\n".encode("utf-8"))
+                    continue
+                links: List[List[str]] = []
+                for position, directive in enumerate(iter_directives(file_path)):
+                    if directive.name == "SecRuleRemoveById":
+                        removed.extend(parse_ids(directive.args))
+                    if directive.name not in SCOPED_DIRECTIVES:
+                        settings.update(repr(directive).encode("utf-8"))
+                        continue
+                    if directive.name != "SecRule":
+                        continue
+                    links.append([directive.name, *directive.args])
+                    actions = parse_actions(directive.args[2]) if len(directive.args) > 2 else []
+                    if any(action == "chain" for action, _ in actions):
+                        continue
+                    key = _rule_key(links[0], f"{relpath}#{position}")
+                    while key in rules:
+                        key += "'"
+                    rules[key] = links
+                    links = []
+        rules = {
+            key: links
+            for key, links in rules.items()
+            if not any(start <= _rule_id(links[0]) <= end for start, end in removed)
+        }
+        return cls(ruleset=ruleset, rules=rules, data=data, settings=settings.hexdigest())
+
+
+def _rule_id(link: List[str]) -> int:
+    actions = parse_actions(link[3]) if len(link) > 3 else []
+    for action, argument in actions:
+        if action == "id" and argument.isdigit():
+            return int(argument)
+    return -1
+
+
+def _rule_key(link: List[str], fallback: str) -> str:
+    rule_id = _rule_id(link)
+    return f"id:{rule_id}" if rule_id >= 0 else fallback
+
+
+class Change(NamedTuple):
+    """A rule added, removed or edited between two snapshots."""
+
+    key: str
+    before: Optional[List[List[str]]]
+    after: Optional[List[List[str]]]
+    # Whether the data files the previous version reads changed since
+    stale_data: bool = False
+
+
+def diff(previous: RuleSnapshot, current: RuleSnapshot) -> Optional[List[Change]]:
+    """
+    diff returns the rules changed from previous to current, None when a change outside of the rules may affect every payload
+    """
+    if previous.settings != current.settings:
+        return None
+    changed_data = {
+        name
+        for name in set(previous.data) | set(current.data)
+        if previous.data.get(name) != current.data.get(name)
+    }
+    changes: List[Change] = []
+    for key in sorted(set(previous.rules) | set(current.rules)):
+        before, after = previous.rules.get(key), current.rules.get(key)
+        stale = before is not None and bool(_data_files(before) & changed_data)
+        if before != after or stale or (after is not None and _data_files(after) & changed_data):
+            changes.append(Change(key, before, after, stale))
+    return changes
+
+
+def _data_files(links: List[List[str]]) -> Set[str]:
+    return {
+        os.path.basename(token)
+        for link in links
+        for token in re.findall(r"[^\s\"']+\.data\b", " ".join(link[1:3]))
+    }
+
+
+# Reports whether a rule could match the request targets of a payload
+Predicate = Callable[[Dict[str, List[Tuple[str, str]]]], bool]
+
+
+def _always(targets: Dict[str, List[Tuple[str, str]]]) -> bool:
+    return True
+
+
+def compile_link(link: List[str], rules_dir: str) -> Optional[Predicate]:
+    """Compile one link of a rule into a could-match predicate.
+
+    Args:
+        link: Tokens of the SecRule directive
+        rules_dir: Directory the data files are relative to
+
+    Returns:
+        Predicate over the request targets of a payload, None when the link
+        reads something other than the payload (its outcome does not depend
+        on it) or cannot be evaluated in-process, so that it may match any
+        payload
+    """
+    if len(link) < 3:
+        return None
+    variables = [v for v in link[1].split("|") if not v.startswith("!")]
+    if not variables or any(
+        v.startswith("&") or v.partition(":")[0].upper() not in PAYLOAD_VARIABLES
+        for v in variables
+    ):
+        return None
+    # Requests carry other headers than the payload's (Host, User-Agent, ...)
+    if any(
+        v.partition(":")[0].upper() == "REQUEST_HEADERS"
+        and v.partition(":")[2].lower() != PAYLOAD_HEADER
+        for v in variables
+    ):
+        return None
+    actions = parse_actions(link[3]) if len(link) > 3 else []
+    transformations: List[str] = []
+    for action, argument in actions:
+        if action == "t":
+            if argument.lower() == "none":
+                transformations.clear()
+            elif argument.lower() not in TRANSFORMATIONS:
+                return None
+            else:
+                transformations.append(argument.lower())
+    matcher = compile_operator(link[2], rules_dir)
+    if matcher is None:
+        return None
+    targets_of = parse_variables(link[1])
+
+    def could_match(targets: Dict[str, List[Tuple[str, str]]]) -> bool:
+        for name, selector in targets_of:
+            for key, value in targets.get(name, ()):
+                if selector is None or selector.startswith("/") or selector.lower() == key.lower():
+                    # The untransformed value too, in case a transformation
+                    # is only approximated in Python
+                    if matcher(value):
+                        return True
+                    for transformation in transformations:
+                        value = TRANSFORMATIONS[transformation](value)
+                    if matcher(value):
+                        return True
+        return False
+
+    return could_match
+
+
+def compile_rule(links: List[List[str]], rules_dir: str) -> Predicate:
+    """
+    compile_rule returns whether a rule could match a payload: every link of its chain could
+    """
+    predicates = [compile_link(link, rules_dir) for link in links]
+    predicates = [p for p in predicates if p is not None]
+    if not predicates:
+        return _always
+    return lambda targets: all(p(targets) for p in predicates)
+
+
+class DeltaScreen:
+    """Payloads the changed rules of a ruleset could plausibly match.
+
+    A rule only acts on the requests it matches, so the verdict of a
+    payload that neither the previous nor the current version of any
+    changed rule matches is the same under both rulesets. Rules that read
+    anything but the payload, or cannot be evaluated in-process, may match
+    every payload.
+    """
+
+    def __init__(self, changes: List[Change], rules_dir: str):
+        self.changes = changes
+        self.predicates: List[Predicate] = []
+        for change in changes:
+            for version, stale in ((change.before, change.stale_data), (change.after, False)):
+                if version is None:
+                    continue
+                # The data files of the previous version are gone
+                self.predicates.append(_always if stale else compile_rule(version, rules_dir))
+        self.unscreened = sum(1 for p in self.predicates if p is _always)
+
+    def affected(self, payload: str, cell: Cell) -> bool:
+        if not self.predicates:
+            return False
+        if self.unscreened:
+            return True
+        targets = request_targets(payload, cell.location, cell.encoding, cell.method)
+        return any(p(targets) for p in self.predicates)
+
+
+class Carry:
+    """Verdicts of the previous ruleset carried over to the payloads the change leaves alone.
+
+    Args:
+        screen: Payloads the changed rules could match
+        cell: How the payloads are sent
+        previous: Verdicts of the previous ruleset
+        current: Verdicts of the current ruleset, receiving the carried ones
+    """
+
+    def __init__(self, screen: DeltaScreen, cell: Cell, previous: CacheView, current: CacheView):
+        self.screen = screen
+        self.cell = cell
+        self.previous = previous
+        self.current = current
+        self.carried = 0
+        self.affected = 0
+
+    def __call__(self, payload: str) -> Optional[int]:
+        if self.screen.affected(payload, self.cell):
+            self.affected += 1
+            return None
+        status_code = self.previous.get(payload)
+        if status_code is not None:
+            # Known under the current ruleset from now on
+            self.current.put(payload, status_code)
+            self.carried += 1
+        return status_code
+
+    def knows(self, payload: str) -> bool:
+        return not self.screen.affected(payload, self.cell) and self.previous.contains(payload)
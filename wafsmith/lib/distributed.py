@@ -0,0 +1,440 @@
+import os
+import hmac
+import json
+import math
+import time
+import socket
+import logging
+import itertools
+import threading
+import requests
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Deque, Dict, Iterable, List, Optional, Tuple
+from wafsmith.lib.results import Outcome
+from wafsmith.lib.session import SessionPool
+from wafsmith.lib.balancer import Balancer
+from wafsmith.lib.limiter import AdaptiveLimiter, RetryPolicy
+from wafsmith.lib.payload import Cell, Engine, send_pending
+
+logger = logging.getLogger("distributed")
+
+
+def _is_int(value: Any) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _is_valid_outcome(outcome: Any) -> bool:
+    """
+    _is_valid_outcome reports whether a reported outcome is a [lane, index, status_code, elapsed, connect, ttfb] list
+    """
+    if not isinstance(outcome, list) or len(outcome) != 6:
+        return False
+    lane, index, status_code, *seconds = outcome
+    return (
+        all(_is_int(value) and value >= 0 for value in (lane, index))
+        and _is_int(status_code)
+        and 0 < status_code < 65536
+        and all(
+            (_is_int(value) or isinstance(value, float)) and math.isfinite(value) and value >= 0
+            for value in seconds
+        )
+    )
+
+
+class Shard:
+    """A batch of pending requests leased to one worker at a time."""
+
+    __slots__ = ("job", "number", "items", "worker", "deadline", "outcomes")
+
+    def __init__(self, job: int, number: int, items: List[Tuple[int, int, str]]):
+        self.job = job
+        self.number = number
+        self.items = items
+        self.worker: Optional[str] = None
+        self.deadline = 0.0
+        self.outcomes: Optional[List[Tuple[int, Outcome]]] = None
+
+
+class _Server(ThreadingHTTPServer):
+    request_queue_size = 1024
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class CoordinatorHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        data = self.rfile.read(length)
+        coordinator: Coordinator = self.server.coordinator
+        try:
+            body = json.loads(data or b"{}")
+        except ValueError:
+            body = None
+        if not coordinator.authorized(self.headers.get("Authorization")):
+            status, response = 401, None
+        elif not isinstance(body, dict):
+            status, response = 400, None
+        elif self.path == "/lease":
+            status, response = coordinator.lease(body.get("worker", self.client_address[0]))
+        elif self.path == "/results":
+            status, response = coordinator.complete(body)
+        else:
+            status, response = 404, None
+        data = json.dumps(response).encode("utf-8") if response is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class Coordinator:
+    """Hands the pending requests of evaluate to remote workers, shard by shard.
+
+    The coordinator keeps everything that decides what to send and what a
+    result means (deduplication, resume index, verdict cache, screening,
+    result files) and only ships the requests left to send. Workers poll
+    `POST /lease` for a shard of (lane, index, payload) triples with the
+    cells of its job, send them through their own WAF stack and report the
+    status codes with `POST /results`. Shards are recorded in the order they
+    were cut, whichever worker finishes first, and a shard whose lease
+    expires (worker crashed or stalled) is handed to another worker, the
+    late result being ignored, so that the merged results are those of a
+    single-node run.
+
+    Reports are checked against the shard they complete, a report missing
+    a request or carrying one of another shard being refused with 400. The
+    coordinator listens on localhost by default; listening on a network
+    interface, set a `token` that workers present as a bearer token.
+
+    Args:
+        host: Interface to listen on
+        port: Port to listen on, 0 picks a free one
+        ruleset: Hash of the ruleset under test; workers testing another
+            ruleset refuse to run
+        lease_timeout: Seconds a worker has to report a shard before it is
+            handed to another worker
+        window: Maximum number of shards cut ahead of the oldest unrecorded one
+        token: Shared secret the workers must present, none by default
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 8700,
+        ruleset: Optional[str] = None,
+        lease_timeout: float = 120.0,
+        window: int = 64,
+        token: Optional[str] = None,
+    ):
+        self.ruleset = ruleset
+        self.token = token
+        self.lease_timeout = lease_timeout
+        self.window = window
+        self.shards_by_worker: Dict[str, int] = {}
+        self.requeued = 0
+        self._server = _Server((host, port), CoordinatorHandler)
+        self._server.coordinator = self
+        self._thread: Optional[threading.Thread] = None
+        self._cond = threading.Condition()
+        self._job = 0
+        self._cells: List[str] = []
+        self._queue: Deque[Shard] = deque()
+        self._outstanding: Dict[int, Shard] = {}
+        self._closed = False
+
+    @property
+    def address(self) -> str:
+        host, port = self._server.server_address[:2]
+        if host == "0.0.0.0":
+            host = socket.gethostname()
+        return f"http://{host}:{port}/"
+
+    def start(self) -> "Coordinator":
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, args=(0.05,), daemon=True
+        )
+        self._thread.start()
+        logger.info(f"Coordinator listening on {self.address}")
+        return self
+
+    def close(self):
+        """
+        close turns the workers away so that they exit, then stops serving
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "Coordinator":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def run(
+        self,
+        items: Iterable[Tuple[int, int, str]],
+        cells: List[Cell],
+        batch_size: int,
+        record: Callable[[int, Outcome], None],
+    ):
+        """Have the workers send pending requests, recording them here.
+
+        Args:
+            items: Pending (lane, index, payload) triples, consumed lazily
+            cells: Cell of every lane
+            batch_size: Number of requests per shard
+            record: Callback invoked with the lane and Outcome of every
+                request, shard after shard in the order of items
+        """
+        with self._cond:
+            self._job += 1
+            job = self._job
+            self._cells = [str(cell) for cell in cells]
+        batches = itertools.batched(items, batch_size)
+        cut = recorded = 0
+        exhausted = False
+        waiting_since = time.monotonic()
+        while True:
+            # Read ahead of the workers, at most `window` shards
+            while not exhausted and cut - recorded < self.window:
+                batch = next(batches, None)
+                if batch is None:
+                    exhausted = True
+                    break
+                with self._cond:
+                    shard = Shard(job, cut, list(batch))
+                    self._outstanding[cut] = shard
+                    self._queue.append(shard)
+                    self._cond.notify_all()
+                cut += 1
+            if exhausted and recorded == cut:
+                return
+            with self._cond:
+                shard = self._outstanding[recorded]
+                while shard.outcomes is None:
+                    if self._closed:
+                        raise RuntimeError("coordinator closed with shards outstanding")
+                    self._requeue_expired()
+                    self._cond.wait(1.0)
+                    if shard.outcomes is None and time.monotonic() - waiting_since > 30:
+                        logger.info(
+                            f"Waiting for workers: {len(self._outstanding)} shard(s) outstanding"
+                        )
+                        waiting_since = time.monotonic()
+                del self._outstanding[recorded]
+            for lane, outcome in shard.outcomes:
+                record(lane, outcome)
+            recorded += 1
+            waiting_since = time.monotonic()
+
+    def authorized(self, authorization: Optional[str]) -> bool:
+        """
+        authorized reports whether the Authorization header of a request carries the token, if any is required
+        """
+        if self.token is None:
+            return True
+        return hmac.compare_digest(authorization or "", f"Bearer {self.token}")
+
+    def lease(self, worker: str) -> Tuple[int, Optional[Dict[str, Any]]]:
+        """
+        lease returns the HTTP status and body answering a worker asking for a shard: 200 with a shard, 204 when none is ready yet, 410 once the coordinator is done
+        """
+        with self._cond:
+            if self._closed:
+                return 410, None
+            self._requeue_expired()
+            while self._queue:
+                shard = self._queue.popleft()
+                # Reported by a previous lease holder while it was queued again
+                if shard.outcomes is None:
+                    break
+            else:
+                return 204, None
+            shard.worker = worker
+            shard.deadline = time.monotonic() + self.lease_timeout
+            self.shards_by_worker[worker] = self.shards_by_worker.get(worker, 0) + 1
+            return 200, {
+                "job": shard.job,
+                "shard": shard.number,
+                "ruleset": self.ruleset,
+                "cells": self._cells,
+                "items": shard.items,
+            }
+
+    def complete(self, report: Dict[str, Any]) -> Tuple[int, Optional[Dict[str, Any]]]:
+        """
+        complete records the outcomes a worker reports for a shard, returning 400 for a malformed report or one not
+        covering exactly the requests of the shard, 409 for a shard already reported or from a finished job
+        """
+        outcomes = report.get("outcomes")
+        if (
+            not _is_int(report.get("job"))
+            or not _is_int(report.get("shard"))
+            or not isinstance(outcomes, list)
+            or not all(_is_valid_outcome(outcome) for outcome in outcomes)
+        ):
+            return 400, None
+        with self._cond:
+            shard = self._outstanding.get(report.get("shard"))
+            if shard is None or shard.job != report.get("job") or shard.outcomes is not None:
+                return 409, None
+            payloads = {(lane, index): p for lane, index, p in shard.items}
+            reported = [(outcome[0], outcome[1]) for outcome in outcomes]
+            if len(reported) != len(payloads) or set(reported) != payloads.keys():
+                logger.warning(
+                    f"Refused the report of shard {shard.number}: "
+                    f"{len(reported)} outcome(s) for {len(payloads)} request(s)"
+                )
+                return 400, None
+            shard.outcomes = [
+                (
+                    lane,
+                    Outcome(
+                        index,
+                        payloads[(lane, index)],
+                        status_code,
+                        elapsed,
+                        connect=connect,
+                        ttfb=ttfb,
+                    ),
+                )
+                for lane, index, status_code, elapsed, connect, ttfb in outcomes
+            ]
+            self._cond.notify_all()
+            return 200, {}
+
+    def _requeue_expired(self):
+        now = time.monotonic()
+        for shard in self._outstanding.values():
+            if shard.worker is not None and shard.outcomes is None and shard.deadline < now:
+                logger.warning(
+                    f"Shard {shard.number} leased by {shard.worker} timed out, handing it out again"
+                )
+                shard.worker = None
+                self.requeued += 1
+                self._queue.appendleft(shard)
+
+    def __str__(self) -> str:
+        workers = ", ".join(
+            f"{worker}={count}" for worker, count in sorted(self.shards_by_worker.items())
+        )
+        return f"{workers or 'no worker'} shard(s), {self.requeued} handed out again"
+
+
+def work(
+    coordinator: str,
+    endpoint: str,
+    threads: int,
+    engine: Engine = Engine.THREAD,
+    concurrency: int = 100,
+    pool: Optional[SessionPool] = None,
+    balancer: Optional[Balancer] = None,
+    limiter: Optional[AdaptiveLimiter] = None,
+    retry: Optional[RetryPolicy] = None,
+    name: Optional[str] = None,
+    ruleset: Optional[str] = None,
+    poll_interval: float = 0.5,
+    token: Optional[str] = None,
+) -> int:
+    """Send the shards leased from a coordinator until it is done.
+
+    Args:
+        coordinator: URL of the coordinator
+        endpoint: Endpoint URL of the worker's own WAF
+        threads: Number of threads to use (thread engine)
+        engine: Engine enum value selecting the sending engine
+        concurrency: Maximum number of in-flight requests (async engine)
+        pool: Optional SessionPool reused across shards
+        balancer: Optional balancer across the worker's WAF replicas
+        limiter: Optional adaptive limit on the requests in flight
+        retry: Optional policy retrying dropped requests
+        name: Name the worker reports to the coordinator, the hostname and
+            process id by default
+        ruleset: Hash of the ruleset the worker's WAF runs; shards of a
+            coordinator testing another ruleset are refused
+        poll_interval: Seconds between two lease requests while none is ready
+        token: Shared secret the coordinator requires, if any
+
+    Returns:
+        Number of shards sent
+    """
+    name = name or f"{socket.gethostname()}-{os.getpid()}"
+    url = coordinator.rstrip("/")
+    sent = 0
+    connected = False
+    with requests.Session() as session:
+        if token is not None:
+            session.headers["Authorization"] = f"Bearer {token}"
+        while True:
+            try:
+                response = session.post(f"{url}/lease", json={"worker": name}, timeout=30)
+            except requests.RequestException as e:
+                if connected:
+                    # Gone after serving us: the run is over (or crashed)
+                    logger.info(f"Coordinator unreachable, stopping: {e}")
+                    return sent
+                time.sleep(poll_interval)
+                continue
+            connected = True
+            if response.status_code == 401:
+                raise RuntimeError("coordinator refused the token of this worker")
+            if response.status_code == 410:
+                return sent
+            if response.status_code == 204:
+                time.sleep(poll_interval)
+                continue
+            response.raise_for_status()
+            shard = response.json()
+            if ruleset and shard["ruleset"] and shard["ruleset"] != ruleset:
+                raise RuntimeError(
+                    "coordinator evaluates another ruleset than the one deployed by this worker"
+                )
+
+            outcomes: List[List[Any]] = []
+
+            def record(lane: int, outcome: Outcome):
+                outcomes.append(
+                    [
+                        lane,
+                        outcome.index,
+                        outcome.status_code,
+                        outcome.elapsed,
+                        outcome.connect,
+                        outcome.ttfb,
+                    ]
+                )
+
+            send_pending(
+                [tuple(item) for item in shard["items"]],
+                [Cell.parse(cell) for cell in shard["cells"]],
+                endpoint,
+                record,
+                threads,
+                engine,
+                concurrency,
+                pool,
+                len(shard["items"]),
+                balancer,
+                limiter,
+                retry,
+            )
+            report = {"job": shard["job"], "shard": shard["shard"], "outcomes": outcomes}
+            try:
+                response = session.post(f"{url}/results", json=report, timeout=30)
+                if response.status_code == 400:
+                    logger.warning(f"Coordinator refused the report of shard {shard['shard']}")
+            except requests.RequestException as e:
+                # The lease expires and the shard is sent by another worker
+                logger.warning(f"Failed to report shard {shard['shard']}: {e}")
+            sent += 1
+            logger.debug(f"Sent shard {shard['shard']} ({len(outcomes)} request(s))")
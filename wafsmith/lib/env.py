@@ -1,18 +1,84 @@
+import os
+import json
+import time
 import subprocess
 import logging
-from typing import List, Tuple
+import requests
+from typing import List, Optional, Tuple
+from urllib.parse import urlsplit, urlunsplit
 from pydantic import BaseModel
 
 logger = logging.getLogger("env")
 
+# Upstream errors returned by nginx while the web application is still starting
+UNREADY_CODES = (502, 503, 504)
+
 
 class TestingEnv(BaseModel):
     base_dir: str = "./infra/"
     compose_file: str = "docker-compose.yml"
+    waf_service: str = "crs-nginx"
+    state_file: str = ".wafsmith-env"
+    replicas: int = 1
+    replica_base_port: int = 8081
+    replica_file: str = "docker-compose.replicas.json"
+
+    def compose(self) -> List[str]:
+        """
+        compose returns the docker compose command including the replicas override
+        """
+        cmd = ["docker", "compose", "-f", self.compose_file]
+        if self.replicas > 1:
+            cmd += ["-f", self.replica_file]
+        return cmd
+
+    def waf_services(self) -> List[str]:
+        return [self.waf_service] + [
+            f"{self.waf_service}-{replica}" for replica in range(2, self.replicas + 1)
+        ]
+
+    def endpoints(self, host: str) -> List[str]:
+        """
+        endpoints returns the URL of every WAF replica, host being the one of the original service
+        """
+        url = urlsplit(host)
+        endpoints = [host]
+        for replica in range(2, self.replicas + 1):
+            port = self.replica_base_port + replica - 2
+            endpoints.append(
+                urlunsplit(url._replace(netloc=f"{url.hostname}:{port}"))
+            )
+        return endpoints
+
+    def write_replica_file(self):
+        """Generate the compose override declaring the extra WAF replicas.
+
+        Every replica is a copy of the resolved WAF service (same image,
+        rules, volumes and CRS settings) published on its own host port,
+        starting at replica_base_port.
+        """
+        code, stdout, stderr = self.exec(
+            ["docker", "compose", "-f", self.compose_file, "config", "--format", "json"]
+        )
+        if code != 0:
+            raise RuntimeError(f"failed to resolve {self.compose_file}: {stderr.decode()}")
+        service = json.loads(stdout)["services"][self.waf_service]
+        ports = service.pop("ports", None) or [{"target": 80}]
+        service.pop("container_name", None)
+        target = ports[0]["target"]
+        services = {}
+        for replica, name in enumerate(self.waf_services()[1:]):
+            services[name] = dict(
+                service, ports=[f"{self.replica_base_port + replica}:{target}"]
+            )
+        with open(os.path.join(self.base_dir, self.replica_file), "w") as f:
+            json.dump({"services": services}, f, indent=2)
 
     def setup(self):
+        if self.replicas > 1:
+            self.write_replica_file()
         p = subprocess.Popen(
-            ["docker", "compose", "-f", self.compose_file, "up", "-d"],
+            self.compose() + ["up", "-d"],
             cwd=self.base_dir,
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
@@ -23,12 +89,92 @@ class TestingEnv(BaseModel):
 
     def teardown(self):
         p = subprocess.Popen(
-            ["docker", "compose", "-f", self.compose_file, "down"],
+            self.compose() + ["down", "--remove-orphans"],
             cwd=self.base_dir,
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
         )
         p.wait()
+        for name in (self.state_file, self.replica_file):
+            path = os.path.join(self.base_dir, name)
+            if os.path.exists(path):
+                os.remove(path)
+
+    def is_running(self) -> bool:
+        """
+        is_running returns whether every WAF replica of the stack is already up
+        """
+        code, stdout, _ = self.exec(
+            self.compose() + ["ps", "--status", "running", "--services"]
+        )
+        running = stdout.decode().split()
+        return code == 0 and all(name in running for name in self.waf_services())
+
+    def reload(self):
+        """
+        reload makes nginx re-read its configuration and the mounted rules without recreating the containers
+        """
+        code, _, stderr = self.exec(
+            self.compose() + ["kill", "-s", "HUP"] + self.waf_services()
+        )
+        if code != 0:
+            raise RuntimeError(f"failed to reload {self.waf_service}: {stderr.decode()}")
+
+    def attach(self, ruleset: str) -> bool:
+        """Reuse the running stack, starting it only if it is not up yet.
+
+        Args:
+            ruleset: Hash of the ruleset to test; the rules are hot-reloaded
+                if the running stack last loaded a different one
+
+        Returns:
+            Whether the stack had to be started
+        """
+        running = self.is_running()
+        # Compose leaves running services alone unless their configuration changed
+        self.setup()
+        if running and self.loaded_ruleset() != ruleset:
+            logger.info("Ruleset changed, reloading rules")
+            self.reload()
+        self.record_ruleset(ruleset)
+        return not running
+
+    def record_ruleset(self, ruleset: str):
+        with open(os.path.join(self.base_dir, self.state_file), "w") as f:
+            f.write(ruleset)
+
+    def loaded_ruleset(self) -> Optional[str]:
+        """
+        loaded_ruleset returns the hash of the ruleset the attached stack last loaded
+        """
+        state_path = os.path.join(self.base_dir, self.state_file)
+        if not os.path.exists(state_path):
+            return None
+        with open(state_path, "r") as f:
+            return f.read().strip()
+
+    def wait_ready(self, url: str, timeout: float = 60.0, interval: float = 0.25) -> bool:
+        """Poll the WAF endpoint until it proxies requests to the application.
+
+        Args:
+            url: Endpoint of the WAF
+            timeout: Maximum number of seconds to wait
+            interval: Seconds between two probes
+
+        Returns:
+            Whether the endpoint became ready before the timeout
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                response = requests.get(url, timeout=max(interval, 1.0))
+                if response.status_code not in UNREADY_CODES:
+                    return True
+            except requests.RequestException:
+                pass
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(interval)
 
     def exec(self, cmd: List[str]) -> Tuple[int, bytes, bytes]:
         """
@@ -0,0 +1,153 @@
+import math
+import logging
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from wafsmith.lib.results import Outcome
+
+logger = logging.getLogger("latency")
+
+METRICS = ("connect", "ttfb", "total")
+PERCENTILES = (50, 95, 99)
+
+
+class Histogram:
+    """HDR-style latency histogram with bounded relative error.
+
+    Values are recorded in microseconds into log-linear buckets: every power
+    of two is split into 2^(precision - 1) sub-buckets, so a percentile is
+    reported within 1 / 2^(precision - 1) of the true value (under 1% by
+    default) while memory only grows with the logarithm of the range.
+    Recording is a couple of integer operations and a dict increment.
+    """
+
+    def __init__(self, precision: int = 8):
+        self.precision = precision
+        self.counts: Dict[int, int] = {}
+        self.total = 0
+        self.max = 0
+
+    def _index(self, value: int) -> int:
+        shift = value.bit_length() - self.precision
+        if shift <= 0:
+            return value
+        return (shift << (self.precision - 1)) + (value >> shift)
+
+    def _value(self, index: int) -> int:
+        """
+        _value returns the highest value recorded into the bucket at index
+        """
+        half = 1 << (self.precision - 1)
+        shift = (index >> (self.precision - 1)) - 1
+        if shift <= 0:
+            return index
+        return (((index & (half - 1)) | half) + 1 << shift) - 1
+
+    def record(self, seconds: float):
+        value = int(seconds * 1_000_000)
+        index = self._index(value)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.total += 1
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other: "Histogram"):
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def percentile(self, percentile: float) -> float:
+        """
+        percentile returns the latency in seconds below which percentile % of the recorded values fall
+        """
+        if self.total == 0:
+            return 0.0
+        rank = max(math.ceil(self.total * percentile / 100), 1)
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return min(self._value(index), self.max) / 1_000_000
+        return self.max / 1_000_000
+
+
+class LatencySummary:
+    """Latency histograms of a group of requests, one per metric."""
+
+    def __init__(self):
+        self.histograms = {metric: Histogram() for metric in METRICS}
+
+    @property
+    def count(self) -> int:
+        return self.histograms["total"].total
+
+    def record(self, outcome: Outcome):
+        self.histograms["connect"].record(outcome.connect)
+        self.histograms["ttfb"].record(outcome.ttfb)
+        self.histograms["total"].record(outcome.elapsed)
+
+    def merge(self, other: "LatencySummary"):
+        for metric in METRICS:
+            self.histograms[metric].merge(other.histograms[metric])
+
+    def format(self, metric: str = "total") -> str:
+        histogram = self.histograms[metric]
+        percentiles = " ".join(
+            f"p{p}={histogram.percentile(p) * 1000:.2f}ms" for p in PERCENTILES
+        )
+        return f"{percentiles} max={histogram.max / 1000:.2f}ms"
+
+
+class LatencyRecorder:
+    """Aggregates the latency of completed requests by status code and payload file.
+
+    Outcomes served without sending a request (cache hits, duplicates,
+    resumed or pre-screened payloads) are not recorded.
+    """
+
+    def __init__(self, source: Optional[Callable[[int], Optional[str]]] = None):
+        self.source = source
+        self.overall = LatencySummary()
+        self.by_status: Dict[int, LatencySummary] = {}
+        self.by_file: Dict[str, LatencySummary] = {}
+
+    def record(self, outcome: Outcome):
+        if outcome.cached:
+            return
+        self.overall.record(outcome)
+        self.by_status.setdefault(outcome.status_code, LatencySummary()).record(outcome)
+        if self.source is not None:
+            file = self.source(outcome.index)
+            if file is not None:
+                self.by_file.setdefault(file, LatencySummary()).record(outcome)
+
+    def rows(self) -> Iterator[Tuple[str, LatencySummary]]:
+        yield "all", self.overall
+        for status_code in sorted(self.by_status):
+            yield f"status {status_code}", self.by_status[status_code]
+        for file in sorted(self.by_file):
+            yield file, self.by_file[file]
+
+    def report(self, title: str = "Latency"):
+        if self.overall.count == 0:
+            return
+        for name, summary in self.rows():
+            logger.info(f"{title} [{name}] ({summary.count} request(s))")
+            for metric in METRICS:
+                logger.info(f"  {metric:<7} {summary.format(metric)}")
+
+
+def overhead(waf: LatencySummary, direct: LatencySummary, metric: str = "total") -> List[Tuple[str, float]]:
+    """
+    overhead returns the latency the WAF adds over a direct request, in seconds, at each percentile
+    """
+    rows = [
+        (
+            f"p{p}",
+            waf.histograms[metric].percentile(p) - direct.histograms[metric].percentile(p),
+        )
+        for p in PERCENTILES
+    ]
+    rows.append(
+        ("max", (waf.histograms[metric].max - direct.histograms[metric].max) / 1_000_000)
+    )
+    return rows
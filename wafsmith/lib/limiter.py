@@ -0,0 +1,151 @@
+import random
+import asyncio
+import logging
+import threading
+from typing import Optional
+from pydantic import BaseModel
+from wafsmith.lib.results import ERRORED
+
+logger = logging.getLogger("limiter")
+
+# Responses meaning the WAF (or the application behind it) is overloaded
+# rather than giving a verdict: worth backing off and retrying
+OVERLOAD_CODES = (429, 502, 503, 504)
+
+
+def is_dropped(status_code: int) -> bool:
+    """
+    is_dropped reports whether status_code stands for a failed request (timeout, connection error, overload)
+    """
+    return status_code == ERRORED or status_code in OVERLOAD_CODES
+
+
+class RetryPolicy(BaseModel):
+    """Retries of dropped requests with exponential backoff and full jitter.
+
+    The n-th retry waits a random delay between 0 and
+    min(max_delay, base_delay * 2^n), so that requests dropped together do
+    not hit the WAF again in lockstep.
+    """
+
+    retries: int = 3
+    base_delay: float = 0.1
+    max_delay: float = 5.0
+
+    def should_retry(self, status_code: int, attempt: int) -> bool:
+        return attempt < self.retries and is_dropped(status_code)
+
+    def delay(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+
+
+class AdaptiveLimiter:
+    """AIMD limit on the number of requests in flight.
+
+    The limit starts slow: it grows by one per successful request, doubling
+    every window of `limit` requests, until the first backoff, so that a
+    healthy WAF is driven at `max_limit` within a few windows. It then grows
+    additively, by one per window, while the requests succeed at a stable
+    latency. Either way the window must actually be in use. It is cut multiplicatively by `backoff` when a request is dropped
+    (timeout, connection error, overload status) or when the short-term
+    average latency exceeds `tolerance` times the long-term one, at most once
+    per window so that a burst of failures of the same window counts once.
+    The limit settles around the highest concurrency the WAF sustains.
+
+    Threads block in `acquire`, asyncio tasks await `acquire_async`; a
+    limiter is used by a single engine at a time.
+    """
+
+    def __init__(
+        self,
+        max_limit: int,
+        initial: int = 10,
+        min_limit: int = 1,
+        backoff: float = 0.75,
+        tolerance: float = 2.0,
+    ):
+        self.max_limit = max(max_limit, min_limit)
+        self.min_limit = min_limit
+        self.limit = float(min(max(initial, min_limit), self.max_limit))
+        self.backoff = backoff
+        self.tolerance = tolerance
+        self.in_flight = 0
+        self.peak = int(self.limit)
+        self.drops = 0
+        # Exponentially weighted latency averages, short and long term
+        self._short: Optional[float] = None
+        self._long: Optional[float] = None
+        self._since_decrease = int(self.limit)
+        # Exponential growth until the limit is first cut
+        self._slow_start = True
+        self._cond = threading.Condition()
+        # An asyncio event is bound to the loop it is awaited in, one per
+        # loop so that the limiter outlives asyncio.run (phases, shards)
+        self._released: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def try_acquire(self) -> bool:
+        with self._cond:
+            if self.in_flight >= int(self.limit):
+                return False
+            self.in_flight += 1
+            return True
+
+    def acquire(self):
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+
+    async def acquire_async(self):
+        while not self.try_acquire():
+            loop = asyncio.get_running_loop()
+            if self._released is None or self._loop is not loop:
+                self._released, self._loop = asyncio.Event(), loop
+            self._released.clear()
+            await self._released.wait()
+
+    def release(self, latency: float, dropped: bool = False):
+        """Account for a completed request and adjust the limit.
+
+        Args:
+            latency: Time the request took, in seconds
+            dropped: Whether the request failed or was rejected for overload
+        """
+        with self._cond:
+            # Whether the window was in use, otherwise growing it is meaningless
+            saturated = self.in_flight * 2 >= self.limit
+            self.in_flight -= 1
+            self._since_decrease += 1
+            if dropped:
+                self.drops += 1
+                self._decrease()
+            else:
+                if self._short is None:
+                    self._short = self._long = latency
+                else:
+                    self._short += 0.1 * (latency - self._short)
+                    self._long += 0.01 * (latency - self._long)
+                if self._short > self.tolerance * self._long:
+                    self._decrease()
+                elif saturated:
+                    step = 1 if self._slow_start else 1 / self.limit
+                    self.limit = min(self.limit + step, self.max_limit)
+                    self.peak = max(self.peak, int(self.limit))
+            self._cond.notify_all()
+        if self._released is not None:
+            self._released.set()
+
+    def _decrease(self):
+        if self._since_decrease < self.limit:
+            return
+        self._since_decrease = 0
+        self._slow_start = False
+        self.limit = max(self.limit * self.backoff, self.min_limit)
+        logger.debug(f"Concurrency limit lowered to {int(self.limit)}")
+
+    def __str__(self) -> str:
+        return (
+            f"limit {int(self.limit)} of {self.max_limit} (peak {self.peak}), "
+            f"{self.drops} dropped request(s)"
+        )
@@ -0,0 +1,350 @@
+import re
+import json
+import time
+import sqlite3
+import asyncio
+import hashlib
+import logging
+import threading
+import httpx
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence
+from wafsmith.lib.limiter import RetryPolicy
+
+logger = logging.getLogger("llm")
+
+DEFAULT_BASE_URL = "https://api.openai.com/v1"
+
+# Responses worth retrying after a delay: rate limited or overloaded
+RETRY_CODES = (408, 409, 429, 500, 502, 503, 504)
+
+# Times a payload is asked about alone before giving up on a valid answer
+ATTEMPTS = 3
+
+
+class TokenBucket:
+    """Rate limit of the calls of a client, shared by all of its tasks.
+
+    `rate` tokens are added per second, up to `capacity`, and every call
+    takes one; calls beyond the burst capacity wait for the next token, so
+    that the rate limit of the API is never hit instead of being backed off
+    from.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.waited = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, cost: float = 1.0):
+        # Tasks are served in arrival order, a waiting task holds the lock
+        async with self._lock:
+            self._refill()
+            while self.tokens < cost:
+                delay = (cost - self.tokens) / self.rate
+                self.waited += delay
+                await asyncio.sleep(delay)
+                self._refill()
+            self.tokens -= cost
+
+
+class ResponseCache:
+    """On-disk cache of model answers backed by sqlite.
+
+    Answers are kept per payload and keyed by the model, the prompt template
+    (its text, so that editing a prompt invalidates its answers) and the
+    payload, whether they were obtained alone or within a batch. The cache
+    holds at most `max_entries` answers and evicts the least recently used
+    ones on close.
+    """
+
+    def __init__(self, path: str, max_entries: int = 100_000):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS answers ("
+            "key TEXT PRIMARY KEY, answer TEXT NOT NULL, last_used INTEGER NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS answers_last_used ON answers (last_used)")
+
+    @staticmethod
+    def key(model: str, template: str, payload: str) -> str:
+        digest = hashlib.sha256()
+        for part in (model, template, hashlib.sha256(payload.encode("utf-8")).hexdigest()):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            row = self._db.execute("SELECT answer FROM answers WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._db.execute(
+                "UPDATE answers SET last_used = ? WHERE key = ?", (time.time_ns(), key)
+            )
+            self._db.commit()
+            return json.loads(row[0])
+
+    def put(self, key: str, answer: Any):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO answers (key, answer, last_used) VALUES (?, ?, ?)",
+                (key, json.dumps(answer), time.time_ns()),
+            )
+            self._db.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+
+    def evict(self) -> int:
+        """
+        evict drops the least recently used answers beyond max_entries and returns how many were dropped
+        """
+        with self._lock:
+            count = self._db.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+            excess = count - self.max_entries
+            if excess <= 0:
+                return 0
+            self._db.execute(
+                "DELETE FROM answers WHERE key IN "
+                "(SELECT key FROM answers ORDER BY last_used ASC LIMIT ?)",
+                (excess,),
+            )
+            self._db.commit()
+            return excess
+
+    def close(self):
+        evicted = self.evict()
+        if evicted:
+            logger.info(f"Evicted {evicted} least recently used answer(s)")
+        with self._lock:
+            self._db.close()
+
+
+class Template(NamedTuple):
+    """Prompts asking the same question about one or several payloads.
+
+    `single` holds the payload in place of `placeholder` and is answered
+    with the answer of that payload; `batch` holds a JSON array of payloads
+    in place of %%PAYLOADS%% and is answered with a JSON array of their
+    answers, in order. `parse` checks and normalizes the answer of a
+    payload, returning None when it is unusable.
+    """
+
+    name: str
+    system: str
+    single: str
+    parse: Callable[[str, Any], Optional[Any]]
+    batch: Optional[str] = None
+    placeholder: str = "%%PAYLOAD%%"
+    # Whether the answers are JSON values, or the raw text of the response
+    json: bool = True
+    retry: str = "The response is not valid JSON. Respond in JSON only, nothing else"
+
+    def digest(self) -> str:
+        text = "\0".join((self.name, self.system, self.single, self.batch or ""))
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def parse_json(content: str) -> Any:
+    """
+    parse_json returns the JSON value of a model response, None if it holds none
+    """
+    # Models tend to fence their JSON despite being asked not to
+    content = re.sub(r"^\s*```(?:json)?|```\s*$", "", content.strip())
+    try:
+        return json.loads(content)
+    except ValueError:
+        return None
+
+
+class LLMClient:
+    """Client of an OpenAI-compatible chat completions API.
+
+    Payloads are asked about concurrently, up to `concurrency` calls in
+    flight and `requests_per_minute` calls per minute, several of them per
+    prompt when the template allows it. Every answer is cached on its own,
+    so that a payload already asked about, in this run or a previous one,
+    costs no call. Answers a batch got wrong are asked for again alone.
+
+    Args:
+        model: Model to use
+        api_key: API key
+        base_url: Endpoint of the API
+        concurrency: Maximum number of calls in flight
+        requests_per_minute: Optional rate limit of the calls
+        cache: Optional cache of the answers
+        timeout: Per-call timeout in seconds
+        retry: Retries of rate-limited or failed calls
+    """
+
+    def __init__(
+        self,
+        model: str,
+        api_key: Optional[str] = None,
+        base_url: Optional[str] = None,
+        concurrency: int = 10,
+        requests_per_minute: Optional[float] = None,
+        cache: Optional[ResponseCache] = None,
+        timeout: float = 120,
+        retry: Optional[RetryPolicy] = None,
+    ):
+        self.model = model
+        self.api_key = api_key
+        self.base_url = (base_url or DEFAULT_BASE_URL).rstrip("/")
+        self.concurrency = concurrency
+        self.requests_per_minute = requests_per_minute
+        self.cache = cache
+        self.timeout = timeout
+        self.retry = retry or RetryPolicy(retries=5, base_delay=1.0, max_delay=30.0)
+        self.calls = 0
+        self.batches = 0
+        self.fallbacks = 0
+        self.failed = 0
+
+    def __str__(self) -> str:
+        cached = self.cache.hits if self.cache is not None else 0
+        return (
+            f"{self.calls} call(s) ({self.batches} batched), {cached} cached answer(s), "
+            f"{self.fallbacks} answer(s) asked for again alone, {self.failed} failed"
+        )
+
+    def ask(self, template: Template, payloads: Sequence[str], batch_size: int = 1) -> List[Optional[Any]]:
+        """
+        ask returns the answer of every payload, None for those without a usable one
+        """
+        return asyncio.run(self.ask_async(template, payloads, batch_size))
+
+    async def ask_async(
+        self, template: Template, payloads: Sequence[str], batch_size: int = 1
+    ) -> List[Optional[Any]]:
+        answers: Dict[str, Optional[Any]] = {}
+        digest = template.digest()
+        missing: List[str] = []
+        # Identical payloads are asked about once
+        for payload in dict.fromkeys(payloads):
+            answer = None
+            if self.cache is not None:
+                answer = self.cache.get(ResponseCache.key(self.model, digest, payload))
+            if answer is not None:
+                answers[payload] = answer
+            else:
+                missing.append(payload)
+
+        if missing:
+            semaphore = asyncio.Semaphore(self.concurrency)
+            bucket = (
+                TokenBucket(self.requests_per_minute / 60)
+                if self.requests_per_minute
+                else None
+            )
+            size = batch_size if template.batch is not None else 1
+            async with httpx.AsyncClient(timeout=self.timeout) as client:
+
+                async def call(messages: List[Dict[str, str]]) -> str:
+                    async with semaphore:
+                        if bucket is not None:
+                            await bucket.acquire()
+                        return await self._complete(client, messages)
+
+                async def resolve(batch: List[str]):
+                    if len(batch) > 1:
+                        batch_answers = await self._ask_batch(call, template, batch)
+                    else:
+                        batch_answers = [None]
+                    for payload, answer in zip(batch, batch_answers):
+                        if answer is None and len(batch) > 1:
+                            self.fallbacks += 1
+                        if answer is None:
+                            answer = await self._ask_single(call, template, payload)
+                        if answer is None:
+                            self.failed += 1
+                        elif self.cache is not None:
+                            self.cache.put(ResponseCache.key(self.model, digest, payload), answer)
+                        answers[payload] = answer
+
+                await asyncio.gather(
+                    *(resolve(missing[i : i + size]) for i in range(0, len(missing), size))
+                )
+        return [answers[payload] for payload in payloads]
+
+    async def _ask_single(self, call, template: Template, payload: str) -> Optional[Any]:
+        messages = [
+            {"role": "system", "content": template.system},
+            {"role": "user", "content": template.single.replace(template.placeholder, payload)},
+        ]
+        for _ in range(ATTEMPTS if template.json else 1):
+            try:
+                content = await call(messages)
+            except Exception as e:
+                logger.warning(f"Failed to ask about {payload!r}: {e}")
+                return None
+            value = parse_json(content) if template.json else content
+            answer = template.parse(payload, value) if value is not None else None
+            if answer is not None or not template.json:
+                return answer
+            messages.append({"role": "assistant", "content": content})
+            messages.append({"role": "user", "content": template.retry})
+        return None
+
+    async def _ask_batch(self, call, template: Template, batch: List[str]) -> List[Optional[Any]]:
+        self.batches += 1
+        messages = [
+            {"role": "system", "content": template.system},
+            {"role": "user", "content": template.batch.replace("%%PAYLOADS%%", json.dumps(batch))},
+        ]
+        try:
+            values = parse_json(await call(messages))
+        except Exception as e:
+            logger.warning(f"Failed to ask about a batch of {len(batch)} payload(s): {e}")
+            return [None] * len(batch)
+        # An answer list of another length cannot be matched to the payloads
+        if not isinstance(values, list) or len(values) != len(batch):
+            return [None] * len(batch)
+        return [
+            template.parse(payload, value) if value is not None else None
+            for payload, value in zip(batch, values)
+        ]
+
+    async def _complete(self, client: httpx.AsyncClient, messages: List[Dict[str, str]]) -> str:
+        headers = {}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        attempt = 0
+        while True:
+            self.calls += 1
+            response: Optional[httpx.Response] = None
+            try:
+                response = await client.post(
+                    f"{self.base_url}/chat/completions",
+                    json={"model": self.model, "messages": messages},
+                    headers=headers,
+                )
+            except httpx.TransportError:
+                if attempt >= self.retry.retries:
+                    raise
+            else:
+                if response.status_code not in RETRY_CODES or attempt >= self.retry.retries:
+                    response.raise_for_status()
+                    return response.json()["choices"][0]["message"]["content"] or ""
+            delay = self.retry.delay(attempt)
+            if response is not None and response.headers.get("retry-after", "").isdigit():
+                delay = max(delay, float(response.headers["retry-after"]))
+            attempt += 1
+            await asyncio.sleep(delay)
@@ -0,0 +1,177 @@
+import os
+import pickle
+import hashlib
+import logging
+from collections import deque
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+logger = logging.getLogger("matcher")
+
+# Bump whenever the pickled layout of PhraseMatcher changes
+CACHE_VERSION = 1
+
+
+def default_cache_dir() -> str:
+    return os.path.join(
+        os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "wafsmith"
+    )
+
+
+class PhraseMatcher:
+    """Aho-Corasick automaton over named groups of phrases.
+
+    All groups (typically one per `.data` file) share a single automaton, so
+    a payload is scanned once whatever the number of phrases and files, in
+    time proportional to its length. Matching is case-insensitive like the
+    ModSecurity `@pm` operators.
+    """
+
+    def __init__(self, groups: Dict[str, Iterable[str]]):
+        self.groups: List[str] = list(groups)
+        self._bits = {group: 1 << i for i, group in enumerate(self.groups)}
+        # goto transitions, failure links, bitmask of the groups matching at
+        # each state and the phrases ending there (including via failure links)
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._masks: List[int] = [0]
+        self._outputs: List[Tuple[Tuple[int, str], ...]] = [()]
+        for group, phrases in groups.items():
+            for phrase in phrases:
+                self._add(phrase.lower(), self._bits[group])
+        self._link()
+
+    def _add(self, phrase: str, bit: int):
+        if not phrase:
+            return
+        state = 0
+        for char in phrase:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._masks.append(0)
+                self._outputs.append(())
+            state = next_state
+        self._masks[state] |= bit
+        self._outputs[state] += ((bit, phrase),)
+
+    def _link(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(char, 0)
+                self._fail[next_state] = target if target != next_state else 0
+                self._masks[next_state] |= self._masks[self._fail[next_state]]
+                self._outputs[next_state] += self._outputs[self._fail[next_state]]
+
+    def __len__(self) -> int:
+        return len(self._goto)
+
+    def search(self, text: str, group: Optional[str] = None) -> bool:
+        """
+        search reports whether text contains any phrase (of group, when given), stopping at the first match
+        """
+        wanted = self._bits.get(group, 0) if group is not None else -1
+        if not wanted:
+            return False
+        goto, fail, masks = self._goto, self._fail, self._masks
+        state = 0
+        for char in text.lower():
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if masks[state] & wanted:
+                return True
+        return False
+
+    def matches(self, text: str) -> Dict[str, Set[str]]:
+        """
+        matches returns the phrases found in text, by group
+        """
+        found: Dict[str, Set[str]] = {}
+        goto, fail, outputs = self._goto, self._fail, self._outputs
+        state = 0
+        for char in text.lower():
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for bit, phrase in outputs[state]:
+                found.setdefault(self.groups[bit.bit_length() - 1], set()).add(phrase)
+        return found
+
+    def scan(self, corpus: Iterable[str]) -> Iterator[Tuple[int, Dict[str, Set[str]]]]:
+        """Match a whole corpus in a single pass.
+
+        Args:
+            corpus: Payloads to match, consumed lazily
+
+        Returns:
+            Iterator of (index, phrases by group) for every payload containing
+            at least one phrase
+        """
+        for index, text in enumerate(corpus):
+            found = self.matches(text)
+            if found:
+                yield index, found
+
+
+def read_data_file(path: str) -> List[str]:
+    """
+    read_data_file returns the phrases of a @pmFromFile data file, comments and blank lines excluded
+    """
+    with open(path, "r", errors="replace") as f:
+        return [
+            line.strip()
+            for line in f
+            if line.strip() and not line.lstrip().startswith("#")
+        ]
+
+
+def load_matcher(paths: List[str], cache_dir: Optional[str] = None) -> PhraseMatcher:
+    """Build the automaton of a set of data files, reusing a cached copy.
+
+    The automaton is pickled under cache_dir, keyed by the hash of the data
+    files' names and contents, so it is only rebuilt when a file changes.
+
+    Args:
+        paths: Data files, each one becoming a group named after the file
+        cache_dir: Directory of the pickled automata, defaults to
+            ~/.cache/wafsmith
+
+    Returns:
+        PhraseMatcher with one group per data file
+    """
+    paths = sorted(paths)
+    digest = hashlib.sha256(f"v{CACHE_VERSION}".encode("utf-8"))
+    for path in paths:
+        with open(path, "rb") as f:
+            digest.update(os.path.basename(path).encode("utf-8") + b"\0")
+            digest.update(hashlib.sha256(f.read()).digest())
+    cache_dir = cache_dir or default_cache_dir()
+    cache_path = os.path.join(cache_dir, f"phrases-{digest.hexdigest()}.pickle")
+    try:
+        with open(cache_path, "rb") as f:
+            return pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+        pass
+
+    matcher = PhraseMatcher(
+        {os.path.basename(path): read_data_file(path) for path in paths}
+    )
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        # Written aside and renamed so that concurrent runs never read a partial file
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(matcher, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        logger.warning(f"Failed to cache phrase matcher: {e}")
+    return matcher
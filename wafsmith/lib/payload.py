@@ -2,14 +2,34 @@ import enum
 import json
 import xml.etree.ElementTree as ET
 import logging
+import time
+import asyncio
+import itertools
+import httpx
 import requests
-import multiprocessing
-from concurrent.futures import ThreadPoolExecutor
-from typing import List, Dict, Tuple
+from collections import deque
+from functools import partial
+from urllib.parse import urlencode
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import get_context
+from contextlib import nullcontext
+from typing import TYPE_CHECKING, Any, Callable, ContextManager, Deque, Iterable, Iterator, Dict, List, NamedTuple, Tuple, Optional
 from pydantic import BaseModel
+from wafsmith.lib.session import RequestTiming, SessionPool, track
+from wafsmith.lib.results import ERRORED, UNTESTED, Outcome, ResultStore
+from wafsmith.lib.cache import CacheView
+from wafsmith.lib.dedup import Deduplicator
+from wafsmith.lib.balancer import Balancer
+from wafsmith.lib.limiter import AdaptiveLimiter, RetryPolicy, is_dropped
+
+if TYPE_CHECKING:
+    from wafsmith.lib.distributed import Coordinator
 
 logger = logging.getLogger("payload")
 
+# Header identifying every request of a run, see AuditCorrelator
+REQUEST_ID_HEADER = "x-wafsmith-request-id"
+
 
 class Location(enum.Enum):
     URL_PARAMETERS = 1
@@ -30,6 +50,208 @@ class Encoding(enum.Enum):
         }[self]
 
 
+class Engine(enum.Enum):
+    THREAD = 1
+    ASYNC = 2
+
+
+LOCATIONS = {
+    "url_parameters": Location.URL_PARAMETERS,
+    "http_header": Location.HTTP_HEADER,
+    "http_body": Location.HTTP_BODY,
+}
+
+ENCODINGS = {
+    "form": Encoding.FORM_URLENCODED,
+    "json": Encoding.JSON,
+    "xml": Encoding.XML,
+}
+
+
+class Cell(NamedTuple):
+    """How a payload is sent: one (method, location, encoding) combination."""
+
+    method: str = "GET"
+    location: Location = Location.URL_PARAMETERS
+    encoding: Encoding = Encoding.FORM_URLENCODED
+
+    def __str__(self) -> str:
+        encoding = next(k for k, v in ENCODINGS.items() if v == self.encoding)
+        return f"{self.method}:{self.location.name.lower()}:{encoding}"
+
+    @classmethod
+    def parse(cls, spec: str) -> "Cell":
+        """
+        parse returns the cell of a METHOD:location[:encoding] spec, e.g. POST:http_body:json
+        """
+        parts = spec.split(":")
+        if len(parts) not in (2, 3):
+            raise ValueError(f"invalid cell {spec!r}, expected METHOD:location[:encoding]")
+        method = parts[0].upper()
+        if method not in ("GET", "POST"):
+            raise ValueError(f"invalid method {parts[0]!r} in cell {spec!r}")
+        location = LOCATIONS.get(parts[1].lower())
+        if location is None:
+            raise ValueError(f"invalid location {parts[1]!r} in cell {spec!r}")
+        encoding = ENCODINGS.get(parts[2].lower() if len(parts) == 3 else "form")
+        if encoding is None:
+            raise ValueError(f"invalid encoding {parts[2]!r} in cell {spec!r}")
+        return cls(method, location, encoding)
+
+
+# Cells of `--matrix all`: every location, and every encoding of the body
+MATRIX_ALL = [
+    Cell("GET", Location.URL_PARAMETERS),
+    Cell("POST", Location.URL_PARAMETERS),
+    Cell("GET", Location.HTTP_HEADER),
+    Cell("POST", Location.HTTP_BODY, Encoding.FORM_URLENCODED),
+    Cell("POST", Location.HTTP_BODY, Encoding.JSON),
+    Cell("POST", Location.HTTP_BODY, Encoding.XML),
+]
+
+
+class PreparedRequest:
+    """Request of one payload, serialized once ahead of sending.
+
+    Preparation (query encoding, JSON / XML bodies) runs as a batched stage,
+    optionally in worker processes, so that the sending threads and tasks
+    only join the query to the endpoint of the replica they picked and push
+    the header and body bytes.
+    """
+
+    __slots__ = ("payload", "method", "query", "headers", "body")
+
+    def __init__(
+        self,
+        payload: str,
+        method: str,
+        query: str,
+        headers: Dict[str, str],
+        body: Optional[bytes],
+    ):
+        self.payload = payload
+        self.method = method
+        self.query = query
+        self.headers = headers
+        self.body = body
+
+    def __getstate__(self):
+        return self.payload, self.method, self.query, self.headers, self.body
+
+    def __setstate__(self, state):
+        self.payload, self.method, self.query, self.headers, self.body = state
+
+    def url(self, endpoint: str) -> str:
+        if not self.query:
+            return endpoint
+        return f"{endpoint}{'&' if '?' in endpoint else '?'}{self.query}"
+
+
+def encode_body(payload: str, encoding: Encoding) -> bytes:
+    """
+    encode_body returns the request body carrying payload in the given encoding
+    """
+    if encoding == Encoding.JSON:
+        return json.dumps({"payload": payload}).encode("utf-8")
+    if encoding == Encoding.XML:
+        root = ET.Element("payload")
+        root.text = payload
+        return ET.tostring(root, encoding="utf-8")
+    return payload.encode("utf-8")
+
+
+def prepare_request(
+    payload: str,
+    method: str = "GET",
+    location: Location = Location.URL_PARAMETERS,
+    encoding: Encoding = Encoding.FORM_URLENCODED,
+) -> PreparedRequest:
+    """
+    prepare_request returns the serialized request placing payload at location, whatever the method
+    """
+    query = ""
+    headers = {}
+    body = None
+    if location == Location.URL_PARAMETERS:
+        query = urlencode({"payload": payload})
+    elif location == Location.HTTP_HEADER:
+        headers = {"x-payload": payload}
+    elif location == Location.HTTP_BODY:
+        body = encode_body(payload, encoding)
+        headers = {"Content-Type": encoding.content_type()}
+    return PreparedRequest(payload, method, query, headers, body)
+
+
+def prepare_requests(batch: Iterable[Tuple[str, Cell]]) -> List[PreparedRequest]:
+    """
+    prepare_requests returns the serialized requests of a batch of (payload, cell), run inline or in a worker process
+    """
+    return [prepare_request(p, *cell) for p, cell in batch]
+
+
+def send_prepared(
+    request: PreparedRequest,
+    endpoint: str,
+    session: Any = requests,
+    timeout: Optional[float] = None,
+) -> int:
+    """Send a prepared request and return the status code.
+
+    Args:
+        request: Prepared request
+        endpoint: Endpoint URL the query is appended to
+        session: requests.Session, or the requests module for a one-off request
+        timeout: Request timeout in seconds
+
+    Returns:
+        Status code, ERRORED on a timeout or connection error, 500 on any
+        other error
+    """
+    try:
+        send = session.get if request.method == "GET" else session.post
+        response = send(
+            request.url(endpoint),
+            headers=request.headers,
+            data=request.body,
+            timeout=timeout,
+        )
+        return response.status_code
+    except requests.RequestException as e:
+        # Timeouts and connection errors are retried by the sender
+        logger.debug(f"Error sending request: {e}")
+        return ERRORED
+    except Exception as e:
+        logger.error(f"Error sending request: {e}")
+        return 500  # Return 500 as a default error code
+
+
+async def send_prepared_async(
+    request: PreparedRequest,
+    endpoint: str,
+    client: httpx.AsyncClient,
+    extensions: Optional[Dict[str, Any]] = None,
+) -> int:
+    """
+    send_prepared_async sends a prepared request on the event loop and returns the status code, see send_prepared
+    """
+    try:
+        response = await client.request(
+            request.method,
+            request.url(endpoint),
+            headers=request.headers,
+            content=request.body,
+            extensions=extensions,
+        )
+        return response.status_code
+    except httpx.TransportError as e:
+        # Timeouts and connection errors are retried by the sender
+        logger.debug(f"Error sending request: {e}")
+        return ERRORED
+    except Exception as e:
+        logger.error(f"Error sending request: {e}")
+        return 500  # Return 500 as a default error code
+
+
 class Payload(BaseModel):
     method: str = "GET"
     endpoint: str
@@ -41,44 +263,32 @@ class Payload(BaseModel):
         return f"{self.method} {self.endpoint} {self.payload}"
 
     def build_body(self) -> bytes:
-        if self.encoding == Encoding.FORM_URLENCODED:
-            return self.payload.encode("utf-8")
-        if self.encoding == Encoding.JSON:
-            return json.dumps({"payload": self.payload}).encode("utf-8")
-        if self.encoding == Encoding.XML:
-            root = ET.Element("payload")
-            root.text = self.payload
-            return ET.tostring(root, encoding="utf-8")
-        return self.payload
-
-    def send_request(self) -> int:
-        params = {}
-        headers = {}
-        data = None
-        if self.location == Location.URL_PARAMETERS:
-            params = {"payload": self.payload}
-        elif self.location == Location.HTTP_HEADER:
-            headers = {"x-payload": self.payload}
-        elif self.location == Location.HTTP_BODY:
-            data = self.build_body()
-            headers["Content-Type"] = self.encoding.content_type()
-
-        try:
-            if self.method == "GET":
-                response = requests.get(self.endpoint, headers=headers, params=params)
-            else:  # POST
-                response = requests.post(self.endpoint, headers=headers, data=data)
-            return response.status_code
-        except Exception as e:
-            logger.error(f"Error sending request: {e}")
-            return 500  # Return 500 as a default error code
-
-
-def process_payload(args: Tuple[str, str, str, Location, str]) -> Tuple[str, int]:
+        return encode_body(self.payload, self.encoding)
+
+    def prepare(self) -> PreparedRequest:
+        return prepare_request(self.payload, self.method, self.location, self.encoding)
+
+    def send_request(
+        self,
+        session: Optional[requests.Session] = None,
+        timeout: Optional[float] = None,
+    ) -> int:
+        return send_prepared(
+            self.prepare(),
+            self.endpoint,
+            session if session is not None else requests,
+            timeout,
+        )
+
+
+def process_payload(
+    args: Tuple[str, str, str, Location, str], pool: Optional[SessionPool] = None
+) -> Tuple[str, int]:
     """Process a single payload and return the result.
 
     Args:
         args: Tuple containing (payload_str, method, endpoint, location, message)
+        pool: Optional SessionPool providing a keep-alive session and timeout
 
     Returns:
         Tuple of (payload_str, status_code)
@@ -91,7 +301,10 @@ def process_payload(args: Tuple[str, str, str, Location, str]) -> Tuple[str, int
             payload=payload_str,
             location=location,
         )
-        status_code = payload.send_request()
+        if pool is not None:
+            status_code = payload.send_request(pool.session(), pool.timeout)
+        else:
+            status_code = payload.send_request()
     except Exception as e:
         logger.error(f"Error testing {message}: {e}")
         status_code = 500  # Default error code
@@ -99,40 +312,526 @@ def process_payload(args: Tuple[str, str, str, Location, str]) -> Tuple[str, int
     return payload_str, status_code
 
 
+def _timed_process_payload(
+    request: PreparedRequest,
+    endpoint: str,
+    pool: SessionPool,
+    balancer: Optional[Balancer] = None,
+    limiter: Optional[AdaptiveLimiter] = None,
+    retry: Optional[RetryPolicy] = None,
+) -> Tuple[str, int, RequestTiming, float]:
+    attempt = 0
+    while True:
+        result = _timed_attempt(request, endpoint, pool, balancer, limiter)
+        if retry is None or not retry.should_retry(result[1], attempt):
+            return _settled(result, retry)
+        time.sleep(retry.delay(attempt))
+        attempt += 1
+
+
+def _timed_attempt(
+    request: PreparedRequest,
+    endpoint: str,
+    pool: SessionPool,
+    balancer: Optional[Balancer],
+    limiter: Optional[AdaptiveLimiter],
+) -> Tuple[str, int, RequestTiming, float]:
+    if limiter is not None:
+        limiter.acquire()
+    result = None
+    try:
+        with _endpoint(endpoint, balancer) as url, track(RequestTiming()) as timing:
+            status_code = send_prepared(request, url, pool.session(), pool.timeout)
+        result = request.payload, status_code, timing, time.perf_counter() - timing.start
+        return result
+    finally:
+        if limiter is not None:
+            _release(limiter, result)
+
+
+async def _timed_process_payload_async(
+    request: PreparedRequest,
+    endpoint: str,
+    client: httpx.AsyncClient,
+    semaphore: asyncio.Semaphore,
+    pool: SessionPool,
+    balancer: Optional[Balancer] = None,
+    limiter: Optional[AdaptiveLimiter] = None,
+    retry: Optional[RetryPolicy] = None,
+) -> Tuple[str, int, RequestTiming, float]:
+    attempt = 0
+    while True:
+        # The semaphore is only held while sending so that a request backing
+        # off before its retry leaves the slot to the others
+        async with semaphore:
+            result = await _timed_attempt_async(
+                request, endpoint, client, pool, balancer, limiter
+            )
+        if retry is None or not retry.should_retry(result[1], attempt):
+            return _settled(result, retry)
+        await asyncio.sleep(retry.delay(attempt))
+        attempt += 1
+
+
+async def _timed_attempt_async(
+    request: PreparedRequest,
+    endpoint: str,
+    client: httpx.AsyncClient,
+    pool: SessionPool,
+    balancer: Optional[Balancer],
+    limiter: Optional[AdaptiveLimiter],
+) -> Tuple[str, int, RequestTiming, float]:
+    # The semaphore and limiter are acquired before the clock starts so that
+    # time spent queueing behind the concurrency limit is not reported as
+    # latency, and the replica is only picked once the request can be sent
+    if limiter is not None:
+        await limiter.acquire_async()
+    result = None
+    try:
+        with _endpoint(endpoint, balancer) as url, track(RequestTiming()) as timing:
+            status_code = await send_prepared_async(
+                request, url, client, pool.request_extensions()
+            )
+        result = request.payload, status_code, timing, time.perf_counter() - timing.start
+        return result
+    finally:
+        if limiter is not None:
+            _release(limiter, result)
+
+
+def _settled(
+    result: Tuple[str, int, RequestTiming, float], retry: Optional[RetryPolicy]
+) -> Tuple[str, int, RequestTiming, float]:
+    # Still dropped (overloaded) after its retries, the request got no verdict
+    if retry is not None and is_dropped(result[1]):
+        return result[0], ERRORED, result[2], result[3]
+    return result
+
+
+def _endpoint(endpoint: str, balancer: Optional[Balancer]) -> ContextManager[str]:
+    return balancer.endpoint() if balancer is not None else nullcontext(endpoint)
+
+
+def _release(
+    limiter: AdaptiveLimiter, result: Optional[Tuple[str, int, RequestTiming, float]]
+):
+    if result is None:
+        # Interrupted: free the slot without judging the WAF
+        limiter.release(0.0)
+    else:
+        limiter.release(result[3], is_dropped(result[1]))
+
+
+def _timed_outcome(
+    index: int, result: Tuple[str, int, RequestTiming, float]
+) -> Outcome:
+    payload_str, status_code, timing, elapsed = result
+    return Outcome(
+        index,
+        payload_str,
+        status_code,
+        elapsed,
+        connect=timing.connect,
+        ttfb=timing.ttfb,
+    )
+
+
+def _prepared_batches(
+    items: Iterable[Tuple[int, int, str]],
+    cells: List[Cell],
+    batch_size: int,
+    executor: Optional[ProcessPoolExecutor] = None,
+) -> Iterator[Tuple[List[Tuple[int, int]], List[PreparedRequest]]]:
+    """Serialize the requests of the pending payloads, a batch at a time.
+
+    With an executor, the next batch is prepared in a worker process while
+    the current one is being sent.
+
+    Args:
+        items: Pending (lane, index, payload) triples
+        cells: Cell of every lane
+        batch_size: Number of payloads prepared together
+        executor: Optional process pool preparing the batches
+
+    Returns:
+        Iterator of ((lane, index) keys, prepared requests) per batch
+    """
+    ahead: Deque[Tuple[List[Tuple[int, int]], Future]] = deque()
+    for batch in itertools.batched(items, batch_size):
+        keys = [(lane, index) for lane, index, _ in batch]
+        work = [(p, cells[lane]) for lane, _, p in batch]
+        if executor is None:
+            yield keys, prepare_requests(work)
+            continue
+        ahead.append((keys, executor.submit(prepare_requests, work)))
+        if len(ahead) > 1:
+            keys, future = ahead.popleft()
+            yield keys, future.result()
+    while ahead:
+        keys, future = ahead.popleft()
+        yield keys, future.result()
+
+
+def _tagged_batches(
+    batches: Iterable[Tuple[List[Tuple[int, int]], List[PreparedRequest]]],
+    request_id: str,
+) -> Iterator[Tuple[List[Tuple[int, int]], List[PreparedRequest]]]:
+    """
+    _tagged_batches returns batches whose requests carry the REQUEST_ID_HEADER <request_id>.<lane>.<index>
+    """
+    for keys, requests_ in batches:
+        for (lane, index), request in zip(keys, requests_):
+            request.headers[REQUEST_ID_HEADER] = f"{request_id}.{lane}.{index}"
+        yield keys, requests_
+
+
+async def _process_payloads_async(
+    batches: Iterable[Tuple[List[Tuple[int, int]], List[PreparedRequest]]],
+    endpoint: str,
+    concurrency: int,
+    pool: SessionPool,
+    window: int,
+    record: Callable[[int, Outcome], None],
+    balancer: Optional[Balancer] = None,
+    limiter: Optional[AdaptiveLimiter] = None,
+    retry: Optional[RetryPolicy] = None,
+):
+    semaphore = asyncio.Semaphore(concurrency)
+    async with pool.async_client() as client:
+        # Sliding window of tasks: at most `window` payloads are read ahead of
+        # the oldest outstanding request, and outcomes are emitted in order
+        pending: Deque[Tuple[Tuple[int, int], asyncio.Task]] = deque()
+        for keys, requests_ in batches:
+            for key, request in zip(keys, requests_):
+                if len(pending) >= window:
+                    (lane, oldest), task = pending.popleft()
+                    record(lane, _timed_outcome(oldest, await task))
+                task = asyncio.create_task(
+                    _timed_process_payload_async(
+                        request,
+                        endpoint,
+                        client,
+                        semaphore,
+                        pool,
+                        balancer,
+                        limiter,
+                        retry,
+                    )
+                )
+                pending.append((key, task))
+        while pending:
+            (lane, oldest), task = pending.popleft()
+            record(lane, _timed_outcome(oldest, await task))
+
+
+def send_pending(
+    items: Iterable[Tuple[int, int, str]],
+    cells: List[Cell],
+    endpoint: str,
+    record: Callable[[int, Outcome], None],
+    threads: int,
+    engine: Engine = Engine.THREAD,
+    concurrency: int = 100,
+    pool: Optional[SessionPool] = None,
+    batch_size: int = 1000,
+    balancer: Optional[Balancer] = None,
+    limiter: Optional[AdaptiveLimiter] = None,
+    retry: Optional[RetryPolicy] = None,
+    prepare_workers: int = 0,
+    request_id: Optional[str] = None,
+):
+    """Send the requests of pending payloads with the thread or async engine.
+
+    Args:
+        items: Pending (lane, index, payload) triples, consumed lazily
+        cells: Cell of every lane
+        endpoint: Endpoint URL
+        record: Callback invoked with the lane and Outcome of every request,
+            in the order of items
+        threads: Number of threads to use (thread engine)
+        request_id: Optional prefix of the REQUEST_ID_HEADER of the requests
+
+    See process_payloads_in_parallel for the remaining arguments.
+    """
+    preparer: Optional[ProcessPoolExecutor] = None
+    if prepare_workers > 0:
+        preparer = ProcessPoolExecutor(prepare_workers, mp_context=get_context("spawn"))
+    batches = _prepared_batches(items, cells, batch_size, preparer)
+    if request_id is not None:
+        batches = _tagged_batches(batches, request_id)
+
+    owns_pool = pool is None
+    if owns_pool:
+        pool = SessionPool(
+            pool_size=concurrency if engine == Engine.ASYNC else threads
+        )
+
+    try:
+        if engine == Engine.ASYNC:
+            asyncio.run(
+                _process_payloads_async(
+                    batches,
+                    endpoint,
+                    concurrency,
+                    pool,
+                    max(batch_size, concurrency),
+                    record,
+                    balancer,
+                    limiter,
+                    retry,
+                )
+            )
+        else:
+            # Use ThreadPoolExecutor for parallel processing (better for I/O bound tasks)
+            with ThreadPoolExecutor(max_workers=threads) as executor:
+                try:
+                    for keys, requests_ in batches:
+                        outcomes = executor.map(
+                            partial(
+                                _timed_process_payload,
+                                endpoint=endpoint,
+                                pool=pool,
+                                balancer=balancer,
+                                limiter=limiter,
+                                retry=retry,
+                            ),
+                            requests_,
+                        )
+                        for (lane_index, index), outcome in zip(keys, outcomes):
+                            record(lane_index, _timed_outcome(index, outcome))
+                except BaseException:
+                    # Don't keep sending the rest of the batch after Ctrl-C / errors
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    raise
+    finally:
+        if preparer is not None:
+            preparer.shutdown(cancel_futures=True)
+        if owns_pool:
+            pool.close()
+
+
+class Lane:
+    """One cell of a matrix run, with its own verdict lookups and results.
+
+    Args:
+        cell: How the payloads of the lane are sent
+        on_result: Optional callback invoked with every Outcome of the lane
+        skip: Optional lookup of the status codes known from a resumed run
+        cache: Optional verdict cache bound to the cell
+        screen: Optional in-process verdict for the cell
+    """
+
+    def __init__(
+        self,
+        cell: Cell,
+        on_result: Optional[Callable[[Outcome], None]] = None,
+        skip: Optional[Callable[[str], Optional[int]]] = None,
+        cache: Optional[CacheView] = None,
+        screen: Optional[Callable[[str], Optional[int]]] = None,
+    ):
+        self.cell = cell
+        self.on_result = on_result
+        self.skip = skip
+        self.cache = cache
+        self.screen = screen
+        self.results = ResultStore()
+        # Duplicates whose first occurrence is still in flight, by that index
+        self.waiting: Dict[int, List[Tuple[int, str]]] = {}
+
+
 def process_payloads_in_parallel(
-    payloads: List[str],
+    payloads: Iterable[str],
     method: str,
     endpoint: str,
     location: Location,
     threads: int,
     message: str = "payload",
-) -> Dict[int, List[str]]:
-    """Process multiple payloads in parallel using threading.
+    engine: Engine = Engine.THREAD,
+    concurrency: int = 100,
+    pool: Optional[SessionPool] = None,
+    batch_size: int = 1000,
+    on_result: Optional[Callable[[Outcome], None]] = None,
+    skip: Optional[Callable[[str], Optional[int]]] = None,
+    cache: Optional[CacheView] = None,
+    dedup: Optional[Deduplicator] = None,
+    balancer: Optional[Balancer] = None,
+    screen: Optional[Callable[[str], Optional[int]]] = None,
+    limiter: Optional[AdaptiveLimiter] = None,
+    retry: Optional[RetryPolicy] = None,
+    prepare_workers: int = 0,
+    encoding: Encoding = Encoding.FORM_URLENCODED,
+) -> ResultStore:
+    """Process multiple payloads in parallel using threading or asyncio.
+
+    Payloads are consumed lazily, so a generator streaming from disk starts
+    being sent before it is exhausted and only `batch_size` payloads are read
+    ahead of the requests in flight. Their requests are serialized a batch at
+    a time before being handed to the sender, which then only pushes bytes.
 
     Args:
-        payloads: List of payload strings to process
+        payloads: Iterable of payload strings to process
         method: HTTP method to use
         endpoint: Endpoint URL
         location: Location enum value
-        threads: Number of threads to use
+        threads: Number of threads to use (thread engine)
         message: Message to use in logs
+        engine: Engine enum value selecting the sending engine
+        concurrency: Maximum number of in-flight requests (async engine)
+        pool: Optional SessionPool to reuse connections across calls; a pool
+            sized to the engine's parallelism is created and closed otherwise
+        batch_size: Number of payloads read ahead of the sender
+        on_result: Optional callback invoked with every Outcome as it completes
+        skip: Optional lookup returning the status code already known for a
+            payload (e.g. from a resumed run); such payloads are recorded
+            without being sent or passed to on_result
+        cache: Optional verdict cache; only cache misses are sent, hits are
+            reported to on_result as cached outcomes
+        dedup: Optional deduplicator; blank payloads are dropped and only the
+            first of a group of duplicates is sent, its verdict is reported
+            for every duplicate as a cached outcome
+        balancer: Optional balancer spreading the requests across several WAF
+            replicas instead of sending them all to endpoint; results are
+            still recorded by payload index whichever replica answered
+        screen: Optional in-process verdict (e.g. from the offline rule
+            screener); payloads it decides are reported as cached outcomes
+            and only the undecided ones are sent
+        limiter: Optional adaptive limit on the requests in flight, below the
+            threads / concurrency, lowered when the WAF drops requests
+        retry: Optional policy retrying timeouts, connection errors and
+            overload statuses; payloads failing every attempt are recorded
+            as ERRORED
+        prepare_workers: Number of worker processes serializing the requests
+            (JSON / XML bodies) off the sending threads; 0 prepares them
+            inline, which is cheaper for plain query / header payloads
+        encoding: Encoding enum value of the request body
 
     Returns:
-        Dictionary mapping status codes to lists of payloads
+        ResultStore holding the status code of every payload by its index
+    """
+    lane = Lane(Cell(method, location, encoding), on_result, skip, cache, screen)
+    process_matrix_in_parallel(
+        payloads,
+        [lane],
+        endpoint,
+        threads,
+        message,
+        engine,
+        concurrency,
+        pool,
+        batch_size,
+        dedup,
+        balancer,
+        limiter,
+        retry,
+        prepare_workers,
+    )
+    return lane.results
+
+
+def process_matrix_in_parallel(
+    payloads: Iterable[str],
+    lanes: List[Lane],
+    endpoint: str,
+    threads: int,
+    message: str = "payload",
+    engine: Engine = Engine.THREAD,
+    concurrency: int = 100,
+    pool: Optional[SessionPool] = None,
+    batch_size: int = 1000,
+    dedup: Optional[Deduplicator] = None,
+    balancer: Optional[Balancer] = None,
+    limiter: Optional[AdaptiveLimiter] = None,
+    retry: Optional[RetryPolicy] = None,
+    prepare_workers: int = 0,
+    coordinator: Optional["Coordinator"] = None,
+    request_id: Optional[str] = None,
+):
+    """Send every payload once per lane through a single scheduler.
+
+    The corpus is read once and each payload is expanded into one request
+    per lane, all of them sharing the sending engine, connection pool,
+    limiter and balancer, so that covering several (method, location,
+    encoding) combinations costs a single pass. Results are recorded in
+    each lane's ResultStore; see process_payloads_in_parallel for the
+    remaining arguments.
+
+    Args:
+        payloads: Iterable of payload strings to process
+        lanes: Lanes to evaluate every payload in
+        endpoint: Endpoint URL
+        threads: Number of threads to use (thread engine)
+        coordinator: Optional coordinator of a distributed run; the pending
+            requests are then sent by its workers instead of from here,
+            while deduplication, caching and recording stay local
+        request_id: Optional prefix of the REQUEST_ID_HEADER identifying
+            each request as <request_id>.<lane>.<index>
     """
-    results: Dict[int, List[str]] = {}
 
-    # Prepare arguments for parallel processing
-    args = [(p, method, endpoint, location, message) for p in payloads]
+    def record(lane_index: int, outcome: Outcome):
+        lane = lanes[lane_index]
+        lane.results.record(outcome.index, outcome.status_code)
+        # Transport errors surface as 5xx and must be retried, not remembered
+        if lane.cache is not None and not outcome.cached and outcome.status_code < 500:
+            lane.cache.put(outcome.payload, outcome.status_code)
+        if lane.on_result is not None:
+            lane.on_result(outcome)
+        for index, p in lane.waiting.pop(outcome.index, ()):
+            record(lane_index, Outcome(index, p, outcome.status_code, cached=True))
 
-    # Use ThreadPoolExecutor for parallel processing (better for I/O bound tasks)
-    max_workers = min(
-        threads, multiprocessing.cpu_count() * 2
-    )  # More threads for I/O bound tasks
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        for payload_str, status_code in executor.map(process_payload, args):
-            if status_code not in results:
-                results[status_code] = []
-            results[status_code].append(payload_str)
+    def pending_items():
+        for index, p in enumerate(payloads):
+            first = index
+            if dedup is not None:
+                if not p:
+                    continue
+                first = dedup.first_index(p, index)
+            for lane_index, lane in enumerate(lanes):
+                if lane.skip is not None:
+                    status_code = lane.skip(p)
+                    if status_code is not None:
+                        lane.results.record(index, status_code)
+                        continue
+                if first != index:
+                    status_code = lane.results.status(first)
+                    if status_code != UNTESTED:
+                        record(lane_index, Outcome(index, p, status_code, cached=True))
+                    else:
+                        lane.waiting.setdefault(first, []).append((index, p))
+                    continue
+                if lane.cache is not None:
+                    status_code = lane.cache.get(p)
+                    if status_code is not None:
+                        record(lane_index, Outcome(index, p, status_code, cached=True))
+                        continue
+                if lane.screen is not None:
+                    status_code = lane.screen(p)
+                    if status_code is not None:
+                        record(lane_index, Outcome(index, p, status_code, cached=True))
+                        continue
+                yield lane_index, index, p
+
+    cells = [lane.cell for lane in lanes]
+    if coordinator is not None:
+        # Sent by the workers of a distributed run, recorded here as they report
+        coordinator.run(pending_items(), cells, batch_size, record)
+    else:
+        send_pending(
+            pending_items(),
+            cells,
+            endpoint,
+            record,
+            threads,
+            engine,
+            concurrency,
+            pool,
+            batch_size,
+            balancer,
+            limiter,
+            retry,
+            prepare_workers,
+            request_id,
+        )
 
-    return results
+    errored = sum(lane.results.count(ERRORED) for lane in lanes)
+    if errored > 0:
+        logger.warning(f"{errored} {message}(s) failed on every attempt")
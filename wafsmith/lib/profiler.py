@@ -0,0 +1,479 @@
+import re
+import math
+import time
+import logging
+from multiprocessing import get_context
+from re import _constants as sre
+from re import _parser as sre_parse
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+from wafsmith.lib.corpus import list_files
+from wafsmith.lib.rules import iter_directives, parse_actions, translate_pcre
+
+logger = logging.getLogger("profiler")
+
+# Lengths the pumped part of the adversarial inputs is grown through
+STRESS_SIZES = (16, 64, 256, 1024, 4096)
+# An input taking longer is not grown any further
+STRESS_BUDGET = 0.05
+# Growth exponent of the matching time beyond which a rule is super-linear
+SUPERLINEAR_EXPONENT = 1.5
+# Largest times below this are dominated by the call overhead, no growth is fitted
+MIN_MEASURABLE = 1e-4
+# Adversarial inputs tried per rule, bounding the profiling of large expressions
+MAX_ATTACKS = 32
+# Seconds the worker may stay silent past the timeout before it is killed,
+# covering scheduling delays: overruns are timed and reported by the worker
+SCHEDULING_MARGIN = 1.0
+# Characters ending the adversarial inputs, chosen to make the match fail
+SUFFIXES = ("!", "\x00")
+
+CATASTROPHIC = "catastrophic"
+SUPERLINEAR = "super-linear"
+LINEAR = "linear"
+INVALID = "invalid"
+
+_REPEATS = (sre.MAX_REPEAT, sre.MIN_REPEAT, sre.POSSESSIVE_REPEAT)
+_CATEGORIES = {
+    sre.CATEGORY_DIGIT: r"\d",
+    sre.CATEGORY_NOT_DIGIT: r"\D",
+    sre.CATEGORY_SPACE: r"\s",
+    sre.CATEGORY_NOT_SPACE: r"\S",
+    sre.CATEGORY_WORD: r"\w",
+    sre.CATEGORY_NOT_WORD: r"\W",
+}
+# Characters tried in turn when one must (not) belong to a character set
+_CANDIDATES = "a1 !-A_\x00"
+
+
+class RegexRule(NamedTuple):
+    """The @rx operator of a SecRule, chained links carrying the id of the chain."""
+
+    id: int
+    pattern: str
+    path: str
+
+
+def iter_regex_rules(path: str) -> Iterator[RegexRule]:
+    """
+    iter_regex_rules yields the @rx operators of the SecRules of a rules file or directory
+    """
+    for file_path in list_files(path):
+        if not file_path.endswith(".conf"):
+            continue
+        chain_id: Optional[int] = None
+        for directive in iter_directives(file_path):
+            if directive.name != "SecRule" or len(directive.args) < 2:
+                continue
+            actions = parse_actions(directive.args[2]) if len(directive.args) > 2 else []
+            rule_id = next(
+                (int(argument) for action, argument in actions if action == "id" and argument.isdigit()),
+                chain_id or 0,
+            )
+            chain_id = rule_id if any(action == "chain" for action, _ in actions) else None
+            operator = directive.args[1].lstrip("!")
+            if not operator.startswith("@"):
+                operator = "@rx " + operator
+            name, _, argument = operator.partition(" ")
+            if name.lower() == "@rx" and "%{" not in argument:
+                yield RegexRule(rule_id, argument.strip(), file_path)
+
+
+def compile_rule(pattern: str) -> "re.Pattern[str]":
+    """
+    compile_rule compiles an @rx argument the way the offline ruleset does
+    """
+    return re.compile(translate_pcre(pattern), re.S | re.A)
+
+
+def _set_contains(items: Sequence[Tuple[Any, Any]], char: str) -> bool:
+    negated = bool(items) and items[0][0] == sre.NEGATE
+    found = False
+    for op, av in items:
+        if op == sre.LITERAL:
+            found = chr(av) == char
+        elif op == sre.RANGE:
+            found = av[0] <= ord(char) <= av[1]
+        elif op == sre.CATEGORY:
+            found = av in _CATEGORIES and re.fullmatch(_CATEGORIES[av], char) is not None
+        if found:
+            break
+    return found != negated
+
+
+def _set_char(items: Sequence[Tuple[Any, Any]]) -> str:
+    for char in _CANDIDATES:
+        if _set_contains(items, char):
+            return char
+    for op, av in items:
+        if op == sre.LITERAL:
+            return chr(av)
+        if op == sre.RANGE:
+            return chr(av[0])
+    return "a"
+
+
+def sample(nodes: Sequence[Tuple[Any, Any]]) -> str:
+    """
+    sample returns a short string matched by a parsed expression, lookarounds and back-references left out
+    """
+    parts: List[str] = []
+    for op, av in nodes:
+        if op == sre.LITERAL:
+            parts.append(chr(av))
+        elif op == sre.NOT_LITERAL:
+            parts.append("a" if av != ord("a") else "b")
+        elif op == sre.ANY:
+            parts.append("a")
+        elif op == sre.IN:
+            parts.append(_set_char(av))
+        elif op in _REPEATS:
+            low, _, body = av
+            parts.append(sample(body) * low)
+        elif op == sre.SUBPATTERN:
+            parts.append(sample(av[-1]))
+        elif op == sre.ATOMIC_GROUP:
+            parts.append(sample(av))
+        elif op == sre.BRANCH:
+            parts.append(sample(av[1][0]))
+    return "".join(parts)
+
+
+def _attacks(nodes: Sequence[Tuple[Any, Any]], prefix: str) -> Iterator[Tuple[str, str]]:
+    nodes = list(nodes)
+    for i, (op, av) in enumerate(nodes):
+        before = prefix + sample(nodes[:i])
+        if op in _REPEATS:
+            _, high, body = av
+            if high > 1:
+                yield before, sample(body)
+                # Overlapping alternatives, e.g. (a|ab)+, are pumped one by one
+                body = list(body)
+                if len(body) == 1 and body[0][0] == sre.SUBPATTERN:
+                    body = list(body[0][1][-1])
+                if len(body) == 1 and body[0][0] == sre.BRANCH:
+                    for alternative in body[0][1][1]:
+                        yield before, sample(alternative)
+            yield from _attacks(av[2], before)
+        elif op == sre.SUBPATTERN:
+            yield from _attacks(av[-1], before)
+        elif op == sre.ATOMIC_GROUP:
+            yield from _attacks(av, before)
+        elif op == sre.BRANCH:
+            for alternative in av[1]:
+                yield from _attacks(alternative, before)
+
+
+def adversarial_inputs(pattern: str) -> List[Tuple[str, str, str]]:
+    """Derive the inputs most likely to make an expression backtrack.
+
+    Every repeated part of the expression is pumped: the input reaches it
+    with a string matching what precedes it, repeats a string its body
+    matches, and ends with a character making the overall match fail, which
+    is what makes nested or adjacent overlapping quantifiers backtrack.
+
+    Args:
+        pattern: Python expression, see translate_pcre
+
+    Returns:
+        (prefix, pump, suffix) triples, the input of size n being
+        prefix + pump * n + suffix
+    """
+    try:
+        parsed = sre_parse.parse(pattern, re.S)
+    except re.error:
+        return []
+    attacks: List[Tuple[str, str, str]] = []
+    for prefix, pump in _attacks(parsed, ""):
+        if not pump:
+            continue
+        for suffix in SUFFIXES:
+            attack = (prefix, pump, suffix)
+            if attack not in attacks:
+                attacks.append(attack)
+        if len(attacks) >= MAX_ATTACKS:
+            break
+    return attacks
+
+
+def time_search(pattern: "re.Pattern[str]", value: str, minimum: float = 0.001) -> float:
+    """
+    time_search returns the CPU seconds a search of value takes, averaged over as many searches as fit in minimum
+    """
+    calls = 0
+    start = time.thread_time()
+    while True:
+        pattern.search(value)
+        calls += 1
+        elapsed = time.thread_time() - start
+        if elapsed >= minimum:
+            return elapsed / calls
+
+
+def _profile_worker(conn, corpora: Dict[str, List[str]], timeout: float):
+    """
+    _profile_worker times the expressions it receives against the corpora and their adversarial inputs, one message per measure,
+    a progress message every tenth of timeout through a corpus and an overrun message for a value searched longer than timeout
+    """
+    heartbeat = timeout / 10
+    while True:
+        pattern = conn.recv()
+        if pattern is None:
+            return
+        try:
+            compiled = compile_rule(pattern)
+        except re.error as e:
+            conn.send(("invalid", str(e)))
+            continue
+        overrun = False
+        for kind, values in corpora.items():
+            conn.send(("corpus", kind))
+            total = slowest = 0.0
+            slowest_value = ""
+            matches = 0
+            beat = time.perf_counter()
+            for searched, value in enumerate(values, 1):
+                # CPU time, so that being descheduled neither skews the
+                # measures nor overruns the timeout
+                start = time.thread_time()
+                matched = compiled.search(value) is not None
+                elapsed = time.thread_time() - start
+                if elapsed > timeout:
+                    conn.send(("overrun", (searched, elapsed)))
+                    overrun = True
+                    break
+                total += elapsed
+                matches += matched
+                if elapsed > slowest:
+                    slowest, slowest_value = elapsed, value
+                now = time.perf_counter()
+                if now - beat >= heartbeat:
+                    conn.send(("progress", searched))
+                    beat = now
+            if overrun:
+                break
+            conn.send(("timed", (kind, len(values), matches, total, slowest, slowest_value)))
+        if overrun:
+            continue
+        for prefix, pump, suffix in adversarial_inputs(compiled.pattern):
+            for size in STRESS_SIZES:
+                conn.send(("stress", (prefix, pump, suffix, size)))
+                elapsed = time_search(compiled, prefix + pump * size + suffix)
+                conn.send(("stressed", elapsed))
+                if elapsed > STRESS_BUDGET:
+                    break
+            if elapsed >= timeout:
+                break
+        conn.send(("done", None))
+
+
+class CorpusTiming(NamedTuple):
+    values: int
+    matches: int
+    seconds: float
+    slowest: float
+    slowest_value: str
+
+
+class RuleProfile:
+    """Matching cost of a rule, on the corpora and on adversarial inputs."""
+
+    def __init__(self, rule: RegexRule):
+        self.rule = rule
+        self.verdict = LINEAR
+        self.error: Optional[str] = None
+        self.corpora: Dict[str, CorpusTiming] = {}
+        # Worst adversarial input: (prefix, pump, suffix, size), seconds and growth exponent
+        self.attack: Optional[Tuple[str, str, str, int]] = None
+        self.attack_seconds = 0.0
+        self.exponent = 0.0
+
+    @property
+    def seconds(self) -> float:
+        return sum(timing.seconds for timing in self.corpora.values())
+
+    @property
+    def values(self) -> int:
+        return sum(timing.values for timing in self.corpora.values())
+
+    def cost(self) -> Tuple[int, float]:
+        """
+        cost returns the sort key of the rule, the pathological rules first and then the most expensive ones
+        """
+        rank = {CATASTROPHIC: 0, SUPERLINEAR: 1, INVALID: 2}.get(self.verdict, 3)
+        return rank, -self.seconds
+
+    def record(self) -> Dict[str, Any]:
+        record: Dict[str, Any] = {
+            "id": self.rule.id,
+            "pattern": self.rule.pattern,
+            "verdict": self.verdict,
+            "seconds": round(self.seconds, 6),
+            "mean_us": round(self.seconds / self.values * 1_000_000, 3) if self.values else None,
+            "exponent": round(self.exponent, 2),
+        }
+        for kind, timing in self.corpora.items():
+            record[kind] = {
+                "values": timing.values,
+                "matches": timing.matches,
+                "seconds": round(timing.seconds, 6),
+                "slowest_us": round(timing.slowest * 1_000_000, 3),
+                "slowest_value": timing.slowest_value,
+            }
+        if self.attack is not None and self.verdict in (CATASTROPHIC, SUPERLINEAR):
+            prefix, pump, suffix, size = self.attack
+            record["attack"] = {
+                "prefix": prefix,
+                "pump": pump,
+                "suffix": suffix,
+                "size": size,
+                "seconds": round(self.attack_seconds, 6),
+            }
+        if self.error is not None:
+            record["error"] = self.error
+        return record
+
+
+class RuleProfiler:
+    """Ranks the @rx rules of a rules file by the CPU time they cost.
+
+    Each expression is compiled the way the offline ruleset compiles it and
+    timed against every value of the corpora, then against adversarial
+    inputs grown through STRESS_SIZES to expose catastrophic backtracking.
+    Python's re backtracks like PCRE, so an expression blowing up here blows
+    up in ModSecurity too, although absolute times differ. The matching runs
+    in a separate process, a rule is catastrophic when a single measure, or
+    a single value of the corpora, takes longer than `timeout` seconds. The
+    process reports such overruns itself, timing the values in CPU time,
+    and reports its progress through the corpora; it is killed when it
+    stays silent for SCHEDULING_MARGIN seconds past the timeout, stuck in a
+    search that would never end.
+
+    Args:
+        corpora: Values to time the expressions against, by kind
+        timeout: Seconds a single measure, or a single value of the
+            corpora, may take
+    """
+
+    def __init__(self, corpora: Dict[str, List[str]], timeout: float = 5.0):
+        self.corpora = corpora
+        self.timeout = timeout
+        self._context = get_context("spawn")
+        self._process = None
+        self._conn = None
+
+    def __enter__(self) -> "RuleProfiler":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _start(self):
+        parent, child = self._context.Pipe()
+        self._process = self._context.Process(
+            target=_profile_worker,
+            args=(child, self.corpora, self.timeout),
+            daemon=True,
+        )
+        self._process.start()
+        child.close()
+        self._conn = parent
+
+    def _kill(self):
+        if self._process is not None:
+            self._process.kill()
+            self._process.join()
+            self._conn.close()
+            self._process = self._conn = None
+
+    def _receive(self, timeout: float) -> Optional[Tuple[str, Any]]:
+        deadline = time.monotonic() + timeout
+        while not self._conn.poll(min(0.1, timeout)):
+            if not self._process.is_alive():
+                self._kill()
+                raise RuntimeError("the profiling process exited unexpectedly")
+            if time.monotonic() >= deadline:
+                return None
+        return self._conn.recv()
+
+    def close(self):
+        if self._process is not None:
+            try:
+                self._conn.send(None)
+                self._process.join(self.timeout)
+            finally:
+                self._kill()
+
+    def profile(self, rule: RegexRule) -> RuleProfile:
+        if self._process is None:
+            self._start()
+        result = RuleProfile(rule)
+        self._conn.send(rule.pattern)
+        measuring: Optional[Tuple[str, Any]] = None
+        # Values of the corpus being measured searched so far
+        searched = 0
+        growth: Dict[Tuple[str, str, str], List[Tuple[int, float]]] = {}
+        while True:
+            # Starting the worker may take a while, measures may not
+            timeout = (
+                self.timeout + SCHEDULING_MARGIN if measuring is not None else max(self.timeout, 30)
+            )
+            received = self._receive(timeout)
+            if received is None:
+                self._kill()
+                result.verdict = CATASTROPHIC
+                if measuring is not None and measuring[0] == "stress":
+                    result.attack = measuring[1]
+                    result.attack_seconds = self.timeout
+                elif measuring is not None:
+                    result.error = (
+                        f"Timed out on a value of the {measuring[1]} corpus "
+                        f"after {searched} value(s)"
+                    )
+                return result
+            message, value = received
+            if message in ("corpus", "stress"):
+                measuring, searched = (message, value), 0
+            elif message == "progress":
+                searched = value
+            elif message == "overrun":
+                searched, seconds = value
+                result.verdict = CATASTROPHIC
+                result.error = (
+                    f"Value {searched} of the {measuring[1]} corpus took {seconds:.2f}s"
+                )
+                return result
+            elif message == "timed":
+                kind, *timing = value
+                result.corpora[kind] = CorpusTiming(*timing)
+            elif message == "stressed":
+                attack = measuring[1]
+                growth.setdefault(attack[:3], []).append((attack[3], value))
+                if value > result.attack_seconds:
+                    result.attack, result.attack_seconds = attack, value
+            elif message == "invalid":
+                result.verdict, result.error = INVALID, value
+                return result
+            elif message == "done":
+                break
+
+        for points in growth.values():
+            # Fitted on the two largest sizes, where the matching outweighs the call overhead
+            if len(points) >= 2 and points[-1][1] >= MIN_MEASURABLE:
+                (n1, t1), (n2, t2) = points[-2:]
+                result.exponent = max(result.exponent, math.log(t2 / t1) / math.log(n2 / n1))
+        if result.attack_seconds >= self.timeout:
+            result.verdict = CATASTROPHIC
+        elif result.exponent >= SUPERLINEAR_EXPONENT:
+            result.verdict = SUPERLINEAR
+        return result
+
+
+def profile_rules(
+    rules: Sequence[RegexRule], corpora: Dict[str, List[str]], timeout: float = 5.0
+) -> List[RuleProfile]:
+    """
+    profile_rules returns the profiles of the rules, the pathological and most expensive first
+    """
+    with RuleProfiler(corpora, timeout) as profiler:
+        profiles = [profiler.profile(rule) for rule in rules]
+    return sorted(profiles, key=RuleProfile.cost)
@@ -0,0 +1,186 @@
+# Prompts of the LLM workflows, the single-payload ones shared with the Node CLI (cli-app/src/lib/llm/prompts/)
+
+EXTRACT_SYSTEM_PROMPT_1 = """
+You are a cybersecurity-focused AI model trained to analyze and extract potentially malicious payloads from NGINX logs. Your task is to detect, classify, and isolate suspicious patterns, query parameters, or payloads that indicate malicious intent, including but not limited to SQL injection, XSS, directory traversal, and reconnaissance activity. Follow the instructions below:
+
+1. Recognize the Structure of NGINX Logs
+- Parse logs with the format (or similar variations):  
+  
+  <ip> - <user> [<timestamp>] "<method> <path> <protocol>" <status> <bytes> "<referrer>" "<user-agent>"
+  Example: 203.0.113.10 - - [01/Jan/2023:12:34:56 +0000] "GET /index.php?id=1' OR '1'='1 HTTP/1.1" 200 1234 "-" "sqlmap/1.5"
+
+2. Extract the Key Components
+Focus on:
+   - IP Address: The origin of the request.
+   - Request URI/Path: Identify potential payloads in the request path or query string.
+   - HTTP Method: Highlight uncommon methods like "OPTIONS" or "TRACE" that may indicate reconnaissance.
+   - User-Agent: Look for malicious tools ("sqlmap", "curl") or empty/malformed User-Agent strings.
+   - Status Code: Repeated "403", "404", or "500" codes might point to exploitation attempts.
+
+3. Detect Suspicious Patterns or Payloads
+Isolate suspicious elements from the logs:
+- SQL Injection Payloads:
+   - Look for query strings or parameters containing:
+     - "'", "\"", ";", "--", "%27", "#", "OR", "AND", "UNION", "SELECT".
+     - Example: "?id=1' OR '1'='1".
+   - Detect encoded variations, e.g., "%27OR%271%27=%271".
+
+- XSS Payloads:
+   - Identify "<script>", event handlers like "onload=", or malicious attributes like "javascript:".
+   - Check for encoded scripts ("%3Cscript%3Ealert('XSS')%3C/script%3E").
+
+- Directory Traversal:
+   - Look for sequences like "../", "%2e%2e/", "/etc/passwd", "/var/www".
+   - Example: "/../../../../etc/passwd".
+
+- Excessive Parameters or Obfuscated Content:
+   - Detect unusually long query strings, repeated characters, or base64-encoded data.
+   - Example: "/vulnerable?data=aGVsbG9fd29ybGQ=".
+
+- Reconnaissance/Scanner Activity:
+   - Requests targeting known paths such as "/wp-admin/", "/phpmyadmin/", "/cgi-bin/", ".env", ".git".
+
+4. Classify Threats
+Categorize extracted payloads into the following categories: 
+   - command-injection: Attempts to perform remote code execution
+   - file-inclusion: Attempts to load files
+   - sqli: Attack on database queries.
+   - xss: Injected malicious scripts.
+   - directory-traversal: Unauthorized access to server files.
+   - recon: Scanning attempts for vulnerabilities.
+   - non-malicious: Not a potential attack
+
+5. Output Format
+For each NGINX log entry, provide the following structure in JSON:
+{
+    "classification": { sqli / xss / directory-traversal / command-injection / recon / non-malicious},
+    "extracted_payload": {The malicious part isolated from the log},
+    "reason": {Explanation of why the pattern is flagged as malicious}
+}
+
+6. Examples
+- Input Log: 192.168.0.1 - - [02/Oct/2023:14:45:32 +0000] "GET /search.php?q=<script>alert('XSS')</script> HTTP/1.1" 200 542 "-" "Mozilla/5.0"
+- Expected Response
+{
+"classification": "xss",
+"extracted_payload": "<script>alert('XSS')</script>",
+"reason":  "Presence of a "<script>" tag in the query string suggests a possible XSS attack"
+}
+
+- Input Log: 203.0.113.10 - - [02/Oct/2023:16:12:10 +0000] "GET /vulnerable?id=1 UNION SELECT username, password FROM users HTTP/1.1" 200 1342 "-" "sqlmap/1.5"
+- Expected Response
+{
+    "classification": "sqli",
+    "extracted_payload": "1 UNION SELECT username, password FROM users",
+    "reason":  "SQL keywords "UNION" and "SELECT" indicate an SQL injection attempt."
+}
+
+Focus on precision and avoid false positives by analyzing the log content carefully. Always prioritize isolating actionable details of the payloads over generic descriptions."
+"""
+
+EXTRACT_USER_PROMPT_1 = """The is a log entry from our NGINX server
+
+%%LOG%%
+
+Perform classification based on the expected response. Respond in JSON only"""
+
+EXTRACT_USER_PROMPT_1_RETRY = """The response is not valid JSON. Respond with the JSON object of the expected response only"""
+
+# Several log entries per call, see Template
+EXTRACT_BATCH_USER_PROMPT_1 = """These are log entries from our NGINX server, as a JSON array of strings
+
+%%PAYLOADS%%
+
+Perform classification of every log entry based on the expected response. Respond in JSON only, with an array holding the expected response of every log entry, in the same order"""
+
+CREATE_SYSTEM_PROMPT_1 = """You are a cybersecurity expert in writing Modsecurity WAF rules.
+
+### Key Elements of a ModSecurity Rule:
+
+SecRule Directive: The primary directive used to define a rule in ModSecurity. Example: SecRule REQUEST_URI "@contains /admin" "id:1001,phase:1,deny,status:403"
+Variables: Data containers used for evaluation in the rule. Examples include REQUEST_URI (the full request URL), ARGS (all request parameters), ARGS_GET (query string parameters), ARGS_POST (POST body parameters), and FILES (file names in multipart/form-data requests). 
+Operators: Perform comparisons or actions on variables. Example: @contains checks if the variable contains a specified value.
+Actions: Define actions to be taken when the rule conditions are met. Example: "deny,status:403" blocks the request and returns a 403 Forbidden status code.
+Rule ID: Unique identifier for tracking and management of rules. Example: id:1001 provides a unique identification for the rule.
+Severity Level: Indicates the severity of the rule. Example: severity:2 assigns a severity level of 2 (Moderate).
+
+### Response Guidelines:
+1. You will be tasked to first generate a Regular Expression to match the exact payload. From which the user will test the regular expression in his NodeJS application and prompts you to continue creating a ModSecurity Rule if the regular expression is successful in catching the payload.
+2. When prompted for the creation of the ModSecurity Rule, you are to identify if the payload has been encoded, and generate a ModSecurity rule that is appropritate to be applied at the correct processing cycle. It will be useful to include in the tag section of the modsecurity rule to indicate what type of payload the rule is trying to catch. This helps in optimizing and aggregating the ruleset in the future.
+"""
+
+# The regular expression and the rule in a single answer, checked by the
+# client instead of over several turns as the Node CLI does
+CREATE_USER_PROMPT = """Can you create a regular expression that catches this payload, then derive the ModSecurity rule from it?
+
+%%PAYLOAD%%
+
+The payload was found in the %%POSITION%% of a %%METHOD%% request.
+
+1. The regular expression will be tested with Python's re.search against the payload. Do not use forward slash to delimit it.
+2. The payload may appear inbetween content of the HTTP request, try to avoid anchoring the regular expression to the start or end of the line
+3. Avoid overfitting. The regular expression should be generic enough to catch the malicious semantic structure of the payload, filler content is not important.
+4. For simplicity, the action of the rule will default to "deny". Keep the rule concise, on a single line, with id:1 as its ID.
+5. Try to be concise when writing information in the tag. Avoid special characters or payload in the tag content.
+
+Respond in JSON only, with the keys "regex" and "rule", nothing else"""
+
+CREATE_BATCH_USER_PROMPT = """Can you create a regular expression that catches each of these payloads, given as a JSON array of strings, then derive a ModSecurity rule from it?
+
+%%PAYLOADS%%
+
+The payloads were found in the %%POSITION%% of a %%METHOD%% request.
+
+1. Every regular expression will be tested with Python's re.search against its payload. Do not use forward slash to delimit them.
+2. The payloads may appear inbetween content of the HTTP request, try to avoid anchoring the regular expressions to the start or end of the line
+3. Avoid overfitting. The regular expressions should be generic enough to catch the malicious semantic structure of the payloads, filler content is not important.
+4. For simplicity, the action of the rules will default to "deny". Keep the rules concise, each on a single line, with id:1 as their ID.
+5. Try to be concise when writing information in the tag. Avoid special characters or payload in the tag content.
+
+Respond in JSON only, with an array holding an object with the keys "regex" and "rule" for every payload, in the same order"""
+
+AGGREGATE_SYSTEM_PROMPT_1 = """You are a cybersecurity expert in writing Modsecurity WAF rules. Your team deployed numerous ModSecurity rules. However, you notice that there are common patterns in the ModSecurity rules, potentially allowing the number of rules deployed to be reduced.
+
+You are to take in consideration the following best practices when merging the modsecurity rules:
+
+Rule Consolidation:
+Merge multiple related rules into a single rule where possible to reduce the overall rule count.
+Consolidating rules can help minimize the processing overhead and improve performance.
+
+Specificity:
+Write rules that are as specific as possible to target the intended threats without affecting legitimate traffic.
+Avoid overly broad rules that may lead to false positives or unnecessary processing.
+
+Regular Expression Efficiency:
+Optimize regular expressions used in rules to be efficient and avoid excessive backtracking.
+Use non-greedy quantifiers, anchors, and specific character classes to improve regex performance.
+
+Rule Ordering:
+Order rules based on the likelihood of matching to prioritize more common threats.
+Place more specific rules before generic rules to reduce unnecessary processing.
+
+Guides on responses
+1. You will be tasked to first identify common patterns in the list of ModSecurity rules. Then you group the rules together based on the intention of the rule. From which, you try to reduce the number of rules for each category by optimizing the regular expression.
+2. You will be provided a list of whitelisted traffic that should not be caught by your regular expression."""
+
+AGGREGATE_USER_PROMPT_1 = """Given the following ModSecurity Rules, can you optimize the number of rules by combing the rules as much as possible. Do not overfit by combing all into one rule.
+
+Try to:
+- Identify common text pattern and group them
+- Create a modsecurity rule based on these group
+- In each of the group, try to optimize the regular expression if possible
+- Simpify the actions of the modsecurity to deny only
+- Common payloads includes valid domains which generic regular expressions to catch domains can be used
+
+# ModSecurity Rules
+%%MODSECURITY_RULES%%
+
+You have a have a list of traffic content that should not be caught by your modsecurity rules
+
+# Whitelisted Traffic
+%%BUSINESS_TRAFFIC%%
+
+# Response Notes
+1. Respond only with the ModSecurity rules, with each rule on a single line
+2. Do not respond with your thinking or anything else
+"""
@@ -0,0 +1,54 @@
+import logging
+from array import array
+from typing import Dict, NamedTuple
+
+logger = logging.getLogger("results")
+
+# Status code reserved for payloads that have not been tested yet
+UNTESTED = 0
+# Status code recorded for payloads whose request failed (timeout, connection
+# error) on every attempt, so that they are neither blocked nor evaded
+ERRORED = 599
+
+
+class Outcome(NamedTuple):
+    """Result of sending one payload, reported as soon as it completes."""
+
+    index: int
+    payload: str
+    status_code: int
+    elapsed: float = 0.0
+    cached: bool = False
+    connect: float = 0.0
+    ttfb: float = 0.0
+
+
+class ResultStore:
+    """Compact per-payload status codes for a corpus.
+
+    Payloads are referenced by their index in the source corpus rather than
+    copied: the status codes live in an unsigned 16-bit array (two bytes per
+    payload) and the per-code counts are maintained as results are recorded.
+    """
+
+    def __init__(self):
+        self.codes = array("H")
+        self.counts: Dict[int, int] = {}
+
+    def record(self, index: int, status_code: int):
+        if index >= len(self.codes):
+            self.codes.extend([UNTESTED] * (index + 1 - len(self.codes)))
+        previous = self.codes[index]
+        if previous != UNTESTED:
+            self.counts[previous] -= 1
+        self.codes[index] = status_code
+        self.counts[status_code] = self.counts.get(status_code, 0) + 1
+
+    def __len__(self) -> int:
+        return sum(self.counts.values())
+
+    def count(self, status_code: int) -> int:
+        return self.counts.get(status_code, 0)
+
+    def status(self, index: int) -> int:
+        return self.codes[index] if index < len(self.codes) else UNTESTED
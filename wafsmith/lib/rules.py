@@ -0,0 +1,763 @@
+import os
+import re
+import html
+import json
+import base64
+import logging
+import random
+import posixpath
+from typing import Any, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Set, Tuple
+from urllib.parse import parse_qsl, quote_plus, unquote_plus
+from wafsmith.lib.corpus import list_files
+from wafsmith.lib.payload import Encoding, Location
+from wafsmith.lib.matcher import PhraseMatcher, load_matcher
+
+logger = logging.getLogger("rules")
+
+# Anomaly score added by a matching rule, see REQUEST-901-INITIALIZATION
+SEVERITY_SCORES = {"critical": 5, "error": 4, "warning": 3, "notice": 2}
+
+# Collections a payload can end up in, depending on where it is sent
+PAYLOAD_VARIABLES = {
+    "ARGS",
+    "ARGS_GET",
+    "ARGS_POST",
+    "ARGS_NAMES",
+    "ARGS_GET_NAMES",
+    "ARGS_POST_NAMES",
+    "QUERY_STRING",
+    "REQUEST_URI",
+    "REQUEST_URI_RAW",
+    "REQUEST_LINE",
+    "REQUEST_HEADERS",
+    "REQUEST_BODY",
+    "XML",
+}
+
+PAYLOAD_HEADER = "x-payload"
+PAYLOAD_PARAMETER = "payload"
+
+
+def _url_decode_uni(value: str) -> str:
+    value = re.sub(r"%u([0-9a-fA-F]{4})", lambda m: chr(int(m.group(1), 16)), value)
+    return unquote_plus(value)
+
+
+_ESCAPES = {"a": "\a", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t", "v": "\v"}
+
+
+def _escape_decode(value: str) -> str:
+    def replace(m: re.Match) -> str:
+        escape = m.group(1)
+        if escape[0] in "xX" and len(escape) > 1:
+            return chr(int(escape[1:], 16))
+        if escape[0] == "u" and len(escape) > 1:
+            return chr(int(escape[1:], 16))
+        if escape[0] in "01234567":
+            return chr(int(escape, 8) & 0xFF)
+        return _ESCAPES.get(escape, escape)
+
+    return re.sub(
+        r"\\(u[0-9a-fA-F]{4}|[xX][0-9a-fA-F]{2}|[0-7]{1,3}|.)", replace, value, flags=re.S
+    )
+
+
+def _css_decode(value: str) -> str:
+    def replace(m: re.Match) -> str:
+        if m.group(1):
+            code = int(m.group(1), 16)
+            return chr(code) if code <= 0x10FFFF else ""
+        return m.group(2)
+
+    return re.sub(r"\\(?:([0-9a-fA-F]{1,6})\s?|(.))", replace, value, flags=re.S)
+
+
+def _replace_comments(value: str) -> str:
+    return re.sub(r"/\*.*?(?:\*/|$)", " ", value, flags=re.S)
+
+
+def _cmd_line(value: str) -> str:
+    value = re.sub(r"[\\\"'^]", "", value)
+    value = re.sub(r"\s+(?=[/(])", "", value)
+    value = re.sub(r"[,;]", " ", value)
+    return re.sub(r"\s+", " ", value).lower()
+
+
+def _normalize_path(value: str) -> str:
+    if not value:
+        return value
+    normalized = posixpath.normpath(value)
+    return normalized + "/" if value.endswith("/") and normalized != "/" else normalized
+
+
+def _base64_decode(value: str) -> str:
+    try:
+        return base64.b64decode(value + "=" * (-len(value) % 4)).decode("latin-1")
+    except ValueError:
+        return value
+
+
+# ModSecurity transformations with a close enough Python equivalent; rules
+# using any other transformation (length, sha1, ...) are not screened
+TRANSFORMATIONS: Dict[str, Callable[[str], str]] = {
+    "lowercase": str.lower,
+    "urldecode": unquote_plus,
+    "urldecodeuni": _url_decode_uni,
+    "htmlentitydecode": html.unescape,
+    "jsdecode": _escape_decode,
+    "cssdecode": _css_decode,
+    "escapeseqdecode": _escape_decode,
+    "utf8tounicode": lambda value: value,
+    "removenulls": lambda value: value.replace("\0", ""),
+    "removewhitespace": lambda value: re.sub(r"\s+", "", value),
+    "compresswhitespace": lambda value: re.sub(r"\s+", " ", value),
+    "replacecomments": _replace_comments,
+    "removecommentschar": lambda value: re.sub(r"/\*|\*/|--|#", "", value),
+    "cmdline": _cmd_line,
+    "normalizepath": _normalize_path,
+    "normalisepath": _normalize_path,
+    "normalizepathwin": lambda value: _normalize_path(value.replace("\\", "/")),
+    "normalisepathwin": lambda value: _normalize_path(value.replace("\\", "/")),
+    "base64decode": _base64_decode,
+    "trim": str.strip,
+}
+
+
+class Rule(NamedTuple):
+    """Request rule of the ruleset that can be evaluated in-process."""
+
+    id: int
+    paranoia_level: int
+    score: int
+    variables: Tuple[Tuple[str, Optional[str]], ...]
+    transformations: Tuple[str, ...]
+    matcher: Callable[[str], bool]
+    tags: Tuple[str, ...] = ()
+    msg: str = ""
+    # Targets excluded from the variables, by the rule itself or by tuning
+    exclusions: Tuple[Tuple[str, Optional[str]], ...] = ()
+
+
+class Directive(NamedTuple):
+    name: str
+    args: List[str]
+
+
+def iter_directives(path: str) -> Iterator[Directive]:
+    """
+    iter_directives yields the directives of a ModSecurity configuration file, with continuation lines joined
+    """
+    with open(path, "r", errors="replace") as f:
+        pending = ""
+        for line in f:
+            line = line.rstrip("\n")
+            if not pending and line.lstrip().startswith("#"):
+                continue
+            if line.endswith("\\"):
+                pending += line[:-1]
+                continue
+            pending += line
+            tokens = _tokenize(pending.strip())
+            pending = ""
+            if tokens:
+                yield Directive(tokens[0], tokens[1:])
+
+
+def _tokenize(line: str) -> List[str]:
+    tokens: List[str] = []
+    i = 0
+    while i < len(line):
+        if line[i].isspace():
+            i += 1
+            continue
+        if line[i] == '"':
+            i += 1
+            token = []
+            while i < len(line) and line[i] != '"':
+                if line[i] == "\\" and i + 1 < len(line) and line[i + 1] == '"':
+                    i += 1
+                token.append(line[i])
+                i += 1
+            tokens.append("".join(token))
+            i += 1
+        else:
+            start = i
+            while i < len(line) and not line[i].isspace():
+                i += 1
+            tokens.append(line[start:i])
+    return tokens
+
+
+def parse_actions(actions: str) -> List[Tuple[str, str]]:
+    """
+    parse_actions splits a SecRule action list into (name, argument) pairs
+    """
+    parsed = []
+    for action in re.findall(r"(?:[^,']|'[^']*')+", actions):
+        name, _, argument = action.strip().partition(":")
+        parsed.append((name.strip().lower(), argument.strip().strip("'")))
+    return parsed
+
+
+def parse_variables(variables: str) -> Tuple[Tuple[str, Optional[str]], ...]:
+    """
+    parse_variables returns the payload-carrying targets of a SecRule, exclusions and counts are ignored
+    """
+    parsed = []
+    for variable in variables.split("|"):
+        if variable.startswith(("!", "&")):
+            continue
+        name, _, selector = variable.partition(":")
+        if name.upper() in PAYLOAD_VARIABLES:
+            parsed.append((name.upper(), selector or None))
+    return tuple(parsed)
+
+
+def parse_exclusions(variables: str) -> Tuple[Tuple[str, Optional[str]], ...]:
+    """
+    parse_exclusions returns the targets excluded by the !VAR[:selector] variables of a SecRule or target update
+    """
+    parsed = []
+    for variable in variables.split("|"):
+        if variable.startswith("!"):
+            name, _, selector = variable[1:].partition(":")
+            parsed.append((name.upper(), selector or None))
+    return tuple(parsed)
+
+
+def _selects(selector: Optional[str], key: str) -> bool:
+    if selector is None:
+        return True
+    if len(selector) > 1 and selector.startswith("/") and selector.endswith("/"):
+        try:
+            return re.search(selector[1:-1], key, flags=re.I) is not None
+        except re.error:
+            return True
+    return selector.lower() == key.lower()
+
+
+def _matches_text(pattern: str, text: str) -> bool:
+    # Tags and messages are matched as regular expressions by ModSecurity
+    try:
+        return re.search(pattern, text) is not None
+    except re.error:
+        return pattern == text
+
+
+def compile_operator(
+    operator: str, rules_dir: str, phrases: Optional[PhraseMatcher] = None
+) -> Optional[Callable[[str], bool]]:
+    """Compile a SecRule operator into a Python matcher.
+
+    Args:
+        operator: Operator of the rule, e.g. "@rx ..." or "!@pm ..."
+        rules_dir: Directory the @pmFromFile data files are relative to
+        phrases: Shared automaton of the data files; built for the rule's
+            own files when not given
+
+    Returns:
+        Callable reporting whether a value matches, or None when the
+        operator cannot be evaluated in-process
+    """
+    negated = operator.startswith("!")
+    if negated:
+        operator = operator[1:]
+    if not operator.startswith("@"):
+        operator = "@rx " + operator
+    name, _, argument = operator.partition(" ")
+    argument = argument.strip()
+    if "%{" in argument:
+        return None  # Macros are expanded at runtime by ModSecurity
+    name = name.lower()
+    if name == "@rx":
+        try:
+            # PCRE classes (\d, \w, \s, \b) and case folding are ASCII only
+            pattern = re.compile(translate_pcre(argument), re.S | re.A)
+        except re.error:
+            return None
+
+        def match(value: str) -> bool:
+            return pattern.search(value) is not None
+
+    elif name == "@pm":
+        inline = PhraseMatcher({"@pm": argument.split()})
+        match = inline.search
+    elif name == "@pmfromfile":
+        files = [os.path.basename(file) for file in argument.split()]
+        if phrases is None or not all(file in phrases.groups for file in files):
+            paths = [os.path.join(rules_dir, file) for file in files]
+            if not all(os.path.exists(path) for path in paths):
+                return None
+            phrases = load_matcher(paths)
+        matcher = phrases
+
+        def match(value: str) -> bool:
+            return any(matcher.search(value, file) for file in files)
+
+    elif name == "@contains":
+
+        def match(value: str) -> bool:
+            return argument in value
+
+    elif name == "@beginswith":
+
+        def match(value: str) -> bool:
+            return value.startswith(argument)
+
+    elif name == "@endswith":
+
+        def match(value: str) -> bool:
+            return value.endswith(argument)
+
+    elif name == "@streq":
+
+        def match(value: str) -> bool:
+            return value == argument
+
+    else:
+        return None
+    if negated:
+        return lambda value: not match(value)
+    return match
+
+
+def translate_pcre(pattern: str) -> str:
+    """
+    translate_pcre rewrites the PCRE constructs used by the CRS that Python's re spells differently
+    """
+    # PCRE \z is Python's \Z, PCRE \Z also allows a final newline
+    pattern = re.sub(
+        r"(?<!\\)((?:\\\\)*)\\([zZ])",
+        lambda m: m.group(1) + ("\\Z" if m.group(2) == "z" else "(?=\\n?\\Z)"),
+        pattern,
+    )
+    # Python only accepts global flags at the very start of the expression
+    match = re.match(r"\^(\(\?[a-z]+\))", pattern)
+    if match:
+        pattern = match.group(1) + "^" + pattern[match.end() :]
+    return pattern
+
+
+def parse_ids(arguments: List[str]) -> List[Tuple[int, int]]:
+    """
+    parse_ids returns the id ranges of a SecRuleRemoveById directive
+    """
+    ranges = []
+    for argument in arguments:
+        start, _, end = argument.partition("-")
+        if start.isdigit() and (not end or end.isdigit()):
+            ranges.append((int(start), int(end or start)))
+    return ranges
+
+
+# Ids of the generated rules, away from the CRS ones (shared with the Node CLI)
+RULE_ID_RANGE = (1_000_000_000_000, 9_999_999_999_999)
+
+
+def assign_rule_ids(rules: Iterable[str]) -> List[str]:
+    """
+    assign_rule_ids returns the generated rules with a random unique id each, dropping duplicates and rules without an id
+    """
+    assigned: List[str] = []
+    seen: Set[str] = set()
+    ids: Set[int] = set()
+    for rule in rules:
+        rule = rule.strip()
+        if re.search(r"\bid:\s*'?\d+", rule) is None:
+            continue
+        # Rules only differing by their id are the same rule
+        shape = re.sub(r"\bid:\s*'?\d+", "id:", rule)
+        if shape in seen:
+            continue
+        seen.add(shape)
+        rule_id = random.randint(*RULE_ID_RANGE)
+        while rule_id in ids:
+            rule_id = random.randint(*RULE_ID_RANGE)
+        ids.add(rule_id)
+        assigned.append(re.sub(r"\bid:\s*('?)\d+", f"id:\\g<1>{rule_id}", rule, count=1))
+    return assigned
+
+
+def _scores_inbound(actions: List[Tuple[str, str]]) -> bool:
+    return any(
+        action == "setvar" and argument.lower().startswith("tx.inbound_anomaly_score")
+        for action, argument in actions
+    )
+
+
+def read_compose_setting(setup_dir: str, name: str, default: int) -> int:
+    """
+    read_compose_setting returns a numeric CRS setting of the docker compose environment
+    """
+    path = os.path.join(setup_dir, "docker-compose.yml")
+    if not os.path.exists(path):
+        return default
+    with open(path, "r") as f:
+        match = re.search(
+            rf"^\s*-?\s*{name}\s*[:=]\s*[\"']?(\d+)", f.read(), flags=re.M
+        )
+    return int(match.group(1)) if match else default
+
+
+class RuleExclusions:
+    """Rule exclusions of the ruleset and its tuning files.
+
+    `SecRuleRemoveById/ByTag/ByMsg` and `SecRuleUpdateTargetById/ByTag/ByMsg`
+    directives are collected, as are the `ctl:ruleRemove*` and
+    `ctl:ruleRemoveTargetBy*` actions of `SecAction`s and of the rules of the
+    tuning files. The rule actions only apply to the requests their rule
+    matches, they are applied unconditionally here: removing a rule or a
+    target can only lower the score, so the screened verdicts stay certain.
+    The conditional exceptions shipped with the CRS itself (localhost,
+    sampling, click identifiers) never apply to the payload requests and
+    are not followed. Target updates replacing a target cannot be followed,
+    the rules they update are left to the WAF.
+    """
+
+    def __init__(self):
+        # (by, what) with by one of id (what the id ranges), tag or msg
+        self.removals: List[Tuple[str, Any]] = []
+        # (by, what, targets, replaced target)
+        self.updates: List[Tuple[str, Any, str, Optional[str]]] = []
+
+    def add(self, directive: Directive) -> bool:
+        """
+        add records an exclusion directive, returning whether the directive was one
+        """
+        name, args = directive.name, directive.args
+        if name == "SecRuleRemoveById":
+            self.removals.append(("id", parse_ids(args)))
+        elif name in ("SecRuleRemoveByTag", "SecRuleRemoveByMsg"):
+            if args:
+                self.removals.append((name[len("SecRuleRemoveBy") :].lower(), args[0]))
+        elif name == "SecRuleUpdateTargetById":
+            count = 0
+            while count < len(args) and parse_ids([args[count]]):
+                count += 1
+            ids, rest = args[:count], args[count:]
+            if ids and rest:
+                self.updates.append(
+                    ("id", parse_ids(ids), rest[0], rest[1] if len(rest) > 1 else None)
+                )
+        elif name in ("SecRuleUpdateTargetByTag", "SecRuleUpdateTargetByMsg"):
+            if len(args) >= 2:
+                self.updates.append(
+                    (
+                        name[len("SecRuleUpdateTargetBy") :].lower(),
+                        args[0],
+                        args[1],
+                        args[2] if len(args) > 2 else None,
+                    )
+                )
+        elif name == "SecAction":
+            if args:
+                self.add_actions(parse_actions(args[0]))
+        else:
+            return False
+        return True
+
+    def add_actions(self, actions: List[Tuple[str, str]]):
+        """
+        add_actions records the ctl:ruleRemove* actions of a rule
+        """
+        for action, argument in actions:
+            if action != "ctl":
+                continue
+            option, _, value = argument.partition("=")
+            option = option.strip().lower()
+            if option == "ruleremovebyid":
+                self.removals.append(("id", parse_ids(value.split())))
+            elif option in ("ruleremovebytag", "ruleremovebymsg"):
+                self.removals.append((option[len("ruleremoveby") :], value))
+            elif option.startswith("ruleremovetargetby"):
+                what, _, target = value.partition(";")
+                by = option[len("ruleremovetargetby") :]
+                if by == "id":
+                    what = parse_ids([what])
+                # ctl removes the target, as a negated target update does
+                self.updates.append((by, what, f"!{target}", None))
+
+    @staticmethod
+    def _targets(rule: "Rule", by: str, what: Any) -> bool:
+        if by == "id":
+            return any(start <= rule.id <= end for start, end in what)
+        if by == "tag":
+            return any(_matches_text(what, tag) for tag in rule.tags)
+        return _matches_text(what, rule.msg)
+
+    def apply(self, rules: List["Rule"]) -> Tuple[List["Rule"], int]:
+        """
+        apply returns the rules left once excluded, and how many rules are left to the WAF instead
+        """
+        kept: List[Rule] = []
+        unscreenable = 0
+        for rule in rules:
+            if any(self._targets(rule, by, what) for by, what in self.removals):
+                continue
+            for by, what, targets, replaced in self.updates:
+                if not self._targets(rule, by, what):
+                    continue
+                if replaced is not None:
+                    logger.warning(
+                        f"Rule {rule.id} has its target {replaced} replaced, leaving it to the WAF"
+                    )
+                    unscreenable += 1
+                    rule = None
+                    break
+                rule = rule._replace(
+                    variables=rule.variables + parse_variables(targets),
+                    exclusions=rule.exclusions + parse_exclusions(targets),
+                )
+            if rule is not None:
+                kept.append(rule)
+        return kept, unscreenable
+
+
+class RuleSet:
+    """In-process approximation of the CRS ruleset of the testing environment.
+
+    The `@rx`, `@pm` and `@pmFromFile` request rules that add to the inbound
+    anomaly score are compiled into Python matchers, minus the rules and
+    targets excluded by the tuning files (see RuleExclusions). A payload
+    scoring at or above the inbound threshold is certainly blocked, since
+    any rule that is not screened here (libinjection operators, chained
+    rules, macros, ...) can only add to the score. Below the threshold the
+    verdict is unknown.
+    """
+
+    def __init__(
+        self,
+        rules: List[Rule],
+        blocking_paranoia: int = 1,
+        inbound_threshold: int = 5,
+        skipped: int = 0,
+    ):
+        self.rules = [r for r in rules if r.paranoia_level <= blocking_paranoia]
+        self.blocking_paranoia = blocking_paranoia
+        self.inbound_threshold = inbound_threshold
+        self.skipped = skipped
+
+    @classmethod
+    def load(cls, setup_dir: str, cache_dir: Optional[str] = None) -> "RuleSet":
+        """Parse the rules of a testing environment setup directory.
+
+        Args:
+            setup_dir: Directory holding the docker compose file, the rules
+                and the rule tuning files
+            cache_dir: Directory caching the automaton of the data files
+
+        Returns:
+            RuleSet scoring payloads at the paranoia level and inbound
+            anomaly threshold configured in the compose file
+        """
+        rules_dir = os.path.join(setup_dir, "rules")
+        # Every data file shares one automaton, loaded once for all the rules
+        data_files = [
+            path for path in list_files(rules_dir) if path.endswith(".data")
+        ] if os.path.exists(rules_dir) else []
+        phrases = load_matcher(data_files, cache_dir) if data_files else None
+        rules: List[Rule] = []
+        exclusions = RuleExclusions()
+        skipped = 0
+        for name in ("rules", "rules-tuning"):
+            path = os.path.join(setup_dir, name)
+            if not os.path.exists(path):
+                continue
+            for file_path in list_files(path):
+                if not file_path.endswith(".conf"):
+                    continue
+                in_chain = False
+                for directive in iter_directives(file_path):
+                    if exclusions.add(directive):
+                        continue
+                    if directive.name != "SecRule" or len(directive.args) < 2:
+                        continue
+                    actions = parse_actions(directive.args[2]) if len(directive.args) > 2 else []
+                    if name == "rules-tuning":
+                        exclusions.add_actions(actions)
+                    chained = any(action == "chain" for action, _ in actions)
+                    # Chained rules depend on the captures of the previous
+                    # link, they are left to the WAF
+                    if in_chain:
+                        in_chain = chained
+                        continue
+                    in_chain = chained
+                    if chained:
+                        skipped += 1
+                        continue
+                    rule = cls._compile(directive, actions, rules_dir, phrases)
+                    if rule is None:
+                        if _scores_inbound(actions):
+                            skipped += 1
+                        continue
+                    rules.append(rule)
+        rules, unscreenable = exclusions.apply(rules)
+        skipped += unscreenable
+        blocking_paranoia = read_compose_setting(
+            setup_dir,
+            "BLOCKING_PARANOIA",
+            read_compose_setting(setup_dir, "PARANOIA", 1),
+        )
+        inbound_threshold = read_compose_setting(setup_dir, "ANOMALY_INBOUND", 5)
+        ruleset = cls(rules, blocking_paranoia, inbound_threshold, skipped)
+        logger.info(
+            f"Loaded {len(ruleset.rules)} rule(s) at paranoia level {blocking_paranoia}, "
+            f"{skipped} rule(s) left to the WAF"
+        )
+        return ruleset
+
+    @staticmethod
+    def _compile(
+        directive: Directive,
+        actions: List[Tuple[str, str]],
+        rules_dir: str,
+        phrases: Optional[PhraseMatcher] = None,
+    ) -> Optional[Rule]:
+        variables = parse_variables(directive.args[0])
+        if not variables:
+            return None
+        rule_id = 0
+        paranoia_level = 0
+        score = 0
+        transformations: List[str] = []
+        tags: List[str] = []
+        msg = ""
+        for action, argument in actions:
+            if action == "id" and argument.isdigit():
+                rule_id = int(argument)
+            elif action == "tag":
+                tags.append(argument)
+            elif action == "msg":
+                msg = argument
+            elif action == "t":
+                if argument.lower() == "none":
+                    transformations.clear()
+                elif argument.lower() not in TRANSFORMATIONS:
+                    return None
+                else:
+                    transformations.append(argument.lower())
+            elif action == "setvar":
+                match = re.match(
+                    r"tx\.inbound_anomaly_score_pl(\d)=\+%\{tx\.(\w+)_anomaly_score\}",
+                    argument,
+                    flags=re.I,
+                )
+                if match:
+                    paranoia_level = int(match.group(1))
+                    score = SEVERITY_SCORES.get(match.group(2).lower(), 0)
+        if not score:
+            return None
+        matcher = compile_operator(directive.args[1], rules_dir, phrases)
+        if matcher is None:
+            return None
+        return Rule(
+            rule_id,
+            paranoia_level,
+            score,
+            variables,
+            tuple(transformations),
+            matcher,
+            tuple(tags),
+            msg,
+            parse_exclusions(directive.args[0]),
+        )
+
+    def score(
+        self,
+        payload: str,
+        location: Location = Location.URL_PARAMETERS,
+        encoding: Encoding = Encoding.FORM_URLENCODED,
+        method: str = "GET",
+    ) -> Tuple[int, List[int]]:
+        """Score a payload against the screened rules.
+
+        Args:
+            payload: Payload string
+            location: Where the payload is placed in the request
+            encoding: Body encoding when the payload is sent in the body
+            method: HTTP method of the request
+
+        Returns:
+            Tuple of (inbound anomaly score, ids of the matching rules)
+        """
+        targets = request_targets(payload, location, encoding, method)
+        total = 0
+        matched: List[int] = []
+        transformed: Dict[Tuple[str, Tuple[str, ...]], str] = {}
+        for rule in self.rules:
+            for value in _rule_values(rule, targets):
+                key = (value, rule.transformations)
+                if key not in transformed:
+                    result = value
+                    for name in rule.transformations:
+                        result = TRANSFORMATIONS[name](result)
+                    transformed[key] = result
+                if rule.matcher(transformed[key]):
+                    total += rule.score
+                    matched.append(rule.id)
+                    break
+        return total, matched
+
+    def verdict(
+        self,
+        payload: str,
+        location: Location = Location.URL_PARAMETERS,
+        encoding: Encoding = Encoding.FORM_URLENCODED,
+        method: str = "GET",
+    ) -> Optional[int]:
+        """
+        verdict returns 403 when the payload is certainly blocked, None when only the WAF can tell
+        """
+        total, _ = self.score(payload, location, encoding, method)
+        return 403 if total >= self.inbound_threshold else None
+
+
+def request_targets(
+    payload: str,
+    location: Location,
+    encoding: Encoding = Encoding.FORM_URLENCODED,
+    method: str = "GET",
+) -> Dict[str, List[Tuple[str, str]]]:
+    """
+    request_targets returns the (name, value) pairs of every ModSecurity collection the payload ends up in
+    """
+    targets: Dict[str, List[Tuple[str, str]]] = {}
+    query = ""
+    if location == Location.URL_PARAMETERS:
+        query = f"{PAYLOAD_PARAMETER}={quote_plus(payload)}"
+        pairs = [(PAYLOAD_PARAMETER, payload)]
+        targets["ARGS"] = targets["ARGS_GET"] = pairs
+        targets["ARGS_NAMES"] = targets["ARGS_GET_NAMES"] = [(n, n) for n, _ in pairs]
+        targets["QUERY_STRING"] = [("", query)]
+    elif location == Location.HTTP_HEADER:
+        targets["REQUEST_HEADERS"] = [(PAYLOAD_HEADER, payload)]
+    elif location == Location.HTTP_BODY:
+        if encoding == Encoding.FORM_URLENCODED:
+            pairs = parse_qsl(payload, keep_blank_values=True)
+            body = payload
+        elif encoding == Encoding.JSON:
+            pairs = [(f"json.{PAYLOAD_PARAMETER}", payload)]
+            body = json.dumps({PAYLOAD_PARAMETER: payload})
+        else:
+            pairs = []
+            targets["XML"] = [("/*", payload)]
+            body = f"<{PAYLOAD_PARAMETER}>{payload}</{PAYLOAD_PARAMETER}>"
+        targets["ARGS"] = targets["ARGS_POST"] = pairs
+        targets["ARGS_NAMES"] = targets["ARGS_POST_NAMES"] = [(n, n) for n, _ in pairs]
+        targets["REQUEST_BODY"] = [("", body)]
+    uri = f"/?{query}" if query else "/"
+    targets["REQUEST_URI"] = targets["REQUEST_URI_RAW"] = [("", uri)]
+    targets["REQUEST_LINE"] = [("", f"{method} {uri} HTTP/1.1")]
+    return targets
+
+
+def _rule_values(
+    rule: Rule, targets: Dict[str, List[Tuple[str, str]]]
+) -> Iterator[str]:
+    for name, selector in rule.variables:
+        for key, value in targets.get(name, ()):
+            if _selects(selector, key) and not any(
+                excluded == name and _selects(excluded_selector, key)
+                for excluded, excluded_selector in rule.exclusions
+            ):
+                yield value
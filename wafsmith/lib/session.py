@@ -0,0 +1,223 @@
+import time
+import threading
+import logging
+import contextvars
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+from pydantic import BaseModel
+
+logger = logging.getLogger("session")
+
+
+class RequestTiming:
+    """Connect time and time to first byte of one request, in seconds.
+
+    Both are measured from `start`; connect stays 0 when a keep-alive
+    connection was reused.
+    """
+
+    __slots__ = ("start", "connect", "ttfb")
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.connect = 0.0
+        self.ttfb = 0.0
+
+
+# Timing of the request being sent by the current thread / asyncio task
+_timing: contextvars.ContextVar[Optional[RequestTiming]] = contextvars.ContextVar(
+    "timing", default=None
+)
+
+
+@contextmanager
+def track(timing: RequestTiming) -> Iterator[RequestTiming]:
+    """
+    track records the connect time and time to first byte of the requests sent in the block into timing
+    """
+    token = _timing.set(timing)
+    try:
+        yield timing
+    finally:
+        _timing.reset(token)
+
+
+class ConnectionStats(BaseModel):
+    requests: int = 0
+    connections: int = 0
+
+    @property
+    def reused(self) -> int:
+        return max(self.requests - self.connections, 0)
+
+    @property
+    def reuse_ratio(self) -> float:
+        return (self.reused / self.requests * 100) if self.requests > 0 else 0
+
+    def __str__(self) -> str:
+        return (
+            f"{self.requests} request(s) over {self.connections} connection(s) "
+            f"({self.reuse_ratio:.2f}% reused)"
+        )
+
+
+class _TimingConnectionMixin:
+    pool = None
+
+    def connect(self):
+        start = time.perf_counter()
+        super().connect()
+        timing = _timing.get()
+        if timing is not None:
+            timing.connect += time.perf_counter() - start
+        if self.pool is not None:
+            self.pool.count_connect()
+
+    def getresponse(self, *args, **kwargs):
+        response = super().getresponse(*args, **kwargs)
+        timing = _timing.get()
+        if timing is not None:
+            timing.ttfb = time.perf_counter() - timing.start
+        return response
+
+
+class _CountingHTTPConnection(_TimingConnectionMixin, HTTPConnection):
+    pass
+
+
+class _CountingHTTPSConnection(_TimingConnectionMixin, HTTPSConnection):
+    pass
+
+
+class _CountingPoolMixin:
+    """
+    Counts socket connects, including reconnects of dropped keep-alive sockets
+    which urllib3's own num_connections misses
+    """
+
+    def _new_conn(self):
+        conn = super()._new_conn()
+        conn.pool = self
+        return conn
+
+    def count_connect(self):
+        with self._connects_lock:
+            self.num_connects += 1
+
+
+class _CountingHTTPConnectionPool(_CountingPoolMixin, HTTPConnectionPool):
+    ConnectionCls = _CountingHTTPConnection
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.num_connects = 0
+        self._connects_lock = threading.Lock()
+
+
+class _CountingHTTPSConnectionPool(_CountingPoolMixin, HTTPSConnectionPool):
+    ConnectionCls = _CountingHTTPSConnection
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.num_connects = 0
+        self._connects_lock = threading.Lock()
+
+
+class _CountingHTTPAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _CountingHTTPConnectionPool,
+            "https": _CountingHTTPSConnectionPool,
+        }
+
+
+class SessionPool:
+    """Keep-alive connection pool shared by the sending engines.
+
+    The thread engine shares one requests.Session whose adapter holds up to
+    `pool_size` warm sockets per host; the async engine gets an httpx client
+    with the same limits for the duration of each event loop.
+    """
+
+    def __init__(
+        self,
+        pool_size: int = 10,
+        timeout: Optional[float] = None,
+        keep_alive: bool = True,
+    ):
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.keep_alive = keep_alive
+        self._lock = threading.Lock()
+        self._session: Optional[requests.Session] = None
+        self._async_stats = ConnectionStats()
+
+    def session(self) -> requests.Session:
+        with self._lock:
+            if self._session is None:
+                session = requests.Session()
+                adapter = _CountingHTTPAdapter(
+                    pool_connections=self.pool_size,
+                    pool_maxsize=self.pool_size,
+                    pool_block=True,
+                )
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                if not self.keep_alive:
+                    session.headers["Connection"] = "close"
+                self._session = session
+            return self._session
+
+    def async_client(self) -> httpx.AsyncClient:
+        limits = httpx.Limits(
+            max_connections=self.pool_size,
+            max_keepalive_connections=self.pool_size if self.keep_alive else 0,
+        )
+        headers = {} if self.keep_alive else {"Connection": "close"}
+        return httpx.AsyncClient(limits=limits, timeout=self.timeout, headers=headers)
+
+    def request_extensions(self) -> Dict[str, Any]:
+        """
+        request_extensions returns the httpx extensions that count the async requests and new connections, and time them
+        """
+        return {"trace": self._trace}
+
+    async def _trace(self, event: str, info: Dict[str, Any]):
+        timing = _timing.get()
+        if event == "connection.connect_tcp.started":
+            if timing is not None:
+                timing.connect -= time.perf_counter()
+        elif event == "connection.connect_tcp.complete":
+            self._async_stats.connections += 1
+            if timing is not None:
+                timing.connect += time.perf_counter()
+        elif event == "http11.send_request_headers.started":
+            self._async_stats.requests += 1
+        elif event == "http11.receive_response_headers.complete":
+            if timing is not None:
+                timing.ttfb = time.perf_counter() - timing.start
+
+    def stats(self) -> ConnectionStats:
+        stats = self._async_stats.model_copy()
+        with self._lock:
+            if self._session is None:
+                return stats
+            for adapter in set(self._session.adapters.values()):
+                pools = adapter.poolmanager.pools
+                for key in pools.keys():
+                    pool = pools[key]
+                    stats.requests += pool.num_requests
+                    stats.connections += pool.num_connects
+        return stats
+
+    def close(self):
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
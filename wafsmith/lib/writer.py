@@ -0,0 +1,193 @@
+import os
+import json
+import time
+import queue
+import hashlib
+import logging
+import threading
+from contextlib import ExitStack
+from typing import IO, Dict, List, Optional, Tuple
+from wafsmith.lib.results import ERRORED, Outcome
+
+logger = logging.getLogger("writer")
+
+ATTACK = "attack payload"
+TRAFFIC = "business traffic"
+
+
+def payload_key(kind: str, payload: str, cell: Optional[str] = None) -> str:
+    """
+    payload_key returns the stable hash identifying a payload of a given kind (and matrix cell) in the index
+    """
+    if cell is not None:
+        kind = f"{kind}\n{cell}"
+    return hashlib.sha1(f"{kind}\n{payload}".encode("utf-8")).hexdigest()
+
+
+def cell_path(path: str, cell: str) -> str:
+    """
+    cell_path returns the per-cell variant of an output path, e.g. evaded.POST-http_body-json.txt
+    """
+    stem, ext = os.path.splitext(path)
+    return f"{stem}.{cell.replace(':', '-')}{ext}"
+
+
+def load_index(index_path: str) -> Dict[str, int]:
+    """
+    load_index returns the payload keys and status codes recorded by a previous run
+    """
+    completed: Dict[str, int] = {}
+    if not os.path.exists(index_path):
+        return completed
+    with open(index_path, "r") as f:
+        for line in f:
+            key, _, status_code = line.rstrip("\n").partition("\t")
+            # A torn last line from an interrupted run is simply retested
+            if len(key) == 40 and status_code.isdigit():
+                completed[key] = int(status_code)
+    return completed
+
+
+class ResultWriter:
+    """Streams outcomes to disk from a background thread as they complete.
+
+    Evaded attack payloads are appended to `evaded_path` (one file per cell
+    in a matrix run, see `cell_path`), every outcome can
+    optionally be recorded as a JSONL line in `results_path`, and the index at
+    `index_path` receives a `<key>\\t<status>` line per completed payload so
+    that an interrupted run can tell what it already tested. Writes are
+    buffered and flushed every `flush_every` outcomes or `flush_interval`
+    seconds, whichever comes first.
+    """
+
+    def __init__(
+        self,
+        evaded_path: Optional[str] = None,
+        results_path: Optional[str] = None,
+        index_path: Optional[str] = None,
+        resume: bool = False,
+        evaded_code: int = 200,
+        flush_every: int = 1000,
+        flush_interval: float = 1.0,
+    ):
+        self.evaded_path = evaded_path
+        self.results_path = results_path
+        self.index_path = index_path
+        self.mode = "a" if resume else "w"
+        self.evaded_code = evaded_code
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self.evaded_count = 0
+        self._queue: "queue.Queue[Optional[Tuple[str, Outcome, Optional[str]]]]" = queue.Queue(
+            maxsize=flush_every * 10
+        )
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._error: Optional[BaseException] = None
+        self._evaded_files: Dict[Optional[str], IO[str]] = {}
+        self._results_file: Optional[IO[str]] = None
+        self._index_file: Optional[IO[str]] = None
+        self._index_lines: List[str] = []
+        self._files = ExitStack()
+
+    def __enter__(self) -> "ResultWriter":
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def start(self):
+        self._thread.start()
+
+    def write(self, outcome: Outcome, kind: str = ATTACK, cell: Optional[str] = None):
+        if self._error is not None:
+            raise self._error
+        self._queue.put((kind, outcome, cell))
+
+    def close(self):
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        if self._error is not None:
+            raise self._error
+
+    def _run(self):
+        pending = 0
+        last_flush = time.monotonic()
+        stopping = False
+        try:
+            if self.results_path:
+                self._results_file = self._open(self.results_path)
+            if self.index_path:
+                self._index_file = self._open(self.index_path)
+            while True:
+                try:
+                    item = self._queue.get(timeout=self.flush_interval)
+                except queue.Empty:
+                    item = False
+                if item is None:
+                    stopping = True
+                    self._flush()
+                    break
+                if item:
+                    self._write(*item)
+                    pending += 1
+                if pending and (
+                    pending >= self.flush_every
+                    or time.monotonic() - last_flush >= self.flush_interval
+                ):
+                    self._flush()
+                    pending = 0
+                    last_flush = time.monotonic()
+        except BaseException as e:
+            logger.error(f"Failed to write results: {e}")
+            self._error = e
+            # Keep draining so producers never block on a dead writer
+            while not stopping and self._queue.get() is not None:
+                pass
+        finally:
+            self._files.close()
+
+    def _open(self, path: str) -> IO[str]:
+        return self._files.enter_context(open(path, self.mode))
+
+    def _write(self, kind: str, outcome: Outcome, cell: Optional[str]):
+        if kind == ATTACK and outcome.status_code == self.evaded_code:
+            # Opened lazily so that no evaded file is created when nothing evades
+            evaded_file = self._evaded_files.get(cell)
+            if evaded_file is None and self.evaded_path:
+                path = self.evaded_path if cell is None else cell_path(self.evaded_path, cell)
+                evaded_file = self._evaded_files[cell] = self._open(path)
+            if evaded_file is not None:
+                evaded_file.write(f"{outcome.payload}\n")
+            self.evaded_count += 1
+        if self._results_file is not None:
+            record = {
+                "kind": kind,
+                "index": outcome.index,
+                "payload": outcome.payload,
+                "status": outcome.status_code,
+                "latency": round(outcome.elapsed, 6),
+                "connect": round(outcome.connect, 6),
+                "ttfb": round(outcome.ttfb, 6),
+                "cached": outcome.cached,
+            }
+            if cell is not None:
+                record["cell"] = cell
+            self._results_file.write(json.dumps(record) + "\n")
+        # Errored payloads are left out of the index so that a resumed run retries them
+        if self._index_file is not None and outcome.status_code != ERRORED:
+            key = payload_key(kind, outcome.payload, cell)
+            self._index_lines.append(f"{key}\t{outcome.status_code}\n")
+
+    def _flush(self):
+        for f in (*self._evaded_files.values(), self._results_file):
+            if f is not None:
+                f.flush()
+        # The index only ever lists payloads whose output already reached the
+        # files above, so a resumed run never skips an unwritten result
+        if self._index_file is not None and self._index_lines:
+            self._index_file.writelines(self._index_lines)
+            self._index_file.flush()
+            os.fsync(self._index_file.fileno())
+            self._index_lines.clear()